@@ -1,5 +1,15 @@
 # A game of pipes :)
 
+import collections
+import csv
+import functools
+import sys
+import time
+import weakref
+import zlib
+
+import instrumentation
+
 EMPTY_TILE = "tile"
 START_PIPE = "start"
 END_PIPE = "end"
@@ -20,60 +30,875 @@ PIPES = {
     "OU": "over-under"
 }
 
+# The cell text of each playable pipe, the reverse of PIPES.
+PIPE_CODES = {name: code for code, name in PIPES.items()}
+
+# Kinds of events published to the subscribers of a PipeGame.
+TILE_PLACED = "tile_placed"
+TILE_REMOVED = "tile_removed"
+TILE_ROTATED = "tile_rotated"
+PLAYABLE_CHANGED = "playable_changed"
+SELECTABLE_CHANGED = "selectable_changed"
+WIN_CHANGED = "win_changed"
+
+# What a game with several start or end pipes needs to be won: water in every end pipe,
+# or water from every start pipe reaching an end pipe.
+WIN_ALL_ENDS = "all_ends"
+WIN_ALL_STARTS = "all_starts"
+WIN_CONDITIONS = (WIN_ALL_ENDS, WIN_ALL_STARTS)
+
+# Sides of a tile in clockwise order. A side's index is used for rotation arithmetic.
+DIRECTIONS = "NESW"
+
+# The (row, col) change in position when moving in each direction.
+DIRECTION_DELTAS = {'N': (-1, 0), 'E': (0, 1), 'S': (1, 0), 'W': (0, -1)}
+OPPOSITE_DIRECTIONS = {'N': 'S', 'E': 'W', 'S': 'N', 'W': 'E'}
+
+# Sides that connect to each other for every pipe type. Only valid at an orientation of 0.
+PIPE_CONNECTIONS = {
+    "straight": {'N': ['S'], 'S': ['N']},
+    "corner": {'N': ['E'], 'E': ['N']},
+
+    "cross" : {'N': ['S', 'E', 'W'], 'E': ['N', 'S', 'W'],
+                'S': ['N', 'E', 'W'], "W": ['N', 'S', 'E']},
+
+    "junction-t": {'S': ['E', 'W'], 'E': ['S', 'W'], 'W': ['S', 'E']},
+    "diagonals": {'N': ['E'], 'E': ['W'], 'S': ['W'], 'W': ['S']},
+    "over-under": {'N': ['S'], 'E': ['W'], 'S': ['N'], 'W': ['E']}
+}
+
+
+def _rotate_side(side, orientation):
+    """ Returns the side that the given orientation 0 side ends up on at the given orientation."""
+    return DIRECTIONS[(DIRECTIONS.index(side) + orientation) % 4]
+
+
+def _build_connection_tables():
+    """ Precomputes the connections of every pipe type at every orientation.
+
+            Returns:
+                tuple<dict, dict>: CONNECTION_TABLE[name][orientation][side] is a tuple of the
+                sides connected to side. CONNECTION_MASKS[name][orientation][side_index] is the
+                same information as a 4-bit mask (bit i set means DIRECTIONS[i] is connected).
+    """
+    table = {}
+    masks = {}
+    for name, connections in PIPE_CONNECTIONS.items():
+        table[name] = []
+        masks[name] = []
+        for orientation in range(4):
+            sides = {}
+            side_masks = [0, 0, 0, 0]
+            for side, connected in connections.items():
+                rotated = tuple(_rotate_side(other, orientation) for other in connected)
+                rotated_side = _rotate_side(side, orientation)
+                sides[rotated_side] = rotated
+                for other in rotated:
+                    side_masks[DIRECTIONS.index(rotated_side)] |= 1 << DIRECTIONS.index(other)
+            table[name].append(sides)
+            masks[name].append(tuple(side_masks))
+    return table, masks
+
+
+CONNECTION_TABLE, CONNECTION_MASKS = _build_connection_tables()
+
+# The side each special pipe faces, indexed by orientation.
+START_CONNECTIONS = tuple((side,) for side in "NESW")
+END_CONNECTIONS = tuple((side,) for side in "SWNE")
+
+
+def _build_tile_codes():
+    """ Precomputes the (name, orientation, selectable) spec of every valid cell of a game file.
+
+            Returns:
+                dict<str, tuple<str, int, bool>>: Tile specs keyed by cell text such as "#", "S1"
+                or "JT2". A missing orientation digit means an orientation of 0.
+    """
+    tile_codes = {}
+    for tile_code, name in [('#', EMPTY_TILE)] + list(SPECIAL_TILES.items()) + list(PIPES.items()):
+        for orientation in range(4):
+            if name in (EMPTY_TILE, LOCKED_TILE):
+                tile_spec = (name, 0, name == EMPTY_TILE)
+            else:
+                tile_spec = (name, orientation, False)
+            tile_codes[f"{tile_code}{orientation}"] = tile_spec
+        tile_codes[tile_code] = tile_codes[f"{tile_code}0"]
+    return tile_codes
+
+
+TILE_CODES = _build_tile_codes()
+
+
+def _create_tile(name, orientation, selectable):
+    """ Creates the most specialised tile instance for a tile spec.
+
+            Parameters:
+                name (str): The name of the tile (e.g. "tile", "start" or "corner").
+                orientation (int): The orientation of the tile, ignored for plain tiles.
+                selectable (bool): Whether the tile can be selected by the user.
+
+            Returns:
+                (Tile | Pipe) obj: The new tile, or the shared tile for empty and locked tiles.
+    """
+    if name in (START_PIPE, END_PIPE):
+        special_pipe = StartPipe(orientation) if name == START_PIPE else EndPipe(orientation)
+        # Special pipes are made unselectable, but one may have been made selectable since.
+        special_pipe._selectable = selectable
+        return special_pipe
+    elif name in (EMPTY_TILE, LOCKED_TILE):
+        shared_tile = _SHARED_TILES.get((name, selectable))
+        return shared_tile if shared_tile is not None else Tile(name, selectable)
+    return Pipe(name, orientation, selectable)
+
+
+# Tile names in the order of their type code in a PackedPipeGame cell.
+PACKED_TILE_TYPES = (EMPTY_TILE, LOCKED_TILE, START_PIPE, END_PIPE) + tuple(PIPES.values())
+_PACKED_TYPE_CODES = {name: code for code, name in enumerate(PACKED_TILE_TYPES)}
+
+# A packed cell is the type code in the low 4 bits, the orientation in the next 2 bits
+# and the selectable flag above that.
+PACKED_TYPE_MASK = 0x0F
+PACKED_ORIENTATION_SHIFT = 4
+PACKED_SELECTABLE = 0x40
+
+
+def _pack_tile_spec(name, orientation, selectable):
+    """ (int) Packs a (name, orientation, selectable) tile spec into one byte."""
+    cell = _PACKED_TYPE_CODES[name] | (orientation << PACKED_ORIENTATION_SHIFT)
+    return cell | PACKED_SELECTABLE if selectable else cell
+
+
+def _unpack_tile_spec(cell):
+    """ (tuple<str, int, bool>) Unpacks one byte into a (name, orientation, selectable) tile spec."""
+    return (PACKED_TILE_TYPES[cell & PACKED_TYPE_MASK],
+            (cell >> PACKED_ORIENTATION_SHIFT) & 3,
+            bool(cell & PACKED_SELECTABLE))
+
+
+def _tile_spec(tile):
+    """ (tuple<str, int, bool>) The (name, orientation, selectable) tile spec of a tile instance."""
+    orientation = tile.get_orientation() if tile.get_id() != "tile" else 0
+    return (tile.get_name(), orientation, tile.can_select())
+
+
+def _pack_tile(tile):
+    """ (int) Packs a tile instance into one byte."""
+    if tile.get_name() not in _PACKED_TYPE_CODES:
+        raise ValueError(f"{tile} can't be stored on a packed board")
+    return _pack_tile_spec(*_tile_spec(tile))
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value):
+    """ (int) Scrambles a number into 64 well mixed bits (the splitmix64 finaliser)."""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def _name_code(name):
+    """ (int) A number for a tile name that is the same in every process."""
+    code = _PACKED_TYPE_CODES.get(name)
+    return code if code is not None else 16 + zlib.crc32(name.encode())
+
+
+# Zobrist keys are worked out from what they stand for rather than stored in tables, so
+# boards of any size cost nothing up front, and the keys moves use again are cached. The
+# low two bits of the first mix keep tile, playable pipe, board size and solver keys apart.
+@functools.lru_cache(maxsize=1 << 16)
+def _zobrist_tile_key(index, name, orientation, selectable):
+    """ (int) The Zobrist key of a tile at a flat index. Empty selectable tiles are 0."""
+    if name == EMPTY_TILE and selectable:
+        return 0
+    return _mix64(_mix64(index * 4) ^ (_name_code(name) << 3 | orientation << 1 | bool(selectable)))
+
+
+@functools.lru_cache(maxsize=1 << 12)
+def _zobrist_count_key(pipe_name, count):
+    """ (int) The Zobrist key of having count of a playable pipe. Having none is 0."""
+    if count == 0:
+        return 0
+    return _mix64(_mix64(_name_code(pipe_name) * 4 + 1) ^ (count & _MASK64))
+
+
+def _zobrist_size_key(rows, cols):
+    """ (int) The Zobrist key of the size of the board."""
+    return _mix64(_mix64(rows * 4 + 2) ^ cols)
+
+
+def _zobrist_claim_key(index, pairs):
+    """ (int) The Zobrist key of the sides Solver has water go through an empty tile by.
+        Having none is 0.
+    """
+    if pairs == 0:
+        return 0
+    return _mix64(_mix64(index * 4 + 3) ^ pairs)
+
+
+# For each pipe type, one orientation for every different way the pipe can connect.
+_DISTINCT_ORIENTATIONS = {
+    name: [orientation for orientation in range(4)
+           if CONNECTION_MASKS[name][orientation] not in CONNECTION_MASKS[name][:orientation]]
+    for name in CONNECTION_MASKS
+}
+
+# The sides water can leave each pipe through in any of its orientations, by entry side.
+_ROTATED_EXITS = {
+    name: [sum(1 << exit_side for exit_side in range(4)
+               if any(masks[side] & (1 << exit_side) for masks in CONNECTION_MASKS[name]))
+           for side in range(4)]
+    for name in CONNECTION_MASKS
+}
+
+
+def _exit_mask(name, orientation, side):
+    """ (int) The 4-bit mask of sides water leaves a pipe through when it enters through side.
+
+            side is a side index, or 4 for the start of the flow.
+    """
+    # Special pipes send water out of the side they face whichever way it came in.
+    if name == START_PIPE:
+        return 1 << DIRECTIONS.index(START_CONNECTIONS[orientation][0])
+    elif name == END_PIPE:
+        return 1 << DIRECTIONS.index(END_CONNECTIONS[orientation][0])
+    elif name in CONNECTION_MASKS and side < 4:
+        return CONNECTION_MASKS[name][orientation][side]
+    return 0
+
+
+def _build_packed_exits():
+    """ Precomputes the exit mask of every packed cell for every entry side.
+
+            Returns:
+                list<tuple<int>>: Indexed by packed cell then entry side, where side 4 is the
+                start of the flow. Each mask has bit i set if water leaves through DIRECTIONS[i].
+    """
+    exits = []
+    for cell in range(1 << 7):
+        type_code = cell & PACKED_TYPE_MASK
+        orientation = (cell >> PACKED_ORIENTATION_SHIFT) & 3
+        name = PACKED_TILE_TYPES[type_code] if type_code < len(PACKED_TILE_TYPES) else None
+        exits.append(tuple(_exit_mask(name, orientation, side) for side in range(5)))
+    return exits
+
+
+_PACKED_EXITS = _build_packed_exits()
+# Whether each packed cell holds a pipe (special pipes included).
+_PACKED_IS_PIPE = [_PACKED_TYPE_CODES[START_PIPE] <= (cell & PACKED_TYPE_MASK) < len(PACKED_TILE_TYPES)
+                   for cell in range(1 << 7)]
+# The side indices set in each 4-bit mask.
+_MASK_SIDES = [tuple(side for side in range(4) if mask & (1 << side)) for mask in range(16)]
+
+# The playable pipe types, in the order of the bits of the masks _covering_pipes returns.
+_PIPE_NAMES = tuple(PIPES.values())
+# The ways water can go through each pipe at each orientation, as a 16-bit mask with bit
+# entry * 4 + exit set when water entering through side entry leaves through side exit.
+_PAIR_MASKS = {
+    name: [sum(1 << (side * 4 + exit_side)
+               for side in range(4) for exit_side in _MASK_SIDES[masks[side]])
+           for masks in CONNECTION_MASKS[name]]
+    for name in _PIPE_NAMES
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _covering_pipes(pairs):
+    """ (int) A mask with bit i set if _PIPE_NAMES[i] can take water every way in pairs (a
+        mask in the format of _PAIR_MASKS) in one of its orientations.
+    """
+    return sum(1 << bit for bit, name in enumerate(_PIPE_NAMES)
+               if any(pairs & ~pipe_pairs == 0 for pipe_pairs in _PAIR_MASKS[name]))
+
+
+# The pipe types that can take water straight on, and round a corner, through one tile.
+_STRAIGHT_PIPES = _covering_pipes(1 << (0 * 4 + 2))
+_TURN_PIPES = _covering_pipes(1 << (0 * 4 + 1))
+
+
+def _is_split(name):
+    """ (bool) Whether the pipe has sides that don't connect to each other, so water can go
+        through it twice without the two ways meeting.
+    """
+    masks = CONNECTION_MASKS[name][0]
+    sides = sum(1 << side for side in range(4) if masks[side])
+    return any(exits | (1 << side) != sides for side, exits in enumerate(masks) if exits)
+
+
+_SPLIT_PIPES = [name for name in _PIPE_NAMES if _is_split(name)]
+
+
+class LevelFormatError(ValueError):
+    """ Raised when a game file can't be read. Knows where in the board the problem is."""
+
+    def __init__(self, message, game_file, row=None, column=None):
+        """ Constructor method for LevelFormatError instances.
+
+                Parameters:
+                    message (str): What is wrong.
+                    game_file (str): name of the game file.
+                    row (int): The row of the board (or the playable pipes row) with the problem.
+                    column (int): The column of the problem within the row.
+        """
+        location = "" if row is None else f" at row {row}" + ("" if column is None else f", column {column}")
+        super().__init__(f"{game_file}{location}: {message}")
+        self.game_file = game_file
+        self.row = row
+        self.column = column
+
+
+class LevelReader:
+    """
+    Reads a game file one row at a time.
+
+    Iterating over a LevelReader yields each row of the board as a list of
+    (name, orientation, selectable) tile specs. The file is read as it is iterated over so the
+    text of the file is never held in memory. Once iteration has finished the playable pipe
+    counts and the positions of the special pipes are available.
+    """
+
+    def __init__(self, game_file):
+        """ Constructor method for LevelReader instances.
+
+                Parameters:
+                    game_file (str): name of the game file.
+        """
+        self.game_file = game_file
+        self.rows = 0
+        self.cols = None
+        # Set once the whole file has been read.
+        self.playable_counts = None
+        self.starting_positions = []
+        self.ending_positions = []
+
+    def __iter__(self):
+        """ Yields the tile specs of each board row. The last row of the file is the playable pipes."""
+        with open(self.game_file, 'r', newline='') as csv_file:
+            previous_row = None
+            for row in csv.reader(csv_file):
+                if not row or row == ['']:
+                    continue
+                # The last row holds the playable pipes, so stay a row behind.
+                if previous_row is not None:
+                    yield self._parse_board_row(previous_row)
+                previous_row = row
+
+        if previous_row is None:
+            raise LevelFormatError("the file is empty", self.game_file)
+        if self.rows == 0:
+            raise LevelFormatError("the board has no rows", self.game_file)
+        self.playable_counts = self._parse_playable_counts(previous_row)
+
+    def _parse_board_row(self, row):
+        """ (list<tuple>) Converts one row of cells into tile specs."""
+        row_num = self.rows
+        if self.cols is None:
+            self.cols = len(row)
+        elif len(row) != self.cols:
+            raise LevelFormatError(f"expected {self.cols} tiles but found {len(row)}",
+                                   self.game_file, row_num)
+
+        tile_specs = []
+        for col_num, cell in enumerate(row):
+            tile_spec = TILE_CODES.get(cell)
+            if tile_spec is None:
+                tile_spec = TILE_CODES.get(cell.strip())
+                if tile_spec is None:
+                    raise LevelFormatError(f"unknown tile {cell!r}", self.game_file, row_num, col_num)
+
+            if tile_spec[0] == START_PIPE:
+                self.starting_positions.append((row_num, col_num))
+            elif tile_spec[0] == END_PIPE:
+                self.ending_positions.append((row_num, col_num))
+            tile_specs.append(tile_spec)
+
+        self.rows += 1
+        return tile_specs
+
+    def _parse_playable_counts(self, row):
+        """ (list<int>) Converts the last row of the file into the playable pipe counts."""
+        if len(row) != len(PIPES):
+            raise LevelFormatError(f"expected {len(PIPES)} playable pipe counts but found {len(row)}",
+                                   self.game_file, self.rows)
+        counts = []
+        for col_num, cell in enumerate(row):
+            try:
+                counts.append(int(cell))
+            except ValueError:
+                raise LevelFormatError(f"playable pipe count {cell!r} isn't a number",
+                                       self.game_file, self.rows, col_num) from None
+        return counts
+
+
+class FlowAnalysis:
+    """
+    Everywhere the water from the start pipe goes, as found by PipeGame.analyse_flow.
+
+    reached is every (position, side) state the water reaches, meaning it enters the tile at
+    position through side (None for a start pipe), the same states check_win follows.
+    leaks is every (position, direction) where water leaves a tile and spills, either off
+    the board or into a tile that doesn't carry it on. path is the positions of the
+    shortest route from any start pipe to any end pipe, or None if the water doesn't
+    reach one.
+    """
+
+    def __init__(self, reached, leaks, path):
+        """ Constructor method for FlowAnalysis instances.
+
+                Parameters:
+                    reached (set<tuple>): The (position, side) states the water reaches.
+                    leaks (set<tuple>): The (position, direction) edges where water spills.
+                    path (list<tuple<int, int>>): The shortest winning path, or None.
+        """
+        self.reached = reached
+        self.leaks = leaks
+        self.path = path
+
+    def is_won(self):
+        """ (bool) Whether the water reaches an end pipe."""
+        return self.path is not None
+
+    def flowing_positions(self):
+        """ (set<tuple<int, int>>) The positions of every tile the water reaches."""
+        return {position for position, side in self.reached}
+
+
+class LevelTemplate:
+    """
+    A game file read once, so that any number of games can be started from it.
+
+    A LevelTemplate can be given to PipeGame (and its subclasses) in place of a file name.
+    It has the same attributes as a LevelReader that has read the whole file, and
+    iterating over it yields the same rows, so the file is only parsed once however many
+    games are made.
+    """
+
+    def __init__(self, game_file):
+        """ Constructor method for LevelTemplate instances.
+
+                Parameters:
+                    game_file (str): name of the game file.
+
+                Raises:
+                    LevelFormatError: If the file isn't a valid game.
+        """
+        reader = LevelReader(game_file)
+        self._board_rows = [tuple(row) for row in reader]
+        self.game_file = game_file
+        self.rows = reader.rows
+        self.cols = reader.cols
+        self.playable_counts = tuple(reader.playable_counts)
+        self.starting_positions = tuple(reader.starting_positions)
+        self.ending_positions = tuple(reader.ending_positions)
+
+    def __iter__(self):
+        """ Yields the tile specs of each board row."""
+        return iter(self._board_rows)
+
+
+def _open_level(game_file):
+    """ (LevelReader | LevelTemplate) Something to read the rows of a game from.
+
+            Parameters:
+                game_file (str | LevelTemplate): The name of a game file, or a template.
+    """
+    if isinstance(game_file, LevelTemplate):
+        return game_file
+    return LevelReader(game_file)
+
 
 class PipeGame:
     """
     A game of Pipes.
     """
-    def __init__(self, game_file='game_1.csv'):
+    def __init__(self, game_file='game_1.csv', history_limit=None, win_condition=WIN_ALL_ENDS):
         """
         Construct a game of Pipes from a file name.
 
         Parameters:
-            game_file (str): name of the game file.
+            game_file (str | LevelTemplate): name of the game file, or a template
+            of a game file that has already been read.
+            history_limit (int): The most moves that can be undone (None for no limit).
+            win_condition (str): WIN_ALL_ENDS or WIN_ALL_STARTS, which only differ when
+            the level has several start or end pipes.
+
+        Raises:
+            ValueError: If win_condition isn't one of WIN_CONDITIONS.
         """
+        if win_condition not in WIN_CONDITIONS:
+            raise ValueError(f"unknown win condition {win_condition!r}")
+        self._win_condition = win_condition
+        # Zobrist hash of the board and playable pipes, see state_hash. It is only worked out
+        # (and then kept up to date) once it is asked for.
+        self._state_hash = None
+
+        # Callables told about every change to the game, see subscribe.
+        self._subscribers = []
+        self._won = None
+
+        # The copies of shared tiles get_pipe has handed out that are still held elsewhere,
+        # by position, so that setting one's selectability changes its cell.
+        self._cell_tiles = weakref.WeakValueDictionary()
+
+        # Undo history, see undo. Each move is (serial number, list of changes). Nothing is
+        # recorded while the game loads or while moves are being undone and redone.
+        self._history = collections.deque(maxlen=history_limit)
+        self._redo_moves = []
+        self._current_move = None
+        self._recording = False
+        self._move_serial = 0
+        # The serial number of the newest move that fell out of a limited history.
+        self._forgotten_serial = 0
+        self._history_epoch = 0
+
         #Declaring the playable pipes dictionary so that it can be set in the load_file function.
         self._playable_pipes = {'straight': 0, 'corner': 0, 'cross': 0, 'junction-t': 0, 'diagonals': 0, 'over-under': 0}
         
         self._board_layout = self.load_file(game_file)
+        self._recording = True
         
-        # Function call also sets the starting and ending position variables.
-        self.end_pipe_positions() 
+        # load_file also sets the starting and ending position variables.
+
+        # The flow is every (position, entry side) that water from the start pipes reaches.
+        self._reset_flow()
         
 
     def check_win(self):
         """
             (bool) Returns True  if the player has won the game False otherwise.
+
+            With several start or end pipes, the game's win condition decides whether
+            every end pipe or every start pipe has to be connected.
         """
-        position = self.get_starting_position()
-        pipe = self.pipe_in_position(position)
-        queue = [(pipe, None, position)]
-        discovered = [(pipe, None)]
-        while queue:
-            pipe, direction, position = queue.pop()
+        if not self._win_states or not self._starting_positions:
+            return False
+        # The flow is kept up to date by every move so each end pipe is a single lookup.
+        if self._win_condition == WIN_ALL_STARTS:
+            return len(self._connected_starts()) == len(self._starting_positions)
+        flow = self._flow
+        for state in self._win_states:
+            if state not in flow:
+                return False
+        return True
+
+    def _connected_starts(self):
+        """ Finds the start pipes whose water reaches an end pipe by following the flow
+            backwards from the end pipes, so every start pipe is found in one search.
 
-            for direction in pipe.get_connected(direction):
-                    
-                if self.position_in_direction(direction, position) is None:
-                    new_direction = None 
-                    new_position = None
-                else:
-                    new_direction, new_position = self.position_in_direction(direction, position)
-                if new_position == self.get_ending_position() and \
-                 direction == self.pipe_in_position(new_position).get_connected()[0]:
-                    return True
+                Returns:
+                    set<tuple<int, int>>: The positions of the connected start pipes.
+        """
+        flow = self._flow
+        stack = [state for state in self._win_states if state in flow]
+        found = set(stack)
+        starts = set()
+        while stack:
+            position, side = stack.pop()
+            if side is None:
+                starts.add(position)
+                continue
+            # The water came out of the tile on the side it entered through.
+            leaving, source = self.position_in_direction(side, position)
+            pipe = self.pipe_in_position(source)
+            for state in self._flow_at.get(source, ()):
+                if state not in found and leaving in pipe.get_connected(state[1]):
+                    found.add(state)
+                    stack.append(state)
+        return starts
+
+    def get_win_condition(self):
+        """ (str) What it takes to win a game with several start or end pipes, see WIN_CONDITIONS."""
+        return self._win_condition
+
+    def _reset_flow(self):
+        """ Rebuilds the flow of water from the start pipe across the whole board.
+
+                The flow is made up of states (position, side) meaning that water enters the
+                tile at position through side. The start pipe is the root state (position, None).
+                Each state remembers the states it was the first to reach so that the part
+                of the flow downstream of a tile can be removed when the tile changes.
+        """
+        self._flow = set()
+        self._flow_children = {}
+        self._flow_at = {}
+
+        # Water from every start pipe is followed together.
+        roots = [(start, None) for start in self._starting_positions]
+        for root in roots:
+            self._add_flow_state(root)
+        self._expand_flow(roots)
+
+        self._win_states = self._winning_states()
 
-                pipe = self.pipe_in_position(new_position)
-                if pipe is None or (pipe, new_direction) in discovered:
+    def _winning_states(self):
+        """ (list<tuple<tuple<int, int>, str>>) The (position, side) water must enter each
+            end pipe through.
+        """
+        states = []
+        for end in self._ending_positions:
+            end_pipe = self.pipe_in_position(end)
+            if end_pipe is not None:
+                # Water wins by flowing in the direction the end pipe faces.
+                states.append((end, Pipe.convert_orientation(end_pipe.get_connected()[0], 0, 2)))
+        return states
+
+    def _add_flow_state(self, state):
+        """ Records that water reaches the given (position, side) state."""
+        self._flow.add(state)
+        self._flow_at.setdefault(state[0], set()).add(state)
+
+    def _expand_flow(self, states):
+        """ Adds every state reachable from the given flow states to the flow.
+
+                Parameters:
+                    states (list<tuple>): (position, side) states already in the flow.
+        """
+        flow = self._flow
+        while states:
+            state = states.pop()
+            position, side = state
+            pipe = self.pipe_in_position(position)
+            if pipe is None:
+                continue
+
+            for direction in pipe.get_connected(side):
+                neighbour = self.position_in_direction(direction, position)
+                if neighbour is None:
                     continue
-                discovered.append((pipe, new_direction))
-                queue.append((pipe, new_direction, new_position))
-        return False
+                new_state = (neighbour[1], neighbour[0])
+                if new_state in flow:
+                    continue
+                self._add_flow_state(new_state)
+                self._flow_children.setdefault(state, []).append(new_state)
+                states.append(new_state)
 
+    def analyse_flow(self):
+        """ Follows the water from the start pipes across the whole board in one breadth
+            first search, unlike check_win which only answers whether it reaches the end.
+
+                Returns:
+                    FlowAnalysis obj: Every state the water reaches, where it leaks and the
+                    shortest path from a start pipe to an end pipe.
+        """
+        win_states = set(self._winning_states())
+        roots = [(start, None) for start in self._starting_positions]
+
+        # The state each state was first reached from, which is also the visited index.
+        parents = dict.fromkeys(roots)
+        leaks = set()
+        path_end = None
+        queue = collections.deque(roots)
+        while queue:
+            state = queue.popleft()
+            position, side = state
+            pipe = self.pipe_in_position(position)
+            if pipe is None:
+                continue
+
+            for direction in pipe.get_connected(side):
+                neighbour = self.position_in_direction(direction, position)
+                # Water that has reached an end pipe has gone where it should, not leaked.
+                if neighbour is None:
+                    if state not in win_states:
+                        leaks.add((position, direction))
+                    continue
+                new_state = (neighbour[1], neighbour[0])
+                if state not in win_states and new_state not in win_states:
+                    # Water spills unless the next pipe carries it on.
+                    next_pipe = self.pipe_in_position(new_state[0])
+                    if next_pipe is None or not next_pipe.get_connected(new_state[1]):
+                        leaks.add((position, direction))
+                if new_state not in parents:
+                    parents[new_state] = state
+                    queue.append(new_state)
+                    # The first end pipe reached is the closest to a start pipe.
+                    if path_end is None and new_state in win_states:
+                        path_end = new_state
+
+        path = None
+        if path_end is not None:
+            path = []
+            state = path_end
+            while state is not None:
+                path.append(state[0])
+                state = parents[state]
+            path.reverse()
+        return FlowAnalysis(set(parents), leaks, path)
+
+    def _update_flow(self, position):
+        """ Updates the flow after the tile at position has changed.
+
+                Only the part of the flow that was reached through the changed tile is
+                removed, and only the states that could lead back into it are expanded again.
+
+                Parameters:
+                    position (tuple<int, int>): The (row, col) of the tile that changed.
+        """
+        states = self._flow_at.get(position)
+        if not states:
+            # Water never reaches the tile so the flow is unchanged.
+            return
+
+        removed = []
+        for state in list(states):
+            if state in self._flow:
+                self._remove_flow_descendants(state, removed)
+
+        # Surviving states next to a removed state may still reach it another way.
+        seeds = set(self._flow_at.get(position, ()))
+        for removed_position, side in removed:
+            neighbour = self.position_in_direction(side, removed_position)
+            seeds.update(self._flow_at.get(neighbour[1], ()))
+        self._expand_flow(list(seeds))
+
+    def _remove_flow_descendants(self, state, removed):
+        """ Removes every state that was first reached through the given state.
+
+                Parameters:
+                    state (tuple): The (position, side) state whose descendants are removed.
+                    removed (list<tuple>): Removed states are appended to this list.
+        """
+        stack = self._flow_children.pop(state, [])
+        while stack:
+            child = stack.pop()
+            if child not in self._flow:
+                continue
+            self._flow.discard(child)
+            self._flow_at[child[0]].discard(child)
+            removed.append(child)
+            stack.extend(self._flow_children.pop(child, ()))
+
+    def _store_tile(self, position, tile):
+        """ Puts tile into the board storage at position."""
+        self._board_layout[position[0]][position[1]] = tile
+
+    def _check_storable(self, tile):
+        """ Raises ValueError if the board storage can't hold tile. A list of lists holds any tile."""
+
+    def _stored_tile(self, position):
+        """ (Tile) The tile in the board storage at position, which may be a shared tile."""
+        return self._board_layout[position[0]][position[1]]
+
+    def _cell_tile(self, position, shared_tile):
+        """ (Tile) The copy of a shared tile handed out for position, made if nothing holds one."""
+        tile = self._cell_tiles.get(position)
+        if tile is None:
+            tile = Tile(shared_tile.get_name(), shared_tile.can_select())
+            tile._attach(self, position)
+            self._cell_tiles[position] = tile
+        return tile
+
+    def _forget_cell_tile(self, position):
+        """ Detaches the copy of a shared tile handed out for position, as its cell has changed."""
+        if self._cell_tiles:
+            tile = self._cell_tiles.pop(position, None)
+            if tile is not None:
+                tile._detach()
+
+    def _pipe_rotated(self, position, direction):
+        """ Called by a pipe on the board after it has been rotated a quarter turn.
+
+                Parameters:
+                    position (tuple<int, int>): The (row, col) of the pipe.
+                    direction (int): 1 if the pipe turned clockwise, -1 if counter-clockwise.
+        """
+        if self._state_hash is not None:
+            pipe = self.get_pipe(position)
+            index = position[0] * self._cols + position[1]
+            orientation = pipe.get_orientation()
+            self._state_hash ^= (
+                _zobrist_tile_key(index, pipe.get_name(), (orientation - direction) % 4, pipe.can_select()) ^
+                _zobrist_tile_key(index, pipe.get_name(), orientation, pipe.can_select()))
+
+        self._record(("rotate", position, direction))
+        if position in self._starting_positions or position in self._ending_positions:
+            # Turning an end pipe changes the side water has to enter it through.
+            self._reset_flow()
+        else:
+            self._update_flow(position)
+        if self._subscribers:
+            orientation = self.get_pipe(position).get_orientation()
+            self._publish_move(TILE_ROTATED, {"position": position, "orientation": orientation})
+
+    def _replace_tile(self, position, tile):
+        """ Puts tile on the board at position and updates the flow.
+
+                Parameters:
+                    position (tuple<int, int>): The (row, col) to place the tile at.
+                    tile (Tile obj): The tile (or pipe) to place.
+        """
+        old_tile = self._stored_tile(position)
+        old_tile._detach()
+        self._forget_cell_tile(position)
+        self._hash_tile(position, old_tile)
+        self._store_tile(position, tile)
+        self._hash_tile(position, tile)
+        tile._attach(self, position)
+
+        if position in self._starting_positions or position in self._ending_positions:
+            self._reset_flow()
+        else:
+            self._update_flow(position)
+
+
+    def _tile_key(self, position, tile):
+        """ (int) The Zobrist key of a tile at position."""
+        orientation = tile.get_orientation() if tile.get_id() != "tile" else 0
+        return _zobrist_tile_key(position[0] * self._cols + position[1], tile.get_name(),
+                                 orientation, tile.can_select())
+
+    def _hash_tile(self, position, tile):
+        """ Adds a tile at position to the state hash, or takes it out if it was in it."""
+        if self._state_hash is not None:
+            self._state_hash ^= self._tile_key(position, tile)
+
+    def state_hash(self):
+        """ A 64-bit Zobrist hash of the board (every tile, its orientation and whether it
+            can be selected) and the playable pipes.
+
+                The hash is worked out the first time it is asked for and then kept up to
+                date by every move, so asking again costs nothing. Games in the same state
+                have the same hash whichever PipeGame class they use, and in every process,
+                so it can key caches of check_win results, find duplicate levels or index
+                the states a search has seen. Different states almost always have
+                different hashes.
+
+                Returns:
+                    int: The hash, from 0 to 2 ** 64 - 1.
+        """
+        if self._state_hash is None:
+            self._state_hash = self._compute_state_hash()
+        return self._state_hash
+
+    def _compute_state_hash(self):
+        """ (int) Works out the state hash from scratch, see state_hash."""
+        state_hash = self._board_hash() ^ _zobrist_size_key(self._rows, self._cols)
+        for pipe_name, count in self._playable_pipes.items():
+            state_hash ^= _zobrist_count_key(pipe_name, count)
+        return state_hash
+
+    def _board_hash(self):
+        """ (int) The XOR of the Zobrist keys of every tile on the board."""
+        board_hash = 0
+        for row_num, row in enumerate(self._board_layout):
+            for col_num, tile in enumerate(row):
+                board_hash ^= self._tile_key((row_num, col_num), tile)
+        return board_hash
 
     def get_board_layout(self):
-        """ Getter method for the 2D board layout of the game."""
-        return self._board_layout
+        """ Getter method for the 2D board layout of the game.
+
+                Empty and locked cells are handed out as copies for their cell, like
+                get_pipe does, so any tile in the layout can be changed.
+        """
+        return [[self.get_pipe((row, col)) for col in range(self._cols)]
+                for row in range(self._rows)]
+
+    def get_dimensions(self):
+        """ (tuple<int, int>) Getter method for the number of (rows, columns) on the board."""
+        return (self._rows, self._cols)
 
     def get_playable_pipes(self):
         """ Getter method for the playable pipes dictionary of the game instance."""
@@ -89,7 +914,53 @@ class PipeGame:
                 Returns:
                     Void.
         """
-        self._playable_pipes[pipe_name] = self._playable_pipes.get(pipe_name, 0) + number
+        count = self._playable_pipes.get(pipe_name, 0)
+        self._playable_pipes[pipe_name] = count + number
+        if self._state_hash is not None:
+            self._state_hash ^= (_zobrist_count_key(pipe_name, count) ^
+                                 _zobrist_count_key(pipe_name, count + number))
+        self._record(("playable", pipe_name, number))
+        if self._subscribers:
+            self._publish(PLAYABLE_CHANGED, {"pipe": pipe_name, "count": self._playable_pipes[pipe_name]})
+
+    def subscribe(self, callback):
+        """ Registers a callable to be told about every change to the game.
+
+                The callable is called as callback(event, details) where event is one of
+                TILE_PLACED, TILE_REMOVED, TILE_ROTATED, PLAYABLE_CHANGED, SELECTABLE_CHANGED or
+                WIN_CHANGED and details is a dictionary:
+                    TILE_PLACED / TILE_REMOVED: {"position": (row, col), "tile": the pipe}
+                    TILE_ROTATED: {"position": (row, col), "orientation": new orientation}
+                    PLAYABLE_CHANGED: {"pipe": pipe name, "count": new playable amount}
+                    SELECTABLE_CHANGED: {"position": (row, col), "selectable": new selectability}
+                    WIN_CHANGED: {"won": whether the game is now won}
+
+                Parameters:
+                    callback (callable): The callable to register.
+        """
+        if not self._subscribers:
+            # Win changes are only tracked while someone is listening.
+            self._won = self.check_win()
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """ Stops a callable registered with subscribe from being told about changes."""
+        self._subscribers.remove(callback)
+
+    def _publish(self, event, details):
+        """ Tells every subscriber about an event."""
+        for callback in list(self._subscribers):
+            callback(event, details)
+
+    def _publish_move(self, event, details):
+        """ Tells every subscriber about a change to the board, and whether the game is now won."""
+        if not self._subscribers:
+            return
+        self._publish(event, details)
+        won = self.check_win()
+        if won != self._won:
+            self._won = won
+            self._publish(WIN_CHANGED, {"won": won})
 
 
     def get_pipe(self, position):
@@ -103,8 +974,15 @@ class PipeGame:
                 Returns:
                     (Pipe | Tile) obj: If the tile has no Pipe then a tile instance is returned.
                     Otherwise the most specialised instance of the pipe is returned.
+                    Shared empty and locked tiles are handed out as a copy for the cell (the
+                    same copy while it is held elsewhere), so they can be changed.
         """
-        return self._board_layout[position[0]][position[1]]
+        tile = self._stored_tile(position)
+        if tile.__class__ is SharedTile:
+            return self._cell_tile(position, tile)
+        if tile._game is None:
+            tile._attach(self, position)
+        return tile
 
     def set_pipe(self, pipe, position):
         """ Setter method, sets the tile at the given position to the given pipe. Updates available pipes.
@@ -117,9 +995,18 @@ class PipeGame:
     
                 Returns:
                     Void.
+
+                Raises:
+                    ValueError: If the board can't store the pipe, in which case the game
+                    is left unchanged.
         """
-        self._playable_pipes[pipe.get_name()] -= 1
-        self._board_layout[position[0]][position[1]] = pipe
+        self._check_storable(pipe)
+        self._begin_move()
+        self.change_playable_amount(pipe.get_name(), -1)
+        self._record(("tile", position, self._stored_tile(position), pipe))
+        self._replace_tile(position, pipe)
+        self._end_move()
+        self._publish_move(TILE_PLACED, {"position": position, "tile": pipe})
 
     def pipe_in_position(self, position):
         """ Returns the Pipe instance of the pipe in the given position of the game board if it exists.
@@ -139,6 +1026,8 @@ class PipeGame:
         obj_at_position = self._board_layout[position[0]][position[1]]
 
         if obj_at_position.get_id() in ["pipe", "special_pipe"]:
+            if obj_at_position._game is None:
+                obj_at_position._attach(self, position)
             return obj_at_position
 
     def remove_pipe(self, position):
@@ -151,12 +1040,194 @@ class PipeGame:
 
                 Returns:
                     Void.
+
+                Raises:
+                    KeyError: If there is no playable pipe at position.
         """
-        old_pipe = self._board_layout[position[0]][position[1]]
-        self._playable_pipes[old_pipe.get_name()] += 1
-        self._board_layout[position[0]][position[1]] = Tile("tile")
+        old_pipe = self.get_pipe(position)
+        if old_pipe.get_name() not in _PIPE_NAMES:
+            raise KeyError(f"there is no playable pipe at {position}")
+        empty_tile = _SHARED_TILES[(EMPTY_TILE, True)]
+        self._begin_move()
+        self.change_playable_amount(old_pipe.get_name(), 1)
+        self._record(("tile", position, old_pipe, empty_tile))
+        self._replace_tile(position, empty_tile)
+        self._end_move()
+        self._publish_move(TILE_REMOVED, {"position": position, "tile": old_pipe})
+
+    def set_selectable(self, position, select):
+        """ Sets whether the player can select the tile at position. Tile.set_select on a
+            tile that is on the board calls this.
+
+                Empty and locked tiles are shared by every cell like them, so the cell is
+                given its own copy of the tile first (the copy get_pipe handed out, if it
+                is still held). This isn't a move, so it isn't recorded for undo.
 
+                Parameters:
+                    position (tuple<int, int>): A tuple in form (row, col).
+                    select (bool): Whether the tile can be selected by the user.
+        """
+        tile = self._stored_tile(position)
+        if tile.can_select() == select:
+            return
+        self._hash_tile(position, tile)
+        if tile.__class__ is SharedTile:
+            tile = self._cell_tile(position, tile)
+        tile._selectable = select
+        self._hash_tile(position, tile)
+        # Stored again so that boards that keep the selectable flag themselves see it.
+        self._store_tile(position, tile)
+        tile._attach(self, position)
+        if self._subscribers:
+            self._publish(SELECTABLE_CHANGED, {"position": position, "selectable": select})
+
+    def rotate_pipe(self, position, direction):
+        """ Rotates the pipe at the given position by 90 degrees in the specified direction.
+
+                Parameters:
+                    position (tuple<int, int>): A tuple in form (row, col).
+                    direction (int): -ve, +ve or zero indicating counter-clockwise,
+                    clockwise rotation or no rotation respectively.
+        """
+        self.get_pipe(position).rotate(direction)
+
+    def undo(self):
+        """ Takes back the last move (a pipe placed, removed or rotated) that hasn't been undone.
+
+                Returns:
+                    bool: False if there was nothing to undo.
+        """
+        if not self._history:
+            return False
+        move = self._history.pop()
+        self._recording = False
+        for change in reversed(move[1]):
+            self._apply_change(change, undo=True)
+        self._recording = True
+        self._redo_moves.append(move)
+        return True
+
+    def redo(self):
+        """ Makes the last undone move again. Making any other move forgets the undone moves.
+
+                Returns:
+                    bool: False if there was nothing to redo.
+        """
+        if not self._redo_moves:
+            return False
+        move = self._redo_moves.pop()
+        self._recording = False
+        for change in move[1]:
+            self._apply_change(change, undo=False)
+        self._recording = True
+        self._push_history(move)
+        return True
 
+    def can_undo(self):
+        """ (bool) Whether there is a move to undo."""
+        return bool(self._history)
+
+    def can_redo(self):
+        """ (bool) Whether there is an undone move to redo."""
+        return bool(self._redo_moves)
+
+    def snapshot(self):
+        """ Marks the current state of the game so that restore can return to it.
+
+                Taking a snapshot copies nothing, restoring one undoes the moves made since.
+
+                Returns:
+                    tuple<int, int>: The snapshot, to be given to restore.
+        """
+        return (self._history_epoch, self._last_serial(len(self._history)))
+
+    def restore(self, snapshot):
+        """ Undoes every move made since a snapshot was taken.
+
+                Parameters:
+                    snapshot (tuple<int, int>): A snapshot from this game's snapshot method.
+
+                Raises:
+                    ValueError: If the moves up to the snapshot have since been undone and
+                    replaced, have fallen out of a limited history, or the history has been
+                    cleared.
+        """
+        epoch, serial = snapshot
+        # Serial numbers only grow, so the snapshot's move is the first one not after it.
+        index = len(self._history)
+        while index and self._history[index - 1][0] > serial:
+            index -= 1
+        if epoch != self._history_epoch or self._last_serial(index) != serial:
+            raise ValueError("the snapshot isn't in this game's undo history")
+        while len(self._history) > index:
+            self.undo()
+
+    def clear_history(self):
+        """ Forgets every move that could be undone or redone, and every snapshot."""
+        self._history.clear()
+        self._redo_moves = []
+        self._forgotten_serial = self._move_serial
+        self._history_epoch += 1
+
+    def _begin_move(self):
+        """ Groups the changes recorded until _end_move into one move."""
+        if self._recording:
+            self._current_move = self._new_move()
+
+    def _end_move(self):
+        """ Finishes the move started by _begin_move."""
+        self._current_move = None
+
+    def _new_move(self):
+        """ (list) Starts a new move in the history, forgetting any undone moves."""
+        self._move_serial += 1
+        changes = []
+        self._push_history((self._move_serial, changes))
+        self._redo_moves = []
+        return changes
+
+    def _push_history(self, move):
+        """ Adds a move to the history, forgetting the oldest move if the history is full."""
+        if len(self._history) == self._history.maxlen:
+            if not self._history:
+                # No history is kept at all.
+                self._forgotten_serial = move[0]
+                return
+            self._forgotten_serial = self._history[0][0]
+        self._history.append(move)
+
+    def _last_serial(self, length):
+        """ (int) The serial number of the last move in the first length moves of the history."""
+        return self._history[length - 1][0] if length else self._forgotten_serial
+
+    def _record(self, change):
+        """ Adds a change to the current move, or as a move of its own outside of one.
+
+                Parameters:
+                    change (tuple): ("tile", position, old tile, new tile),
+                    ("rotate", position, direction) or ("playable", pipe name, number).
+        """
+        if not self._recording:
+            return
+        if self._current_move is not None:
+            self._current_move.append(change)
+        else:
+            self._new_move().append(change)
+
+    def _apply_change(self, change, undo):
+        """ Makes (or with undo, takes back) one change recorded by _record."""
+        if change[0] == "playable":
+            self.change_playable_amount(change[1], -change[2] if undo else change[2])
+        elif change[0] == "rotate":
+            self.get_pipe(change[1]).rotate(-change[2] if undo else change[2])
+        else:
+            position, old_tile, new_tile = change[1:]
+            tile = old_tile if undo else new_tile
+            self._replace_tile(position, tile)
+            if tile.get_id() == "tile":
+                self._publish_move(TILE_REMOVED, {"position": position, "tile": new_tile if undo else old_tile})
+            else:
+                self._publish_move(TILE_PLACED, {"position": position, "tile": tile})
 
     def position_in_direction(self, direction, position):
         """ Returns the opposite direciton and the position corresponding to that 
@@ -172,29 +1243,19 @@ class PipeGame:
                     at index 0 and a tulpe containing the new position (row, col) at index 1
                     None: If the position is invalid.
         """
-        if direction not in "NESW":
+        relative_position = DIRECTION_DELTAS.get(direction)
+        if relative_position is None:
             return None
 
-        # Relative position hash table
-        pos_update_dict = {'N': (-1, 0), 'S': (1, 0) , 'E': (0, 1), 'W': (0, -1)}
-        relative_position = pos_update_dict.get(direction)
-
         # Add the relative position to the old position.
-        position = (position[0] + relative_position[0], position[1] + relative_position[1])
-
-        # Use static method from Pipe class to flip the direction.
-        direction = Pipe.convert_orientation(direction, 0, 2)
-
-        board_size = len(self._board_layout)
+        row = position[0] + relative_position[0]
+        col = position[1] + relative_position[1]
 
         # Filter for invalid position
-        if (
-            (position[0] < 0 or position[0] >= board_size) or
-            (position[1] < 0 or position[1] >= board_size)
-         ):
+        if row < 0 or row >= self._rows or col < 0 or col >= self._cols:
             return None
 
-        return (direction, position)
+        return (OPPOSITE_DIRECTIONS[direction], (row, col))
 
 
     def load_file(self, game_file):
@@ -208,51 +1269,50 @@ class PipeGame:
                 Returns:
                     list(tile): A list of tile (and relevant subclass) instances 
                     reflecting the structure given in the .csv file.
+
+                Raises:
+                    LevelFormatError: If the file isn't a valid game, with the row and column.
         """
+        reader = _open_level(game_file)
+
+        # Tiles are only told their game and position once they are handed out, so that
+        # the board doesn't hold a position tuple for every pipe.
         board_layout = []
+        for row in reader:
+            board_row = []
+            for tile_spec in row:
+                board_row.append(_create_tile(*tile_spec))
+            # Add the row of tiles to the board_layout
+            board_layout.append(board_row)
+
+        self._load_level_info(reader)
+
+        return board_layout
 
-        # Context manager for the game file.
-        with open(game_file, 'r') as csv_file:
-            # Read rows from the game file into a 3D list split by commas. 
-            # Each minimal list represents a tile (tile description).
-            file_rows = [row.split(',') for row in csv_file.readlines()]
-            # File has been read into a variable so there is no need to keep it open.
-        # Skip the last row because the last row contains playable_pipe information
-        for row in file_rows[:-1]:
-            board_layout.append([])
-
-            for tile_description in row:
-                tile_description = tile_description.replace("\n", '')
-                # the tile_code is it's key in the PIPES dict or the SPECIAL_TILES dict.
-                tile_code = ''.join(char for char in tile_description if not char.isdigit())
-                tile_orientation = tile_description.replace(tile_code, '')
-                tile_orientation = int(tile_orientation) if tile_orientation else 0
-
-                if tile_code == '#':
-                    current_tile = Tile(EMPTY_TILE, True)
-
-                elif SPECIAL_TILES.get(tile_code) is not None:
-
-                    if tile_code == 'S':
-                        current_tile = StartPipe(tile_orientation)
-                    elif tile_code == 'E':
-                        current_tile = EndPipe(tile_orientation)
-                    elif tile_code == 'L':
-                        current_tile = Tile(LOCKED_TILE, False)
-
-                elif PIPES.get(tile_code) is not None:
-                    current_tile_type = PIPES.get(tile_code)
-                    current_tile = Pipe(current_tile_type, tile_orientation, False)
-
-                # Add the tile to the board_layout
-                board_layout[-1].append(current_tile)
+    def _load_level_info(self, reader):
+        """ Sets the playable pipes and special pipe positions found by a LevelReader.
 
+                Parameters:
+                    reader (LevelReader obj): A reader that has read the whole game file.
+        """
         # Iterate over the playable pipes dictionary and set the 
         # value to corresponding integer given in the last line of the .csv file.
-        for pipe_num, pipe in enumerate(self._playable_pipes):
-            self.change_playable_amount(pipe, int(file_rows[-1][pipe_num]))
+        for pipe, count in zip(self._playable_pipes, reader.playable_counts):
+            self.change_playable_amount(pipe, count)
 
-        return board_layout
+        # The bounds of the board are used by every position_in_direction call.
+        self._rows = reader.rows
+        self._cols = reader.cols
+
+        # The special pipes were found while reading, so there is no need to rescan the board.
+        self._set_end_pipe_positions(reader.starting_positions, reader.ending_positions)
+
+    def _set_end_pipe_positions(self, starting_positions, ending_positions):
+        """ Records the positions of every start and end pipe, in reading order."""
+        self._starting_positions = tuple(starting_positions)
+        self._ending_positions = tuple(ending_positions)
+        self._starting_position = self._starting_positions[0] if self._starting_positions else None
+        self._ending_position = self._ending_positions[0] if self._ending_positions else None
 
     # time: O(n) worst case despite two for loops.
     def end_pipe_positions(self):
@@ -265,21 +1325,78 @@ class PipeGame:
                     (tuple<int, int>): A tuple in form (row, col) corresponding 
                     to the location of the old tile/pipe in the 2D game list.
         """
-        self._starting_position = None
-        self._ending_position = None
+        starting_positions = []
+        ending_positions = []
         for row_num, row in enumerate(self._board_layout):
             for col_num, tile in enumerate(row):
-                # Below if checks if the instance is a special_pipe and that at least one of 
-                # the start_pipe/end_pipe hasn't been found yet
-                if (tile.get_id() == "special_pipe" and
-                    (self._starting_position is None or self._ending_position is None)
-                    ):
+                # Below if checks if the instance is a special_pipe
+                if tile.get_id() == "special_pipe":
 
                     if tile._name == "end":
-                        self._ending_position = (row_num, col_num)
+                        ending_positions.append((row_num, col_num))
                     elif tile._name == "start":
-                        self._starting_position = (row_num, col_num)
+                        starting_positions.append((row_num, col_num))
+        self._set_end_pipe_positions(starting_positions, ending_positions)
+
 
+    def solve(self, max_nodes=None, time_limit=None):
+        """ Searches for moves that would win the game from its current state.
+
+                Parameters:
+                    max_nodes (int): Give up after expanding this many tiles (None for no limit).
+                    time_limit (float): Give up after this many seconds (None for no limit).
+
+                Returns:
+                    list<tuple>: The moves to make (see Solver.solve), or None if there is no
+                    solution or the search gave up.
+
+                Raises:
+                    ValueError: If the game has more than one start or end pipe.
+        """
+        return Solver(self, max_nodes, time_limit).solve()
+
+    def hint(self):
+        """ Suggests the next move, the one that takes the water closest to the end pipe.
+
+                Only the tiles the water already reaches are considered, using the flow kept
+                up to date by every move, so a hint is quick enough to give after every click.
+                Like the GUI, pipes are only placed on empty selectable tiles from the playable
+                pipes left, and only the player's pipes are rotated.
+
+                Returns:
+                    tuple: ("place", position, pipe name, orientation) or
+                    ("rotate", position, turns), as returned by solve.
+                    None: If the game is won or no move brings the water closer.
+
+                Raises:
+                    ValueError: If the game has more than one start or end pipe.
+        """
+        if self.check_win():
+            return None
+        return Solver(self).hint(self._flow_states())
+
+    def _flow_states(self):
+        """ (set<tuple<int, int>>) The states water reaches as (flat index, side), in the
+            format Solver uses, with side 4 for the start pipe.
+        """
+        cols = self.get_dimensions()[1]
+        return {(position[0] * cols + position[1], 4 if side is None else DIRECTIONS.index(side))
+                for position, side in self._flow}
+
+    def apply_moves(self, moves):
+        """ Makes the moves returned by solve.
+
+                Parameters:
+                    moves (list<tuple>): ("place", position, pipe name, orientation) and
+                    ("rotate", position, turns) moves.
+        """
+        for move in moves:
+            if move[0] == "place":
+                self.set_pipe(Pipe(move[2], move[3]), move[1])
+            else:
+                pipe = self.get_pipe(move[1])
+                for _ in range(move[2]):
+                    pipe.rotate(1)
 
     def get_starting_position(self):
         """ Getter method for the positon of the starting pipe in the board_layout. """
@@ -290,6 +1407,1080 @@ class PipeGame:
         """ Getter method for the positon of the end pipe in the board_layout. """
         return self._ending_position
 
+    def get_starting_positions(self):
+        """ (tuple<tuple<int, int>>) The positions of every start pipe, by row then column. """
+        return self._starting_positions
+
+    def get_ending_positions(self):
+        """ (tuple<tuple<int, int>>) The positions of every end pipe, by row then column. """
+        return self._ending_positions
+
+
+
+class PackedPipeGame(PipeGame):
+    """
+    A game of Pipes that stores the board as one byte per tile instead of one object per tile.
+
+    Each byte holds the tile's type code in PACKED_TILE_TYPES, its orientation and whether it
+    is selectable. Tile and Pipe objects are only created when get_pipe or get_board_layout
+    asks for them. Pipes that have been handed out are remembered while something still
+    holds them, so that rotating them updates the packed board.
+    """
+
+    def load_file(self, game_file):
+        """ Takes a .csv file and packs it into a bytearray with one byte per tile.
+            Also sets the initial playable pipes dictionary.
+
+                Parameters:
+                    game_file (.csv): A .csv containing a structure overview
+                    of an initial game state
+
+                Returns:
+                    None: The board is kept in self._cells rather than a board layout.
+        """
+        reader = _open_level(game_file)
+
+        self._cells = bytearray()
+        # Pipes (and tiles that aren't shared) that have been handed out and are still held
+        # elsewhere, by position.
+        self._pipes = weakref.WeakValueDictionary()
+        for row in reader:
+            self._cells.extend(_pack_tile_spec(*tile_spec) for tile_spec in row)
+
+        self._load_level_info(reader)
+
+    def _board_hash(self):
+        """ (int) The XOR of the Zobrist keys of every tile on the packed board."""
+        empty_cell = _pack_tile_spec(EMPTY_TILE, 0, True)
+        board_hash = 0
+        for index, cell in enumerate(self._cells):
+            if cell != empty_cell:
+                board_hash ^= _zobrist_tile_key(index, *_unpack_tile_spec(cell))
+        return board_hash
+
+    def end_pipe_positions(self):
+        """ Finds and saves the positions of the start and end pipes in the packed board."""
+        starting_positions = []
+        ending_positions = []
+        start_code = _PACKED_TYPE_CODES[START_PIPE]
+        end_code = _PACKED_TYPE_CODES[END_PIPE]
+        for index, cell in enumerate(self._cells):
+            type_code = cell & PACKED_TYPE_MASK
+            if type_code == start_code:
+                starting_positions.append(divmod(index, self._cols))
+            elif type_code == end_code:
+                ending_positions.append(divmod(index, self._cols))
+        self._set_end_pipe_positions(starting_positions, ending_positions)
+
+    def _stored_tile(self, position):
+        """ (Tile) The tile unpacked from position: the shared tile for empty and locked
+            tiles, otherwise the same instance while it is held elsewhere.
+        """
+        tile = self._pipes.get(position)
+        if tile is not None:
+            return tile
+
+        tile = _create_tile(*_unpack_tile_spec(self._cells[position[0] * self._cols + position[1]]))
+        if tile.__class__ is not SharedTile:
+            tile._attach(self, position)
+            self._pipes[position] = tile
+        return tile
+
+    def pipe_in_position(self, position):
+        """ Returns the pipe in the given position of the game board, or None if there isn't one."""
+        if position is None:
+            return None
+        cell = self._cells[position[0] * self._cols + position[1]]
+        if _PACKED_IS_PIPE[cell]:
+            return self.get_pipe(position)
+
+    def position_in_direction(self, direction, position):
+        """ Returns the opposite direction and the position in direction from the given position.
+
+                Parameters:
+                    direction (str): 'N', 'E', 'S' or 'W'.
+                    position (tuple<int, int>): A tuple in form (row, col).
+
+                Returns:
+                    tuple<char, tuple<int, int>>: The opposite direction and the new position.
+                    None: If the direction or the new position is invalid.
+        """
+        if direction is None or len(direction) != 1 or direction not in DIRECTIONS:
+            return None
+        side = DIRECTIONS.index(direction)
+        index = self._neighbour_index(position[0] * self._cols + position[1], side)
+        if index < 0:
+            return None
+        return (DIRECTIONS[(side + 2) % 4], divmod(index, self._cols))
+
+    def _neighbour_index(self, index, side):
+        """ Returns the flat index next to index on the given side (0 to 3), or -1 off the board."""
+        cols = self._cols
+        if side == 0:
+            return index - cols if index >= cols else -1
+        elif side == 1:
+            return index + 1 if (index + 1) % cols else -1
+        elif side == 2:
+            return index + cols if index + cols < len(self._cells) else -1
+        return index - 1 if index % cols else -1
+
+    def check_win(self):
+        """
+            (bool) Returns True if the player has won the game False otherwise.
+
+            Searches the packed board directly using the exit masks in _PACKED_EXITS,
+            following the water from every start pipe at once.
+        """
+        if not self._starting_positions or not self._ending_positions:
+            return False
+
+        cells = self._cells
+        cols = self._cols
+        # The states, index * 4 + side, water must reach in each end pipe.
+        remaining = set()
+        for end in self._ending_positions:
+            end_index = end[0] * cols + end[1]
+            end_side = DIRECTIONS.index(END_CONNECTIONS[(cells[end_index] >> 4) & 3][0])
+            remaining.add(end_index * 4 + (end_side + 2) % 4)
+        if self._win_condition == WIN_ALL_STARTS:
+            return self._connected_start_count(self._search_back(remaining)) == len(self._starting_positions)
+        self._search_flow(remaining)
+        return not remaining
+
+    def _search_flow(self, remaining):
+        """ Follows the water from every start pipe, taking the states it reaches out of
+            remaining and stopping as soon as remaining is empty.
+
+                Parameters:
+                    remaining (set<int>): The states, index * 4 + side, still to be reached.
+
+                Returns:
+                    set<int>: The states the search visited.
+        """
+        cells = self._cells
+        # Side 4 is the start pipe, which water doesn't enter through any side.
+        stack = [(start[0] * self._cols + start[1], 4) for start in self._starting_positions]
+        discovered = set()
+        while stack:
+            index, side = stack.pop()
+            for direction in _MASK_SIDES[_PACKED_EXITS[cells[index]][side]]:
+                neighbour = self._neighbour_index(index, direction)
+                if neighbour < 0:
+                    continue
+                new_side = (direction + 2) % 4
+                state = neighbour * 4 + new_side
+                if state in discovered:
+                    continue
+                discovered.add(state)
+                remaining.discard(state)
+                if not remaining:
+                    return discovered
+                stack.append((neighbour, new_side))
+        return discovered
+
+    def _search_back(self, win_states):
+        """ Follows water backwards from the end pipes, so every start pipe can be checked
+            with one search.
+
+                Parameters:
+                    win_states (set<int>): The states, index * 4 + side, that win in each end pipe.
+
+                Returns:
+                    set<int>: Every state from which water flows on to a win state.
+        """
+        cells = self._cells
+        stack = list(win_states)
+        found = set(stack)
+        while stack:
+            index, side = divmod(stack.pop(), 4)
+            # The water came out of the tile on the side it entered through.
+            source = self._neighbour_index(index, side)
+            if source < 0:
+                continue
+            leaving = 1 << ((side + 2) % 4)
+            exits = _PACKED_EXITS[cells[source]]
+            for entry in range(4):
+                state = source * 4 + entry
+                if exits[entry] & leaving and state not in found:
+                    found.add(state)
+                    stack.append(state)
+        return found
+
+    def _connected_start_count(self, found):
+        """ Counts the start pipes whose water reaches an end pipe.
+
+                Parameters:
+                    found (set<int>): The states _search_back found.
+
+                Returns:
+                    int: The number of connected start pipes.
+        """
+        connected = 0
+        for start in self._starting_positions:
+            index = start[0] * self._cols + start[1]
+            for direction in _MASK_SIDES[_PACKED_EXITS[self._cells[index]][4]]:
+                neighbour = self._neighbour_index(index, direction)
+                if neighbour >= 0 and neighbour * 4 + (direction + 2) % 4 in found:
+                    connected += 1
+                    break
+        return connected
+
+    def _flow_states(self):
+        """ (set<tuple<int, int>>) The (flat index, side) states water reaches, found by
+            searching the packed board like check_win.
+        """
+        cells = self._cells
+        stack = [(start[0] * self._cols + start[1], 4) for start in self._starting_positions]
+        discovered = set(stack)
+        while stack:
+            index, side = stack.pop()
+            for direction in _MASK_SIDES[_PACKED_EXITS[cells[index]][side]]:
+                neighbour = self._neighbour_index(index, direction)
+                if neighbour < 0:
+                    continue
+                state = (neighbour, (direction + 2) % 4)
+                if state not in discovered:
+                    discovered.add(state)
+                    stack.append(state)
+        return discovered
+
+    def _reset_flow(self):
+        """ Packed boards don't keep a flow, check_win searches the packed board instead."""
+
+    def _update_flow(self, position):
+        """ Packed boards don't keep a flow, check_win searches the packed board instead."""
+
+    def _pipe_rotated(self, position, direction):
+        """ Writes the new orientation of a rotated pipe back into the packed board."""
+        self._cells[position[0] * self._cols + position[1]] = _pack_tile(self._pipes[position])
+        super()._pipe_rotated(position, direction)
+
+    def _replace_tile(self, position, tile):
+        """ Packs tile into the board at position.
+
+                Parameters:
+                    position (tuple<int, int>): The (row, col) to place the tile at.
+                    tile (Tile obj): The tile (or pipe) to place.
+        """
+        index = position[0] * self._cols + position[1]
+        old_pipe = self._pipes.pop(position, None)
+        if old_pipe is not None:
+            old_pipe._detach()
+        self._forget_cell_tile(position)
+        if self._state_hash is not None:
+            self._state_hash ^= _zobrist_tile_key(index, *_unpack_tile_spec(self._cells[index]))
+
+        self._store_tile(position, tile)
+        self._hash_tile(position, tile)
+        tile._attach(self, position)
+
+    def _check_storable(self, tile):
+        """ Raises ValueError if tile has no type code, so it can't be packed."""
+        _pack_tile(tile)
+
+    def _store_tile(self, position, tile):
+        """ Packs tile into the board at position, remembering it unless it is shared."""
+        self._cells[position[0] * self._cols + position[1]] = _pack_tile(tile)
+        if tile.__class__ is not SharedTile:
+            self._pipes[position] = tile
+
+class SparsePipeGame(PipeGame):
+    """
+    A game of Pipes that only stores the tiles that aren't empty selectable tiles.
+
+    Suited to huge boards that are mostly empty, such as long corridors. Empty tiles are
+    created when get_pipe or get_board_layout asks for them.
+    """
+
+    def load_file(self, game_file):
+        """ Takes a .csv file and keeps every tile other than empty tiles in a dictionary.
+            Also sets the initial playable pipes dictionary.
+
+                Parameters:
+                    game_file (.csv): A .csv containing a structure overview
+                    of an initial game state
+
+                Returns:
+                    None: The board is kept in self._tiles rather than a board layout.
+        """
+        reader = _open_level(game_file)
+        empty_spec = TILE_CODES['#']
+
+        # Tiles by position, for every position that isn't an empty selectable tile.
+        self._tiles = {}
+        for row_num, row in enumerate(reader):
+            for col_num, tile_spec in enumerate(row):
+                if tile_spec is not empty_spec:
+                    tile = _create_tile(*tile_spec)
+                    tile._attach(self, (row_num, col_num))
+                    self._tiles[(row_num, col_num)] = tile
+
+        self._load_level_info(reader)
+
+    def _board_hash(self):
+        """ (int) The XOR of the Zobrist keys of every stored tile, as empty tiles are 0."""
+        board_hash = 0
+        for position, tile in self._tiles.items():
+            board_hash ^= self._tile_key(position, tile)
+        return board_hash
+
+    def end_pipe_positions(self):
+        """ Finds and saves the positions of the start and end pipes among the stored tiles."""
+        starting_positions = []
+        ending_positions = []
+        for position in sorted(self._tiles):
+            name = self._tiles[position].get_name()
+            if name == START_PIPE:
+                starting_positions.append(position)
+            elif name == END_PIPE:
+                ending_positions.append(position)
+        self._set_end_pipe_positions(starting_positions, ending_positions)
+
+    def _stored_tile(self, position):
+        """ (Tile) The stored tile at position, or the shared empty tile."""
+        tile = self._tiles.get(position)
+        if tile is None:
+            return _SHARED_TILES[(EMPTY_TILE, True)]
+        return tile
+
+    def pipe_in_position(self, position):
+        """ Returns the pipe in the given position of the game board, or None if there isn't one."""
+        tile = self._tiles.get(position)
+        if tile is not None and tile.get_id() != "tile":
+            return tile
+
+    def _store_tile(self, position, tile):
+        """ Stores tile at position, or forgets the position if the tile is an empty tile."""
+        if tile.get_id() == "tile" and tile.get_name() == EMPTY_TILE and tile.can_select():
+            self._tiles.pop(position, None)
+        else:
+            self._tiles[position] = tile
+
+
+class Solver:
+    """
+    Searches for the moves that connect the start pipe of a PipeGame to its end pipe.
+
+    The search follows water forward from the start pipe one tile at a time. Water going
+    through an empty selectable tile only claims the tile and notes which sides it uses, and
+    once the end pipe is reached the playable pipes are shared out between the claimed tiles,
+    so the search never branches over pipe types. Selectable pipes already on the board
+    branch over their rotations (once water has passed through a tile it is fixed), and
+    everything else just passes the water on.
+
+    Moves are tried in order of the fewest pipes needed from where they take the water to the
+    end pipe. Branches are cut when the water leaves the board, loops back on itself or can't
+    reach the end pipe with the pipes that are left, when the claimed tiles need more of some
+    kinds of pipe than there are, and when the search has already failed from the same tile
+    and side with the same kinds of pipe claimed and the tiles it ran into unchanged. With
+    split pipes (diagonals or over-under) about, routes that go through a tile twice are only
+    searched once no solution without them has been found.
+
+    Games with more than one start or end pipe aren't supported.
+    """
+
+    # Tiles the search can claim for a playable pipe, empty tiles it has claimed, pipes it may
+    # still rotate, and fixed tiles.
+    FREE, CLAIMED, ROTATABLE, FIXED, BLOCKED = range(5)
+
+    # The (straight, turn) costs of empty tiles in the distance maps the search is ordered
+    # and pruned with: every tile, tiles water goes straight through, tiles it turns in, and
+    # two mixes that notice when a route would need too many of both kinds at once.
+    BOUND_COSTS = ((1, 1), (1, 0), (0, 1), (1, 2), (2, 1))
+
+    def __init__(self, game, max_nodes=None, time_limit=None):
+        """ Snapshots a game ready to be solved. Solving doesn't change the game.
+
+                Parameters:
+                    game (PipeGame obj): The game to solve from its current state.
+                    max_nodes (int): Give up after expanding this many tiles (None for no limit).
+                    time_limit (float): Give up after this many seconds (None for no limit).
+
+                Raises:
+                    ValueError: If the game has more than one start or end pipe.
+        """
+        starts, ends = len(game.get_starting_positions()), len(game.get_ending_positions())
+        if starts > 1 or ends > 1:
+            raise ValueError(f"the solver needs at most one start and one end pipe, "
+                             f"not {starts} and {ends}")
+        self._rows, self._cols = game.get_dimensions()
+        if isinstance(game, PackedPipeGame):
+            # Read straight from the packed board rather than creating a tile for every cell.
+            tile_specs = map(_unpack_tile_spec, game._cells)
+        else:
+            tile_specs = (_tile_spec(game._stored_tile((row, col)))
+                          for row in range(self._rows) for col in range(self._cols))
+        self._names = []
+        self._orientations = []
+        self._status = []
+        for name, orientation, selectable in tile_specs:
+            self._names.append(name)
+            self._orientations.append(orientation)
+            if name in (EMPTY_TILE, LOCKED_TILE):
+                self._status.append(Solver.FREE if selectable and name == EMPTY_TILE else Solver.BLOCKED)
+            else:
+                # Like the GUI, only pipes the player can select may be rotated.
+                rotatable = selectable and name not in (START_PIPE, END_PIPE)
+                self._status.append(Solver.ROTATABLE if rotatable else Solver.FIXED)
+
+        # A count below zero (set_pipe doesn't check) just means none are left.
+        self._inventory = {name: max(count, 0)
+                           for name, count in game.get_playable_pipes().items()}
+        self._start = game.get_starting_position()
+        self._end = game.get_ending_position()
+
+        self._max_nodes = max_nodes
+        self._time_limit = time_limit
+        self.nodes_expanded = 0
+        self.timed_out = False
+
+    def solve(self):
+        """ Searches for a solution.
+
+                Returns:
+                    list<tuple>: The moves to make, in order. Each move is either
+                    ("place", position, pipe name, orientation) or ("rotate", position, turns)
+                    where turns is the number of clockwise rotations.
+                    None: If there is no solution, or the search gave up (see timed_out).
+        """
+        self.nodes_expanded = 0
+        self.timed_out = False
+        # Building the tables below counts against the time limit too.
+        deadline = None if self._time_limit is None else time.perf_counter() + self._time_limit
+        if self._start is None or self._end is None:
+            return None
+
+        cols = self._cols
+        self._find_win_state()
+        self._free_exits = self._free_exit_masks()
+        root = (self._start[0] * cols + self._start[1], 4)
+        edges = self._state_edges()
+        self._bounds = [(straight_cost, turn_cost,
+                         self._state_distance_map(edges, straight_cost, turn_cost))
+                        for straight_cost, turn_cost in Solver.BOUND_COSTS]
+        self._state_distances = self._bounds[0][2]
+        self._distances = self._distance_map()
+        if self._distances[root[0]] is None:
+            return None
+
+        self._capacities = [sum(self._inventory.get(name, 0)
+                                for bit, name in enumerate(_PIPE_NAMES) if types & (1 << bit))
+                            for types in range(1 << len(_PIPE_NAMES))]
+        # The sets of pipe types the claimed tiles leave room in for new straight and turning
+        # tiles, see _can_reach_end.
+        self._straight_sets = [types for types in range(len(self._capacities))
+                               if types & _STRAIGHT_PIPES == _STRAIGHT_PIPES]
+        self._turn_sets = [types for types in range(len(self._capacities))
+                           if types & _TURN_PIPES == _TURN_PIPES]
+
+        # Only split pipes can make a solution go through a tile twice. With any about, the
+        # search first looks for a solution that doesn't, which the strong bounds of
+        # _can_reach_end find quickly, and only searches every route if there isn't one.
+        split = any(self._inventory.get(name, 0) or name in self._names for name in _SPLIT_PIPES)
+        for simple_routes in ((True, False) if split else (True,)):
+            moves = self._search(root, simple_routes, deadline)
+            if moves is not None or self.timed_out:
+                return moves
+        return None
+
+    def _search(self, root, simple_routes, deadline):
+        """ Searches depth first from the start pipe for the moves that win, see solve.
+
+                Parameters:
+                    root (tuple<int, int>): The (flat index, side) state of the start pipe.
+                    simple_routes (bool): Prune as if no solution takes water through a
+                    tile twice, see _can_reach_end.
+                    deadline (float): The time.perf_counter() to give up at (None for never).
+
+                Returns:
+                    list<tuple>: The moves, in the format of solve.
+                    None: If there is no such solution, or the search gave up.
+        """
+        # Whether the bounds assume routes never go through a tile twice, and whether every
+        # tile such a route goes through needs a new pipe.
+        self._simple_routes = simple_routes
+        ends = (root[0], self._win_state[0])
+        self._open_board = simple_routes and all(
+            status in (Solver.FREE, Solver.BLOCKED) or index in ends
+            for index, status in enumerate(self._status))
+
+        # The sides claimed tiles take water through, and how many claimed tiles could only
+        # hold each set of pipe types (keyed by _covering_pipes masks).
+        self._claims = {}
+        self._claimed_types = {}
+        self._pipes_left = sum(self._inventory.values())
+        self._board_hash = 0
+        # The tiles the search ran into after each (state, pipes key) it failed from, with
+        # what the path had done to them, see _failure_key.
+        self._failed = {}
+
+        on_path = {root}
+        moves = []
+        # Each frame is [state, choices, next choice, change made for the current child,
+        # tiles the search from the state has run into].
+        stack = [[root, self._choices(*root), 0, None, set()]]
+        while stack:
+            frame = stack[-1]
+            if frame[3] is not None:
+                self._undo(frame[3], moves)
+                frame[3] = None
+
+            state, choices, choice_num = frame[0], frame[1], frame[2]
+            if choice_num == len(choices):
+                # Nothing after this state worked, and nothing will from any path that
+                # leaves the same pipes and does the same to the tiles run into.
+                on_path.discard(state)
+                stack.pop()
+                marks = {}
+                for index in frame[4]:
+                    mark = self._path_mark(index, on_path)
+                    if mark is not None:
+                        marks[index] = mark
+                self._failed[(state, self._failure_key())] = marks
+                if stack:
+                    stack[-1][4].update(marks)
+                continue
+            frame[2] += 1
+
+            change, new_state = choices[choice_num]
+            frame[4].add(new_state[0])
+            if new_state in on_path:
+                continue
+            self._apply(change, moves)
+            if not self._pipes_suffice(change):
+                self._undo(change, moves)
+                continue
+            if new_state == self._win_state:
+                return self._place_pipes(moves)
+            if not self._can_reach_end(new_state):
+                self._undo(change, moves)
+                continue
+            marks = self._failed.get((new_state, self._failure_key()))
+            if marks is not None and all(self._path_mark(index, on_path) == mark
+                                         for index, mark in marks.items()):
+                frame[4].update(marks)
+                self._undo(change, moves)
+                continue
+
+            self.nodes_expanded += 1
+            if ((self._max_nodes is not None and self.nodes_expanded > self._max_nodes) or
+                    (deadline is not None and self.nodes_expanded % 1024 == 0 and
+                     time.perf_counter() > deadline)):
+                self.timed_out = True
+                return None
+
+            frame[3] = change
+            on_path.add(new_state)
+            stack.append([new_state, self._choices(*new_state), 0, None, set()])
+        return None
+
+    def hint(self, flow):
+        """ Picks the one move that takes the water closest to the end pipe.
+
+                Only tiles the water already reaches are considered, so nothing is searched
+                beyond the flow and the distance map.
+
+                Parameters:
+                    flow (iterable<tuple<int, int>>): The (flat index, side) states water
+                    reaches on the game, side 4 being the start pipe.
+
+                Returns:
+                    tuple: The move in the format of solve.
+                    None: If no move brings the water any closer to the end pipe.
+        """
+        if self._start is None or self._end is None:
+            return None
+        self._find_win_state()
+        self._free_exits = self._free_exit_masks()
+        distances = self._state_distance_map(self._state_edges())
+
+        best = None
+        for index, side in flow:
+            status = self._status[index]
+            if side == 4 or status not in (Solver.FREE, Solver.ROTATABLE):
+                continue
+            # How close the water gets with each change to this tile.
+            scores = {}
+            for change, exits in self._options(index, side):
+                for direction in _MASK_SIDES[exits]:
+                    neighbour = self._neighbour_index(index, direction)
+                    if neighbour < 0:
+                        continue
+                    score = distances[neighbour * 4 + (direction + 2) % 4]
+                    if score is not None and (change not in scores or score < scores[change]):
+                        scores[change] = score
+            # A pipe is only worth turning if that takes the water closer than it gets now.
+            current = scores.pop(("keep", index), None)
+            for change, score in scores.items():
+                if current is not None and score >= current:
+                    continue
+                # Ties go to turning a pipe, which saves the playable pipes.
+                key = (score, change[0] == "place", index)
+                if best is None or key < best[0]:
+                    best = (key, change)
+
+        if best is None:
+            return None
+        change = best[1]
+        position = divmod(change[1], self._cols)
+        if change[0] == "place":
+            return ("place", position, change[2], change[3])
+        return ("rotate", position, (change[2] - change[3]) % 4)
+
+    def _find_win_state(self):
+        """ Sets _win_state, the (flat index, side) water must enter the end pipe through."""
+        end_index = self._end[0] * self._cols + self._end[1]
+        end_side = DIRECTIONS.index(END_CONNECTIONS[self._orientations[end_index]][0])
+        self._win_state = (end_index, (end_side + 2) % 4)
+
+    def _options(self, index, side):
+        """ Lists the ways the tile at index can be changed or left for water entering by side.
+
+                Returns:
+                    list<tuple>: (change, exits) pairs, where exits is the mask of sides the
+                    water leaves through. change is None if the tile can't be changed, and
+                    ("keep", index) if a pipe that could be rotated is left as it is.
+        """
+        status = self._status[index]
+        name = self._names[index]
+        options = []
+        if status == Solver.FREE:
+            for pipe_name, count in self._inventory.items():
+                if count > 0:
+                    for orientation in _DISTINCT_ORIENTATIONS[pipe_name]:
+                        exits = CONNECTION_MASKS[pipe_name][orientation][side]
+                        options.append((("place", index, pipe_name, orientation), exits))
+        elif status == Solver.ROTATABLE:
+            current = self._orientations[index]
+            for orientation in _DISTINCT_ORIENTATIONS[name]:
+                if CONNECTION_MASKS[name][orientation] == CONNECTION_MASKS[name][current]:
+                    change = ("keep", index)
+                else:
+                    change = ("rotate", index, orientation, current)
+                options.append((change, CONNECTION_MASKS[name][orientation][side]))
+        elif status == Solver.FIXED:
+            options.append((None, _exit_mask(name, self._orientations[index], side)))
+        return options
+
+    def _choices(self, index, side):
+        """ Lists the ways water entering the tile at index through side can carry on.
+
+                Returns:
+                    list<tuple>: (change, (next index, next side)) pairs, most promising first.
+                    change is None if the tile is left as it is.
+        """
+        if self._status[index] in (Solver.FREE, Solver.CLAIMED):
+            # Water through an empty tile claims it for one of the pipes that go that way.
+            claims = self._claims.get(index, 0)
+            options = [(("claim", index, claims, claims | 1 << (side * 4 + exit_side)),
+                        1 << exit_side) for exit_side in _MASK_SIDES[self._free_exits[side]]]
+        else:
+            options = self._options(index, side)
+
+        distances = self._state_distances
+        choices = []
+        for change, exits in options:
+            for direction in _MASK_SIDES[exits]:
+                neighbour = self._neighbour_index(index, direction)
+                if neighbour >= 0 and distances[neighbour * 4 + (direction + 2) % 4] is not None:
+                    choices.append((change, (neighbour, (direction + 2) % 4)))
+        # Try the moves that head towards the end pipe first, then the ones that claim no tile.
+        choices.sort(key=lambda choice: (distances[choice[1][0] * 4 + choice[1][1]],
+                                         choice[0] is not None and choice[0][0] == "claim" and
+                                         not choice[0][2]))
+        return choices
+
+    def _apply(self, change, moves):
+        """ Makes a change to the snapshot and records the move for it."""
+        if change is None:
+            return
+        index = change[1]
+        position = divmod(index, self._cols)
+        if change[0] == "claim":
+            old_claims, claims = change[2], change[3]
+            self._claims[index] = claims
+            self._board_hash ^= (_zobrist_claim_key(index, old_claims) ^
+                                 _zobrist_claim_key(index, claims))
+            if old_claims:
+                self._claimed_types[_covering_pipes(old_claims)] -= 1
+            else:
+                self._status[index] = Solver.CLAIMED
+                self._pipes_left -= 1
+                # The pipe is picked once the search is over.
+                moves.append(("place", position))
+            types = _covering_pipes(claims)
+            self._claimed_types[types] = self._claimed_types.get(types, 0) + 1
+        else:
+            # Water has passed through the pipe, so it can't be rotated any more.
+            self._status[index] = Solver.FIXED
+            orientation = change[2] if change[0] == "rotate" else self._orientations[index]
+            self._board_hash ^= _zobrist_tile_key(index, self._names[index], orientation, False)
+            if change[0] == "rotate":
+                self._orientations[index] = orientation
+                moves.append(("rotate", position, (change[2] - change[3]) % 4))
+
+    def _undo(self, change, moves):
+        """ Reverts a change made by _apply."""
+        if change is None:
+            return
+        index = change[1]
+        if change[0] == "claim":
+            old_claims, claims = change[2], change[3]
+            self._claimed_types[_covering_pipes(claims)] -= 1
+            self._board_hash ^= (_zobrist_claim_key(index, old_claims) ^
+                                 _zobrist_claim_key(index, claims))
+            if old_claims:
+                self._claims[index] = old_claims
+                self._claimed_types[_covering_pipes(old_claims)] += 1
+            else:
+                del self._claims[index]
+                self._status[index] = Solver.FREE
+                self._pipes_left += 1
+                moves.pop()
+        else:
+            self._status[index] = Solver.ROTATABLE
+            orientation = change[2] if change[0] == "rotate" else self._orientations[index]
+            self._board_hash ^= _zobrist_tile_key(index, self._names[index], orientation, False)
+            if change[0] == "rotate":
+                self._orientations[index] = change[3]
+                moves.pop()
+
+    def _failure_key(self):
+        """ (tuple) The claimed tiles' pipe types, which with the state decide what the search
+            can do from it apart from the tiles it runs into.
+
+                With _simple_routes the search only follows routes that never go through a
+                tile the path has been through, so tiles the path changes only take routes
+                away from the search and a failure still holds if the tiles it ran into are
+                as they were. Otherwise water may need to go back through them, so the
+                whole board must be the same.
+        """
+        key = tuple(sorted(item for item in self._claimed_types.items() if item[1]))
+        return key if self._simple_routes else (key, self._board_hash)
+
+    def _path_mark(self, index, on_path):
+        """ (tuple) What the path has done to the tile at index (None if the path hasn't been
+            through it).
+        """
+        sides = tuple(side for side in range(5) if (index, side) in on_path)
+        if not sides:
+            return None
+        return sides, self._claims.get(index, 0), self._status[index], self._orientations[index]
+
+    def _pipes_suffice(self, change):
+        """ (bool) Whether the playable pipes can still go round the claimed tiles after a change.
+
+                Every set of pipe types must have at least as many pipes as there are claimed
+                tiles that could only hold those types (Hall's condition). Only the sets that
+                include the types of the tile just claimed can have stopped holding.
+        """
+        if change is None or change[0] != "claim":
+            return True
+        types = _covering_pipes(change[3])
+        counts = self._claimed_types.items()
+        subset = types
+        while subset < len(self._capacities):
+            claimed = sum(count for claimed_types, count in counts if claimed_types & ~subset == 0)
+            if claimed > self._capacities[subset]:
+                return False
+            subset = (subset + 1) | types
+        return True
+
+    def _place_pipes(self, moves):
+        """ Picks a playable pipe for every claimed tile, now that the water reaches the end pipe.
+
+                Parameters:
+                    moves (list<tuple>): The moves of the search, with ("place", position) for
+                    each claimed tile.
+
+                Returns:
+                    list<tuple>: The moves with every claimed tile's pipe name and orientation.
+        """
+        # Matches the claimed tiles to pipes, moving tiles to other pipe types to make room.
+        holders = {name: [] for name in _PIPE_NAMES}
+        pipes = {}
+
+        def find_pipe(index, tried):
+            """ (bool) Gives the tile at index a pipe of a type not in tried, if it can."""
+            types = _covering_pipes(self._claims[index])
+            for bit, name in enumerate(_PIPE_NAMES):
+                if not types & (1 << bit) or name in tried:
+                    continue
+                tried.add(name)
+                if len(holders[name]) >= self._inventory.get(name, 0):
+                    for other in holders[name]:
+                        if find_pipe(other, tried):
+                            holders[name].remove(other)
+                            break
+                    else:
+                        continue
+                holders[name].append(index)
+                pipes[index] = name
+                return True
+            return False
+
+        for index in self._claims:
+            find_pipe(index, set())
+
+        placed = []
+        for move in moves:
+            if move[0] == "place":
+                index = move[1][0] * self._cols + move[1][1]
+                name = pipes[index]
+                orientation = next(orientation for orientation in _DISTINCT_ORIENTATIONS[name]
+                                   if self._claims[index] & ~_PAIR_MASKS[name][orientation] == 0)
+                move = ("place", move[1], name, orientation)
+            placed.append(move)
+        return placed
+
+    def _can_reach_end(self, state):
+        """ (bool) Whether the playable pipes left could get water from state to the end pipe.
+
+                The distances from the original board count claimed tiles as empty, and water
+                can go back through a claimed tile without another pipe, so in general a
+                route may need as many fewer pipes as there are claimed tiles. When that
+                leaves too few pipes for the distance, _claimed_route_cost finds the best
+                route with the claimed tiles free.
+
+                With _simple_routes, the bounds assume the route doesn't go through a tile
+                twice. Without split pipes no solution needs to, as a route that does could
+                skip what it did in between, and then the pipes on the skipped tiles aren't
+                needed. With split pipes the two ways through a tile may not join up, so
+                solve searches again without _simple_routes if nothing is found. Each empty
+                tile of the route needs a new pipe from _STRAIGHT_PIPES or _TURN_PIPES, and
+                by Hall's condition the claimed tiles leave room for at most `straights` and
+                `turns` of them, which no map in _bounds can need more than. On an open
+                board, where every tile of the route is empty, the counts are also rounded
+                down to the odd or even numbers the route must have.
+        """
+        needed = self._distances[state[0]]
+        if needed is None:
+            return False
+        if not self._simple_routes:
+            if needed <= self._pipes_left:
+                return True
+            if needed - len(self._claims) > self._pipes_left:
+                return False
+            return self._claimed_route_cost(state[0], self._pipes_left) <= self._pipes_left
+
+        counts = list(self._claimed_types.items())
+
+        def room(type_sets):
+            """ (int) The fewest pipes left over in any of type_sets after the claimed tiles."""
+            return min(self._capacities[types] -
+                       sum(count for claimed, count in counts if claimed & ~types == 0)
+                       for types in type_sets)
+
+        straights = room(self._straight_sets)
+        turns = room(self._turn_sets)
+        pipes_left = self._pipes_left
+        if self._open_board:
+            # A route turns an odd number of times if it has to leave along the other axis
+            # to the one it came in on, and goes through as many tiles as there are steps
+            # to the end pipe, give or take an even number.
+            row, col = divmod(state[0], self._cols)
+            tiles = abs(row - self._end[0]) + abs(col - self._end[1])
+            turn_parity = (state[1] - self._win_state[1]) % 2
+            turns -= (turns - turn_parity) % 2
+            straights -= (straights - tiles + turn_parity) % 2
+            pipes_left -= (pipes_left - tiles) % 2
+        if turns < 0 or straights < 0 or needed > pipes_left:
+            return False
+        index = state[0] * 4 + state[1]
+        return all(distances[index] is not None and
+                   distances[index] <= straight_cost * straights + turn_cost * turns
+                   for straight_cost, turn_cost, distances in self._bounds)
+
+    def _claimed_route_cost(self, index, limit):
+        """ Finds the fewest unclaimed empty tiles water must go through from the tile at index
+            to the end pipe, when it may go back through claimed tiles for free.
+
+                Like _distance_map, but claimed tiles cost nothing, so it stays a lower bound
+                however many times a route goes through the tiles the path has claimed.
+
+                Parameters:
+                    index (int): The flat index of the tile the water is in.
+                    limit (int): Routes costing more than this aren't followed.
+
+                Returns:
+                    int: The cost of the best route, or limit + 1 if there isn't one within limit.
+        """
+        last = self._last_index
+        leaving = self._leaving
+        entering = self._entering
+        status = self._status
+        costs = {index: int(status[index] == Solver.FREE)}
+        # 0-1 breadth first search, with states left behind in a costlier spot skipped.
+        queue = collections.deque([(costs[index], index)])
+        while queue:
+            cost, tile = queue.popleft()
+            if cost != costs[tile]:
+                continue
+            if tile == last:
+                return cost
+            for side in _MASK_SIDES[leaving[tile]]:
+                neighbour = self._neighbour_index(tile, side)
+                if neighbour < 0 or not entering[neighbour] & (1 << ((side + 2) % 4)):
+                    continue
+                step = status[neighbour] == Solver.FREE
+                new_cost = cost + step
+                if new_cost > limit:
+                    continue
+                old_cost = costs.get(neighbour)
+                if old_cost is None or new_cost < old_cost:
+                    costs[neighbour] = new_cost
+                    if step:
+                        queue.append((new_cost, neighbour))
+                    else:
+                        queue.appendleft((new_cost, neighbour))
+        return limit + 1
+
+    def _tile_exits(self, index, side):
+        """ (int) The mask of sides water entering the tile at index by side could leave by."""
+        status = self._status[index]
+        if status in (Solver.FREE, Solver.CLAIMED):
+            return self._free_exits[side]
+        elif status == Solver.ROTATABLE:
+            return _ROTATED_EXITS[self._names[index]][side]
+        elif status == Solver.FIXED:
+            return _exit_mask(self._names[index], self._orientations[index], side)
+        return 0
+
+    def _distance_map(self):
+        """ Finds the fewest unclaimed empty tiles water must go through from each tile to the end.
+
+                Water only goes from a tile to the next if it can leave the tile that way and
+                go on from the next one, but which side it entered a tile through isn't
+                tracked, so every route water can take is counted and the map stays a lower
+                bound even if a route goes through the same tile twice.
+
+                Returns:
+                    list<int | None>: For each flat index, the number of empty tiles on the
+                    best route from the tile to the end, the tile included (None if there is
+                    no route).
+        """
+        size = len(self._status)
+        # The sides water could leave each tile through, and the sides it could enter through.
+        leaving = [0] * size
+        entering = [0] * size
+        for index in range(size):
+            for side in range(4):
+                exits = self._tile_exits(index, side)
+                leaving[index] |= exits
+                if exits:
+                    entering[index] |= 1 << side
+
+        # Kept for _claimed_route_cost.
+        self._leaving = leaving
+        self._entering = entering
+        distances = [None] * size
+        end_index, win_side = self._win_state
+        last = self._neighbour_index(end_index, win_side)
+        self._last_index = last
+        if last < 0 or not leaving[last] & (1 << ((win_side + 2) % 4)):
+            return distances
+        distances[last] = 1 if self._status[last] == Solver.FREE else 0
+        queue = collections.deque([last])
+        while queue:
+            index = queue.popleft()
+            for side in _MASK_SIDES[entering[index]]:
+                neighbour = self._neighbour_index(index, side)
+                if neighbour < 0 or not leaving[neighbour] & (1 << ((side + 2) % 4)):
+                    continue
+                distance = distances[index] + (self._status[neighbour] == Solver.FREE)
+                if distances[neighbour] is None or distance < distances[neighbour]:
+                    distances[neighbour] = distance
+                    # 0-1 breadth first search: free steps go to the front of the queue.
+                    if distance == distances[index]:
+                        queue.appendleft(neighbour)
+                    else:
+                        queue.append(neighbour)
+        return distances
+
+    def _free_exit_masks(self):
+        """ (list<int>) The sides water could leave an empty tile through with any of the
+            playable pipes left, by entry side.
+        """
+        free_exits = [0] * 4
+        for name, count in self._inventory.items():
+            if count > 0:
+                for orientation in range(4):
+                    for side in range(4):
+                        free_exits[side] |= CONNECTION_MASKS[name][orientation][side]
+        return free_exits
+
+    def _state_edges(self):
+        """ Finds where water entering each tile through each side could have come from.
+
+                Unlike _distance_map, water only leaves a tile through the sides it could with
+                the pipes that tile may hold, so fixed pipes that don't connect are dead ends.
+
+                Returns:
+                    list<list<tuple<int, int>>>: For each state index * 4 + side, the
+                    (state, kind) pairs water could come from, where kind is 0 if it went
+                    through a pipe on the board, 1 if it went straight through an empty tile
+                    and 2 if it turned in one.
+        """
+        status = self._status
+        edges = [[] for _ in range(len(status) * 4)]
+        for source in range(len(status)):
+            free = status[source] == Solver.FREE
+            for entry in range(4):
+                for leaving in _MASK_SIDES[self._tile_exits(source, entry)]:
+                    neighbour = self._neighbour_index(source, leaving)
+                    if neighbour < 0:
+                        continue
+                    kind = 0 if not free else 1 if leaving == (entry + 2) % 4 else 2
+                    edges[neighbour * 4 + (leaving + 2) % 4].append((source * 4 + entry, kind))
+        return edges
+
+    def _state_distance_map(self, edges, straight_cost=1, turn_cost=1):
+        """ Finds the cheapest way to get water entering each tile through each side to the
+            end pipe, where each empty tile water goes straight through costs straight_cost
+            and each empty tile it turns in costs turn_cost.
+
+                A route may go through an empty tile more than once with one pipe, so the
+                costs are only lower bounds if no pipe can take water more than one way.
+
+                Parameters:
+                    edges (list<list<tuple<int, int>>>): The moves water can make, from
+                    _state_edges.
+
+                Returns:
+                    list<int | None>: For each state index * 4 + side, the cost of the best
+                    route from the state to the end (None if there is no route).
+        """
+        costs = (0, straight_cost, turn_cost)
+        distances = [None] * len(edges)
+        win = self._win_state[0] * 4 + self._win_state[1]
+        distances[win] = 0
+        # Works backwards from the end, a bucket of states for each cost. Buckets are added
+        # to while they are gone through, and states left behind in a costlier one skipped.
+        buckets = [[win]]
+        for distance, bucket in enumerate(buckets):
+            for state in bucket:
+                if distances[state] != distance:
+                    continue
+                for source, kind in edges[state]:
+                    new_distance = distance + costs[kind]
+                    if distances[source] is None or new_distance < distances[source]:
+                        distances[source] = new_distance
+                        while len(buckets) <= new_distance:
+                            buckets.append([])
+                        buckets[new_distance].append(source)
+        return distances
+
+    def _neighbour_index(self, index, side):
+        """ Returns the flat index next to index on the given side (0 to 3), or -1 off the board."""
+        cols = self._cols
+        if side == 0:
+            return index - cols if index >= cols else -1
+        elif side == 1:
+            return index + 1 if (index + 1) % cols else -1
+        elif side == 2:
+            return index + cols if index + cols < len(self._status) else -1
+        return index - 1 if index % cols else -1
+
     
     
 class Tile:
@@ -297,6 +2488,11 @@ class Tile:
     Class definining Tile objects. Every grid on the board is a instance of the tile object.
     """
 
+    # Boards hold a tile per cell, so tiles have no per-instance __dict__. Games only keep
+    # weak references to the tiles they hand out.
+    __slots__ = ("_name", "_selectable", "_game", "_position", "__weakref__")
+    _ID = "tile"
+
     def __init__(self, name, selectable = True):
         """ Instantiates a Tile
 
@@ -310,7 +2506,10 @@ class Tile:
         """
         self._name = name
         self._selectable = selectable
-        self._ID = "tile"
+
+        # The game (and position) to tell about changes once a game has handed the tile out.
+        self._game = None
+        self._position = None
 
     def get_name(self):
         """ Returns the name of the tile instance
@@ -344,7 +2543,11 @@ class Tile:
                 Returns:
                     Void             
         """
-        self._selectable = select
+        if self._game is not None:
+            # The game changes the tile, so that its state hash and views see it.
+            self._game.set_selectable(self._position, select)
+        else:
+            self._selectable = select
 
 
     def can_select(self):
@@ -373,29 +2576,59 @@ class Tile:
         """ Equivalent functionality as __str__ above."""
         return str(self)
 
+    def _attach(self, game, position):
+        """ Remembers the game and position so that changes to the tile update the game."""
+        self._game = game
+        self._position = position
+
+    def _detach(self):
+        """ Forgets the game the tile was placed in."""
+        self._game = None
+        self._position = None
+
+
+class SharedTile(Tile):
+    """
+    An empty or locked tile shared by every cell like it, as those cells can't be told apart.
+
+    Changing one would change every cell sharing it, so its selectability can't be set.
+    PipeGame.get_pipe hands out a copy for the cell instead, which can be changed.
+    """
+
+    __slots__ = ()
+
+    def _attach(self, game, position):
+        """ Shared tiles are on many cells at once, so they don't remember one."""
+
+    def set_select(self, select):
+        """ Shared tiles can't be changed.
+
+                Raises:
+                    TypeError: Always, pointing to PipeGame.set_selectable.
+        """
+        raise TypeError(f"{self} is shared by every cell like it, "
+                        "use PipeGame.get_pipe(position) to get a copy that can be changed")
+
+
+# The shared tile for each (name, selectable) of the tiles in a game file that can't change.
+_SHARED_TILES = {(EMPTY_TILE, True): SharedTile(EMPTY_TILE, True),
+                 (LOCKED_TILE, False): SharedTile(LOCKED_TILE, False)}
+
 
 
 class Pipe(Tile):
     """ Class defining the Pipe object. Corresponds to a pipe in game."""
 
+    __slots__ = ("_orientation",)
+    _ID = "pipe"
+
+    # Only works in orientation of 0. Static variable.
+    CONNECTIONS = PIPE_CONNECTIONS
+
     def __init__(self, name, orientation = 0, selectable = True):
         """ Constructor method for Pipe instances"""
         super().__init__(name, selectable)
         self._orientation = orientation
-        self._ID = "pipe"
-
-        # Only works in orientation of 0. Static variable.
-        Pipe.CONNECTIONS = {
-            "straight": {'N': ['S'], 'S': ['N']},
-            "corner": {'N': ['E'], 'E': ['N']},
-
-            "cross" : {'N': ['S', 'E', 'W'], 'E': ['N', 'S', 'W'],
-                        'S': ['N', 'E', 'W'], "W": ['N', 'S', 'E']},
-
-            "junction-t": {'S': ['E', 'W'], 'E': ['S', 'W'], 'W': ['S', 'E']},
-            "diagonals": {'N': ['E'], 'E': ['W'], 'S': ['W'], 'W': ['S']},
-            "over-under": {'N': ['S'], 'E': ['W'], 'S': ['N'], 'W': ['E']}
-        }
 
     def get_connected(self, side):
         """ Returns a list containing all of the sides that connect to the given side.
@@ -409,21 +2642,11 @@ class Pipe(Tile):
                     list<str>: a list of characters corresponding to sides of the tile.
                     empty list if input is invalid or no sides connect.
         """
-        # Convert side to the side it corresponds to if the orientation was 0
-        standard_side = Pipe.convert_orientation(side, self._orientation, 0)
-
-        # Find the connections dictionary that is relevant to the pipe.
-        standard_connections_dict = Pipe.CONNECTIONS.get(self._name, None)
-        if standard_connections_dict is None or standard_side is None:
-            return []
-        # Get the list of sides that are connected to the standard side.
-        standard_connections = standard_connections_dict.get(standard_side)
-        if standard_connections is not None:
-            # For every standard side in the standard connection list 
-            # convert it back to the original orientation and return it
-            return [Pipe.convert_orientation(i, 0, self._orientation) for i in standard_connections]
-        else:
+        # The connections of every orientation are precomputed in CONNECTION_TABLE.
+        orientations = CONNECTION_TABLE.get(self._name)
+        if orientations is None:
             return []
+        return list(orientations[self._orientation].get(side, ()))
 
 
     @staticmethod
@@ -442,15 +2665,10 @@ class Pipe(Tile):
             e.g. convert_orientation('E', 1, 0) --> 'N'
                 Because at the orientation of 1, east is the top most side.
         """
-        if current_side not in "NSEW":
+        if current_side is None or len(current_side) != 1 or current_side not in DIRECTIONS:
             return None
-        elif current_orientation == new_orientation:
-            return current_side
-
-        directions = ["NESW", "ESWN", "SWNE", "WNES"]
-        side_index = directions[current_orientation].find(current_side)
-        converted_side = directions[new_orientation][side_index]
-        return converted_side
+        side_index = DIRECTIONS.index(current_side)
+        return DIRECTIONS[(side_index - current_orientation + new_orientation) % 4]
 
 
     def rotate(self, direction):
@@ -468,6 +2686,11 @@ class Pipe(Tile):
             self._orientation += 1 if self._orientation != 3 else -3
         elif direction < 0:
             self._orientation -= 1 if self._orientation != 0 else -3
+        else:
+            return
+
+        if self._game is not None:
+            self._game._pipe_rotated(self._position, 1 if direction > 0 else -1)
 
     def get_orientation(self):
         """ Getter method for the orientation of the pipe 
@@ -502,10 +2725,12 @@ class SpecialPipe(Pipe):
     """ Abstract class for the two child classes EndPipe and StartPipe.
     """
 
+    __slots__ = ()
+    _ID = "special_pipe"
+
     def __init__(self, name, orientation = 0):
         """ Constructor method for Special Pipe instances"""
         super().__init__(name, orientation, selectable = False)
-        self._ID = "special_pipe"
 
 
     def __str__(self):
@@ -530,6 +2755,8 @@ class StartPipe(SpecialPipe):
     Class defining the attributes of the pipe from which the game starts.
     """
 
+    __slots__ = ()
+
     def __init__(self, orientation = 0):
         """ Constructor method for StartPipe instances"""
         super().__init__("start", orientation)
@@ -545,7 +2772,7 @@ class StartPipe(SpecialPipe):
                 Returns:
                     char: The direction that the start pipe is facing (N, S, E or W)
         """
-        return ["NESW"[self._orientation]]
+        return list(START_CONNECTIONS[self._orientation])
 
 
 class EndPipe(SpecialPipe):
@@ -553,6 +2780,8 @@ class EndPipe(SpecialPipe):
         Child class of Pipe and SpecialPipe. Defines methods unique for end pipes in the game.
     """
 
+    __slots__ = ()
+
     def __init__(self, orientation = 0):
         """ Constructor method for End Pipe instances"""
         super().__init__("end", orientation)
@@ -570,7 +2799,12 @@ class EndPipe(SpecialPipe):
                 Returns:
                     char: The direction that the start pipe is facing (N, S, E or W)
         """
-        return ["SWNE"[self._orientation]]
+        return list(END_CONNECTIONS[self._orientation])
+
+
+# Profiling is opt-in, see instrumentation.py.
+if instrumentation.is_enabled():
+    instrumentation.instrument(sys.modules[__name__])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+"""
+Batch solvability checker for level packs.
+
+Loads every game_*.csv file in the given directories with PipeGame.load_file, checks
+whether each level is already won and whether it can be solved, and writes one JSON
+line per level to the report as soon as that level is done.
+
+Usage:
+    python batch_check.py levels/ --output report.jsonl --workers 8 --timeout 10
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+from a2 import PipeGame, Solver
+
+
+def find_levels(paths, pattern_prefix="game_", pattern_suffix=".csv"):
+    """Yield the level files in the given directories (and any files given directly).
+
+    Parameters:
+        paths (list<str>): Directories to search and level files to include.
+        pattern_prefix (str): Start of the name of level files in directories.
+        pattern_suffix (str): End of the name of level files in directories.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+                if (entry.is_file() and entry.name.startswith(pattern_prefix)
+                        and entry.name.endswith(pattern_suffix)):
+                    yield entry.path
+        else:
+            yield path
+
+
+def check_level(game_file, timeout=None, max_nodes=None):
+    """Load and solve a single level.
+
+    Runs in a worker process, so everything it returns must be picklable.
+
+    Parameters:
+        game_file (str): Name of the game file.
+        timeout (float): Seconds the level may take to load and solve (None for no limit).
+        Loading can't be stopped part way, but the time it takes is taken off the time
+        the solver is given.
+        max_nodes (int): Tiles the solver may expand (None for no limit).
+
+    Returns:
+        dict: The report line for the level.
+    """
+    result = {"level": game_file}
+    start = time.perf_counter()
+    try:
+        game = PipeGame(game_file)
+    except (OSError, ValueError, IndexError) as error:
+        result["error"] = f"{error.__class__.__name__}: {error}"
+        return result
+    result["load_time"] = round(time.perf_counter() - start, 6)
+    result["already_won"] = game.check_win()
+
+    time_limit = None
+    if timeout is not None:
+        time_limit = max(timeout - (time.perf_counter() - start), 0)
+    try:
+        solver = Solver(game, max_nodes, time_limit)
+    except ValueError as error:
+        # The solver can't tell whether levels with several start or end pipes can be won.
+        result["error"] = f"{error.__class__.__name__}: {error}"
+        return result
+    start = time.perf_counter()
+    moves = solver.solve()
+    result["solve_time"] = round(time.perf_counter() - start, 6)
+    result["nodes_expanded"] = solver.nodes_expanded
+
+    if moves is not None:
+        # Replay the solution to make sure the solver and check_win agree.
+        game.apply_moves(moves)
+        result["solvable"] = game.check_win()
+        result["moves"] = len(moves)
+    elif solver.timed_out:
+        # Unknown rather than unsolvable.
+        result["solvable"] = None
+        result["timed_out"] = True
+    else:
+        result["solvable"] = False
+    return result
+
+
+def run(levels, report, workers=None, timeout=None, max_nodes=None):
+    """Check levels in a process pool, writing each result to report as it finishes.
+
+    At most a few levels per worker are queued at once so memory stays bounded however
+    many levels there are.
+
+    Parameters:
+        levels (iterable<str>): Level files to check.
+        report (file): Text file to write JSON lines to.
+        workers (int): Number of worker processes (None for one per CPU).
+        timeout (float): Seconds each level may take to load and solve.
+        max_nodes (int): Tiles the solver may expand on each level.
+
+    Returns:
+        dict<str, int>: How many levels were solvable, unsolvable, timed out or failed to
+        load or check.
+    """
+    summary = {"solvable": 0, "unsolvable": 0, "timed_out": 0, "error": 0}
+    max_pending = (workers or os.cpu_count() or 1) * 4
+    # The level each pending future is checking.
+    submitted = {}
+
+    def write(future):
+        level = submitted.pop(future)
+        try:
+            result = future.result()
+        except Exception as error:
+            # A level that breaks its worker is reported like one that fails to load.
+            result = {"level": level, "error": f"{error.__class__.__name__}: {error}"}
+        report.write(json.dumps(result) + "\n")
+        report.flush()
+        if "error" in result:
+            summary["error"] += 1
+        elif result["solvable"] is None:
+            summary["timed_out"] += 1
+        elif result["solvable"]:
+            summary["solvable"] += 1
+        else:
+            summary["unsolvable"] += 1
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending = set()
+        for level in levels:
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    write(future)
+            future = executor.submit(check_level, level, timeout, max_nodes)
+            submitted[future] = level
+            pending.add(future)
+
+        for future in concurrent.futures.as_completed(pending):
+            write(future)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every level in a level pack can be solved.")
+    parser.add_argument("paths", nargs="+", help="directories of game_*.csv files, or level files")
+    parser.add_argument("-o", "--output", default="-", help="JSONL report file (default: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="seconds each level may take to load and solve; loading isn't "
+                             "stopped part way, but its time is taken off the solver's")
+    parser.add_argument("--max-nodes", type=int, default=None,
+                        help="tiles the solver may expand on each level")
+    args = parser.parse_args(argv)
+
+    levels = find_levels(args.paths)
+    if args.output == "-":
+        summary = run(levels, sys.stdout, args.workers, args.timeout, args.max_nodes)
+    else:
+        with open(args.output, "w") as report:
+            summary = run(levels, report, args.workers, args.timeout, args.max_nodes)
+
+    print(", ".join(f"{count} {name}" for name, count in summary.items()), file=sys.stderr)
+    return 1 if summary["unsolvable"] or summary["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
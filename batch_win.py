@@ -0,0 +1,155 @@
+"""
+Checks whether many boards of the same shape are won at once, with NumPy.
+
+Boards are packed one byte per tile in the same format as PackedPipeGame, so the sides
+water leaves any tile through come from one table lookup. Water spreads from all of the
+start pipes together, one step per iteration, with the tiles it has just reached on
+every board held in one array, until it has nowhere new to go.
+
+    games = [PipeGame(game_file) for game_file in submissions]
+    wins = check_games(games)      # numpy bool array, one per game
+
+When it is faster: check_wins on 8x8 boards that are already packed takes about 0.16us a
+board, against about 1.6us for PackedPipeGame.check_win, so it is about 10x faster. Packing
+a game costs more than that, so check_games is only about 1.3x faster for PackedPipeGame
+boards, and only pays off more when the packed arrays are kept and checked again.
+
+It doesn't reach the aim of being 10x faster than calling check_win on PipeGame boards, and
+can't: PipeGame keeps its flow up to date after every move, so its check_win is a lookup
+(about 0.2us), no slower than check_wins on boards that are already packed. Packing a
+PipeGame reads every tile (about 14us for an 8x8 board), so a plain loop over check_win is
+about 60x faster than check_games on PipeGame boards.
+
+Needs NumPy, which the rest of the game doesn't.
+"""
+
+import numpy as np
+
+from a2 import (DIRECTIONS, EMPTY_TILE, END_CONNECTIONS, PACKED_ORIENTATION_SHIFT, PackedPipeGame,
+                SparsePipeGame, _PACKED_EXITS, _SHARED_TILES, _pack_tile, _pack_tile_spec)
+
+# EXIT_TABLE[cell * 5 + side] is the mask of sides water leaves a packed cell through when
+# it enters through side (side 4 being the start of the flow).
+EXIT_TABLE = np.array(_PACKED_EXITS, dtype=np.uint8).ravel()
+
+# The side water must enter an end pipe through to win, by the end pipe's orientation.
+WIN_SIDES = np.array([(DIRECTIONS.index(sides[0]) + 2) % 4 for sides in END_CONNECTIONS], dtype=np.intp)
+
+# Shared tiles never change, so the packed cell of one is looked up by its identity.
+_SHARED_CELLS = {id(tile): _pack_tile(tile) for tile in _SHARED_TILES.values()}
+
+
+def _pack_board(game):
+    """ (bytes | bytearray) The packed cells of a game's board, row by row."""
+    if isinstance(game, PackedPipeGame):
+        return game._cells
+    rows, cols = game.get_dimensions()
+    if isinstance(game, SparsePipeGame):
+        packed = bytearray([_pack_tile_spec(EMPTY_TILE, 0, True)]) * (rows * cols)
+        for (row, col), tile in game._tiles.items():
+            packed[row * cols + col] = _pack_tile(tile)
+        return packed
+    packed = bytearray()
+    shared_cells = _SHARED_CELLS
+    for row in game._board_layout:
+        for tile in row:
+            cell = shared_cells.get(id(tile))
+            packed.append(cell if cell is not None else _pack_tile(tile))
+    return packed
+
+
+def pack_games(games):
+    """ Packs games with boards of the same shape into arrays.
+
+            Parameters:
+                games (list<PipeGame>): The games, of any PipeGame class.
+
+            Returns:
+                tuple<ndarray, ndarray, ndarray>: The packed cells with shape
+                (games, rows, cols), and the (row, col) of each game's start and end pipes
+                with shape (games, 2). Missing start or end pipes are (-1, -1).
+
+            Raises:
+                ValueError: If the boards aren't all the same shape, or a game has more than
+                one start or end pipe.
+    """
+    if not games:
+        raise ValueError("there are no games to pack")
+    rows, cols = games[0].get_dimensions()
+    boards = []
+    starts = np.full((len(games), 2), -1, dtype=np.intp)
+    ends = np.full((len(games), 2), -1, dtype=np.intp)
+
+    for number, game in enumerate(games):
+        if game.get_dimensions() != (rows, cols):
+            raise ValueError(f"game {number} is {game.get_dimensions()}, not {(rows, cols)}")
+        if len(game.get_starting_positions()) > 1 or len(game.get_ending_positions()) > 1:
+            raise ValueError(f"game {number} has more than one start or end pipe")
+        boards.append(_pack_board(game))
+        if game.get_starting_position() is not None:
+            starts[number] = game.get_starting_position()
+        if game.get_ending_position() is not None:
+            ends[number] = game.get_ending_position()
+    cells = np.frombuffer(bytearray().join(boards), dtype=np.uint8).reshape(len(games), rows, cols)
+    return cells, starts, ends
+
+
+def check_wins(cells, starts, ends):
+    """ Finds which packed boards are won, matching PipeGame.check_win.
+
+            Parameters:
+                cells (ndarray): Packed cells with shape (boards, rows, cols).
+                starts (ndarray): The (row, col) of each start pipe, or (-1, -1) if missing.
+                ends (ndarray): The (row, col) of each end pipe, or (-1, -1) if missing.
+
+            Returns:
+                ndarray: A bool for each board, True if it is won.
+    """
+    cells = np.asarray(cells, dtype=np.uint8)
+    starts = np.asarray(starts, dtype=np.intp)
+    ends = np.asarray(ends, dtype=np.intp)
+    count, rows, cols = cells.shape
+    playable = (starts[:, 0] >= 0) & (ends[:, 0] >= 0)
+
+    # A border of empty tiles around every board means water never flows off a board or
+    # into the next one, so the boards can be flattened into one array of tiles.
+    width = cols + 2
+    board_size = (rows + 2) * width
+    padded = np.zeros((count, rows + 2, width), dtype=np.uint8)
+    padded[:, 1:-1, 1:-1] = cells
+    tiles = padded.ravel()
+    firsts = np.arange(count, dtype=np.intp) * board_size
+    # The step to the next tile in each direction of DIRECTIONS.
+    steps = (-width, 1, width, -1)
+
+    # Water is tracked as states, tile * 4 + side, meaning it has entered tile through side.
+    reached = np.zeros(tiles.size * 4, dtype=bool)
+    claims = np.empty(reached.size, dtype=np.int32)
+    end_tiles = firsts + (ends[:, 0] + 1) * width + ends[:, 1] + 1
+    win_states = end_tiles * 4 + WIN_SIDES[(tiles[end_tiles] >> PACKED_ORIENTATION_SHIFT) & 3]
+
+    # The frontier is the tiles water has just entered, and the sides it came in through.
+    frontier = (firsts + (starts[:, 0] + 1) * width + starts[:, 1] + 1)[playable]
+    sides = np.full(frontier.size, 4, dtype=np.intp)
+    while frontier.size:
+        exits = EXIT_TABLE[tiles[frontier].astype(np.intp) * 5 + sides]
+        new_states = []
+        for direction, step in enumerate(steps):
+            leaving = frontier[(exits & (1 << direction)) != 0]
+            new_states.append((leaving + step) * 4 + (direction + 2) % 4)
+        new_states = np.concatenate(new_states)
+        new_states = new_states[~reached[new_states]]
+        # Water can reach a state from two tiles in the same step, so keep only the copy
+        # that wrote its index to claims last.
+        order = np.arange(new_states.size, dtype=np.int32)
+        claims[new_states] = order
+        new_states = new_states[claims[new_states] == order]
+        reached[new_states] = True
+        frontier, sides = np.divmod(new_states, 4)
+
+    return playable & reached[win_states]
+
+
+def check_games(games):
+    """ (ndarray) Whether each of many games with boards of the same shape is won."""
+    return check_wins(*pack_games(games))
@@ -0,0 +1,366 @@
+"""
+Benchmarks for the model's hot paths.
+
+Generates boards from 6x6 up to 2000x2000 in a temporary directory, times loading,
+check_win (on unchanged games and after turning a pipe), Pipe.get_connected,
+position_in_direction and GUI-free game replays, and records the peak memory of each
+benchmark with tracemalloc. Results can be saved as a JSON baseline and later runs
+compared against it, so regressions are flagged.
+
+Usage:
+    python benchmark.py --save-baseline baseline.json
+    python benchmark.py --baseline baseline.json
+    python benchmark.py --sizes 6 50 --filter check_win
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from a2 import (DIRECTIONS, PIPES, PIPE_CONNECTIONS, PackedPipeGame, Pipe, PipeGame,
+                SparsePipeGame)
+
+DEFAULT_SIZES = (6, 50, 200, 2000)
+BACKENDS = (PipeGame, PackedPipeGame, SparsePipeGame)
+
+# Fraction by which a benchmark may get slower or use more memory before it's flagged.
+DEFAULT_THRESHOLD = 0.25
+
+# Most tiles the long path board's path covers. A 2000x2000 board filled with pipes
+# needs more memory than PipeGame has any business using.
+LONG_PATH_MAX_TILES = 250000
+
+# Playable counts written to generated boards, high enough for any replay.
+PLAYABLE_COUNTS = [10 ** 7] * len(PIPES)
+
+
+def long_path_rows(size, max_tiles=LONG_PATH_MAX_TILES):
+    """(int) The number of rows the path of a long path board of the given size fills."""
+    return min(size, max(2, max_tiles // size))
+
+
+def serpentine_rows(size, max_tiles=LONG_PATH_MAX_TILES):
+    """Yield the rows of a board whose locked pipes snake back and forth across it.
+
+    The start is at (0, 0) and the path runs east along even rows and west along odd
+    rows, filling as many whole rows as fit in max_tiles (at least two), so the board is
+    won by a path up to size * size tiles long.
+
+    Parameters:
+        size (int): Number of rows and columns, at least 2.
+        max_tiles (int): Most tiles the path may cover.
+    """
+    path_rows = long_path_rows(size, max_tiles)
+    for row in range(size):
+        if row >= path_rows:
+            yield ["#"] * size
+            continue
+        cells = []
+        heading_east = row % 2 == 0
+        for col in range(size):
+            first = col == (0 if heading_east else size - 1)
+            last = col == (size - 1 if heading_east else 0)
+            if row == 0 and col == 0:
+                cells.append("S1")
+            elif row == path_rows - 1 and last:
+                # An end's connection is the direction the water arrives in.
+                cells.append("E3" if heading_east else "E1")
+            elif first and row > 0:
+                # Entered from the north, turning along the row.
+                cells.append("CO0" if heading_east else "CO3")
+            elif last:
+                # Turning south into the next row.
+                cells.append("CO2" if heading_east else "CO1")
+            else:
+                cells.append("ST1")
+        yield cells
+
+
+def straight_rows(size, broken=False, pipes=True):
+    """Yield the rows of a board with a straight path along the top row.
+
+    Parameters:
+        size (int): Number of rows and columns, at least 3.
+        broken (bool): Turn the middle pipe of the path so the board isn't won.
+        pipes (bool): Fill the path with straight pipes, or leave it empty apart from
+        the start and end if False.
+    """
+    for row in range(size):
+        if row == 0:
+            cells = ["S1"] + ["ST1" if pipes else "#"] * (size - 2) + ["E3"]
+            if broken:
+                cells[size // 2] = "ST0"
+        else:
+            cells = ["#"] * size
+        yield cells
+
+
+def write_board(path, rows):
+    """Write board rows, followed by the playable pipe counts, to a game file.
+
+    Parameters:
+        path (str): Name of the file to write.
+        rows (iterable<list<str>>): The cells of each row.
+    """
+    with open(path, "w") as board_file:
+        for cells in rows:
+            board_file.write(",".join(cells) + "\n")
+        board_file.write(",".join(str(count) for count in PLAYABLE_COUNTS))
+
+
+def generate_boards(directory, size):
+    """Write the benchmark boards of one size.
+
+    Parameters:
+        directory (str): Directory to write the boards to.
+        size (int): Number of rows and columns.
+
+    Returns:
+        dict<str, str>: Game files keyed by board kind ("winning", "losing",
+        "long_path" and "empty").
+    """
+    boards = {
+        "winning": straight_rows(size),
+        "losing": straight_rows(size, broken=True),
+        "long_path": serpentine_rows(size),
+        "empty": straight_rows(size, pipes=False),
+    }
+    files = {}
+    for kind, rows in boards.items():
+        files[kind] = os.path.join(directory, f"game_{kind}_{size}.csv")
+        write_board(files[kind], rows)
+    return files
+
+
+def replay_moves(size):
+    """The moves a player makes to win the "empty" board of the given size.
+
+    Every straight pipe is placed the wrong way round and then turned, as it would be
+    in the GUI.
+
+    Returns:
+        list<tuple>: Moves in the format of PipeGame.apply_moves.
+    """
+    moves = []
+    for col in range(1, size - 1):
+        moves.append(("place", (0, col), "straight", 0))
+        moves.append(("rotate", (0, col), 1))
+    return moves
+
+
+def measure(run, setup=None, min_time=0.2, max_runs=10000):
+    """Time a benchmark, running it until min_time has passed.
+
+    Parameters:
+        run (callable): The benchmark. Called with the result of setup, if given.
+        setup (callable): Makes the state for each run, outside the timed section.
+        min_time (float): Seconds to keep repeating the benchmark for. Slow setups stop
+        the repeats after ten times as long.
+        max_runs (int): Most times to run the benchmark.
+
+    Returns:
+        dict: ops_per_sec, runs and peak_memory (bytes allocated at peak during one
+        untimed run under tracemalloc).
+    """
+    elapsed = 0.0
+    runs = 0
+    give_up = time.perf_counter() + min_time * 10
+    while runs == 0 or (runs < max_runs and elapsed < min_time and time.perf_counter() < give_up):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(state) if setup is not None else run()
+        elapsed += time.perf_counter() - start
+        runs += 1
+
+    # Measured separately as tracemalloc slows the code down considerably.
+    state = setup() if setup is not None else None
+    tracemalloc.start()
+    try:
+        run(state) if setup is not None else run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"ops_per_sec": runs / elapsed if elapsed else float("inf"), "runs": runs,
+            "peak_memory": peak_memory}
+
+
+def benchmarks(files, size):
+    """Yield (name, run, setup) for every benchmark on the boards of one size.
+
+    Parameters:
+        files (dict<str, str>): Game files returned by generate_boards.
+        size (int): Number of rows and columns of the boards.
+    """
+    for backend in BACKENDS:
+        backend_name = backend.__name__
+        for kind in ("winning", "long_path"):
+            yield (f"load_file/{backend_name}/{kind}/{size}",
+                   lambda backend=backend, kind=kind: backend(files[kind]), None)
+
+        # Loaded on first use and then shared by the benchmarks that leave the game as it was.
+        loaded = {}
+
+        def loaded_game(kind, backend=backend, loaded=loaded):
+            if kind not in loaded:
+                loaded[kind] = backend(files[kind])
+            return loaded[kind]
+
+        # Checking a game that hasn't changed since the last check, which PipeGame
+        # answers from the flow it keeps up to date.
+        for kind in ("winning", "losing", "long_path"):
+            yield (f"check_win_unchanged/{backend_name}/{kind}/{size}",
+                   lambda game: game.check_win(),
+                   lambda kind=kind, loaded_game=loaded_game: loaded_game(kind))
+
+        # Turn the pipe in the middle of the path, breaking (or mending) it, and turn it
+        # back, checking for a win after each change.
+        middles = {"winning": (0, size // 2), "losing": (0, size // 2),
+                   "long_path": (long_path_rows(size) // 2, size // 2)}
+
+        def rotate_and_check(game, middle):
+            game.rotate_pipe(middle, 1)
+            game.check_win()
+            game.rotate_pipe(middle, -1)
+            game.check_win()
+
+        for kind, middle in middles.items():
+            yield (f"rotate_check_win/{backend_name}/{kind}/{size}",
+                   lambda game, middle=middle: rotate_and_check(game, middle),
+                   lambda kind=kind, loaded_game=loaded_game: loaded_game(kind))
+
+        moves = replay_moves(size)
+
+        def replay(game, moves=moves):
+            # Check for a win after every move like the GUI does.
+            for move in moves:
+                game.apply_moves([move])
+                game.check_win()
+            assert game.check_win()
+
+        yield (f"replay/{backend_name}/empty/{size}", replay,
+               lambda backend=backend: backend(files["empty"]))
+
+        positions = [(row, col) for row in range(0, size, max(1, size // 20))
+                     for col in range(0, size, max(1, size // 20))]
+
+        def neighbours(game, positions=positions):
+            for position in positions:
+                for direction in DIRECTIONS:
+                    game.position_in_direction(direction, position)
+
+        yield (f"position_in_direction/{backend_name}/{len(positions) * 4}_calls/{size}", neighbours,
+               lambda loaded_game=loaded_game: loaded_game("winning"))
+
+
+def get_connected_benchmark():
+    """Yield (name, run, setup) for the board independent Pipe.get_connected benchmark."""
+    pipes = [Pipe(name, orientation) for name in PIPE_CONNECTIONS for orientation in range(4)]
+
+    def get_connected():
+        for pipe in pipes:
+            for side in DIRECTIONS:
+                pipe.get_connected(side)
+
+    yield f"get_connected/Pipe/{len(pipes) * 4}_calls", get_connected, None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, name_filter=None, min_time=0.2, progress=None):
+    """Run every benchmark on generated boards of the given sizes.
+
+    Parameters:
+        sizes (iterable<int>): Board sizes, each at least 3.
+        name_filter (str): Only run benchmarks whose names contain this.
+        min_time (float): Seconds to repeat each benchmark for.
+        progress (file): Text file to report each result to as it finishes.
+
+    Returns:
+        dict<str, dict>: Results from measure keyed by benchmark name.
+    """
+    results = {}
+
+    def run_all(cases):
+        for name, run, setup in cases:
+            if name_filter and name_filter not in name:
+                continue
+            results[name] = measure(run, setup, min_time)
+            if progress is not None:
+                progress.write(format_result(name, results[name]) + "\n")
+                progress.flush()
+
+    run_all(get_connected_benchmark())
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            if size < 3:
+                raise ValueError(f"board size {size} is smaller than 3")
+            run_all(benchmarks(generate_boards(directory, size), size))
+    return results
+
+
+def format_result(name, result):
+    """(str) One line describing a benchmark result."""
+    return (f"{name:<55} {result['ops_per_sec']:>14,.1f} ops/s "
+            f"{result['peak_memory'] / 1024:>12,.1f} KiB peak")
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Find the benchmarks that have got slower or use more memory than the baseline.
+
+    Benchmarks missing from either side are ignored.
+
+    Parameters:
+        results (dict<str, dict>): Results of this run.
+        baseline (dict<str, dict>): Results of an earlier run.
+        threshold (float): Fraction of change tolerated before a result is flagged.
+
+    Returns:
+        list<str>: A description of each regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if result["ops_per_sec"] < old["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: {old['ops_per_sec']:,.1f} -> "
+                               f"{result['ops_per_sec']:,.1f} ops/s")
+        if result["peak_memory"] > old["peak_memory"] * (1 + threshold) + 1024:
+            regressions.append(f"{name}: {old['peak_memory']:,} -> "
+                               f"{result['peak_memory']:,} bytes peak")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the model on generated boards.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="board sizes to generate (default: %(default)s)")
+    parser.add_argument("--filter", default=None, help="only run benchmarks whose names contain this")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="seconds to repeat each benchmark for (default: %(default)s)")
+    parser.add_argument("--baseline", default=None, help="JSON baseline to compare against")
+    parser.add_argument("--save-baseline", default=None, help="file to save the results to as JSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fraction slower or larger that counts as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.filter, args.min_time, sys.stdout)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""
+An asyncio server hosting many games at once, and a load generator for it.
+
+Clients send one JSON object per line and get one JSON object back per line, in order.
+Every request has an "op" and may have an "id", which is copied into the response.
+
+    {"op": "create", "level": "game_1.csv"}        -> {"ok": true, "session": "1", ...}
+    {"op": "place", "session": "1", "position": [0, 0], "pipe": "straight"}
+    {"op": "rotate", "session": "1", "position": [0, 0], "direction": 1}
+    {"op": "remove", "session": "1", "position": [0, 0]}
+    {"op": "state", "session": "1"}                 -> board, playable pipes and won
+    {"op": "check_win", "session": "1"}             -> {"ok": true, "won": false}
+    {"op": "close", "session": "1"}
+
+Moves follow the GUI's rules (see session.GameSession) and answer with whether the move
+was made and whether the game is now won. Errors answer {"ok": false, "error": "..."}.
+Levels are read once and shared by every session playing them, and sessions nobody
+has used for --idle-timeout seconds are closed.
+
+Usage:
+    python game_server.py serve --port 8765 --levels .
+    python game_server.py load --port 8765 --clients 200 --moves 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from a2 import PIPES, SPECIAL_TILES, LevelTemplate, PipeGame
+from session import GameSession
+
+DEFAULT_PORT = 8765
+
+# Moves each session's game remembers for undoing. Clients can't undo yet, so none.
+SESSION_HISTORY_LIMIT = 0
+
+# Requests that make a move in a session.
+MOVES = ("place", "rotate", "remove")
+
+# The cell text of every tile name, as used in game files.
+TILE_TEXT = {name: code for code, name in list(SPECIAL_TILES.items()) + list(PIPES.items())}
+TILE_TEXT["tile"] = "#"
+
+
+class RequestError(Exception):
+    """ Raised when a request can't be answered."""
+
+
+def cell_text(tile):
+    """ (str) The text a tile would have in a game file, e.g. "#", "L", "S1" or "CO2"."""
+    text = TILE_TEXT[tile.get_name()]
+    if tile.get_id() in ("pipe", "special_pipe"):
+        text += str(tile.get_orientation())
+    return text
+
+
+class GameServer:
+    """
+    The games being played, and the levels they're played on.
+    """
+
+    def __init__(self, level_dir=".", idle_timeout=300.0, max_sessions=None, game_type=PipeGame):
+        """ Constructor method for GameServer instances.
+
+                Parameters:
+                    level_dir (str): The directory levels are loaded from.
+                    idle_timeout (float): Seconds a session may go unused before it's closed.
+                    max_sessions (int): Most sessions open at once (None for no limit).
+                    game_type (type): The PipeGame class (or subclass) to play with.
+        """
+        self.level_dir = level_dir
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.game_type = game_type
+        # LevelTemplates by level name, shared by every session on the level.
+        self._templates = {}
+        # GameSessions by id, and when each was last used.
+        self._sessions = {}
+        self._last_used = {}
+        self._next_id = 1
+
+    def session_count(self):
+        """ (int) The number of open sessions."""
+        return len(self._sessions)
+
+    def handle_request(self, request):
+        """ Answers one request.
+
+                Parameters:
+                    request (dict): The decoded request.
+
+                Returns:
+                    dict: The response, with the request's id if it had one.
+        """
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("requests must be JSON objects")
+            response = self._dispatch(request)
+            response["ok"] = True
+        except RequestError as error:
+            response = {"ok": False, "error": str(error)}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    def _dispatch(self, request):
+        """ (dict) The response to a request, raising RequestError if it can't be made."""
+        op = request.get("op")
+        if op == "create":
+            return self._create(request.get("level"))
+
+        session_id = request.get("session")
+        session = self._sessions.get(session_id) if isinstance(session_id, str) else None
+        if session is None:
+            raise RequestError(f"no session {session_id!r}")
+        self._last_used[session_id] = time.monotonic()
+
+        if op in MOVES:
+            position = self._position(request.get("position"))
+            if op == "place":
+                pipe = request.get("pipe")
+                if not isinstance(pipe, str):
+                    raise RequestError(f"invalid pipe {pipe!r}")
+                made = session.place(position, pipe)
+            elif op == "rotate":
+                direction = request.get("direction", 1)
+                if isinstance(direction, bool) or not isinstance(direction, int):
+                    raise RequestError(f"invalid direction {direction!r}")
+                made = session.rotate(position, direction)
+            else:
+                made = session.remove(position)
+            return {"made": made, "won": session.game.check_win()}
+        elif op == "check_win":
+            return {"won": session.game.check_win()}
+        elif op == "state":
+            return self._state(session.game)
+        elif op == "close":
+            self._close(session_id)
+            return {}
+        raise RequestError(f"unknown op {op!r}")
+
+    def _create(self, level):
+        """ (dict) Starts a session on a level."""
+        if self.max_sessions is not None and len(self._sessions) >= self.max_sessions:
+            raise RequestError("too many sessions")
+        template = self._template(level)
+        session_id = str(self._next_id)
+        self._next_id += 1
+        self._sessions[session_id] = GameSession(template, self.game_type, record=False,
+                                                 history_limit=SESSION_HISTORY_LIMIT)
+        self._last_used[session_id] = time.monotonic()
+        rows, cols = self._sessions[session_id].game.get_dimensions()
+        return {"session": session_id, "rows": rows, "cols": cols}
+
+    def _template(self, level):
+        """ (LevelTemplate) The shared template of a level in the level directory."""
+        # Only plain file names, so clients can't read files outside the level directory.
+        if not isinstance(level, str) or os.path.basename(level) != level or level.startswith("."):
+            raise RequestError(f"invalid level name {level!r}")
+        template = self._templates.get(level)
+        if template is not None:
+            return template
+        try:
+            template = LevelTemplate(os.path.join(self.level_dir, level))
+        except (OSError, ValueError) as error:
+            raise RequestError(f"can't load level {level!r}: {error}") from None
+        self._templates[level] = template
+        return template
+
+    @staticmethod
+    def _position(position):
+        """ (tuple<int, int>) A position from a request."""
+        if (not isinstance(position, list) or len(position) != 2
+                or not all(isinstance(value, int) for value in position)):
+            raise RequestError(f"invalid position {position!r}")
+        return tuple(position)
+
+    @staticmethod
+    def _state(game):
+        """ (dict) Everything a client needs to draw a game."""
+        rows, cols = game.get_dimensions()
+        board = [[cell_text(game.get_pipe((row, col))) for col in range(cols)] for row in range(rows)]
+        return {"board": board, "playable": game.get_playable_pipes(), "won": game.check_win()}
+
+    def _close(self, session_id):
+        """ Forgets a session."""
+        del self._sessions[session_id]
+        del self._last_used[session_id]
+
+    def evict_idle(self, now=None):
+        """ Closes the sessions that haven't been used for idle_timeout seconds.
+
+                Parameters:
+                    now (float): The current time.monotonic() (defaults to the real time).
+
+                Returns:
+                    int: The number of sessions closed.
+        """
+        if now is None:
+            now = time.monotonic()
+        idle = [session_id for session_id, last_used in self._last_used.items()
+                if now - last_used > self.idle_timeout]
+        for session_id in idle:
+            self._close(session_id)
+        return len(idle)
+
+    async def handle_client(self, reader, writer):
+        """ Answers the requests on one connection until the client disconnects."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {"ok": False, "error": "invalid JSON"}
+                else:
+                    try:
+                        response = self.handle_request(request)
+                    except Exception as error:
+                        # A bug in one request shouldn't cost the client its connection.
+                        response = {"ok": False, "error": f"internal error: {error!r}"}
+                        if isinstance(request, dict) and "id" in request:
+                            response["id"] = request["id"]
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def evict_forever(self):
+        """ Closes idle sessions every so often, until cancelled."""
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 10))
+            self.evict_idle()
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, path=None, started=None):
+        """ Accepts connections until cancelled.
+
+                Parameters:
+                    host (str): The address to listen on.
+                    port (int): The TCP port to listen on (0 for any free port).
+                    path (str): Listen on this Unix socket instead of TCP.
+                    started (asyncio.Future): Set to the listening server once it's ready.
+        """
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path=path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        evictor = asyncio.ensure_future(self.evict_forever())
+        if started is not None:
+            started.set_result(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictor.cancel()
+
+
+async def open_connection(host="127.0.0.1", port=DEFAULT_PORT, path=None):
+    """ (tuple<StreamReader, StreamWriter>) Connects to a GameServer."""
+    if path is not None:
+        return await asyncio.open_unix_connection(path, limit=2 ** 24)
+    return await asyncio.open_connection(host, port, limit=2 ** 24)
+
+
+async def request(reader, writer, message):
+    """ (dict) Sends one request to a GameServer and waits for its response."""
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def _load_client(client, level, moves, seed, connect, latencies):
+    """ Plays one session of random moves, recording the latency of every request."""
+    rng = random.Random(seed + client)
+    reader, writer = await connect()
+    try:
+        response = await request(reader, writer, {"op": "create", "level": level})
+        if not response["ok"]:
+            raise RequestError(response["error"])
+        session_id = response["session"]
+        rows, cols = response["rows"], response["cols"]
+        pipes = list(PIPES.values())
+        for _ in range(moves):
+            op = rng.choice(("place", "place", "rotate", "remove"))
+            message = {"op": op, "session": session_id,
+                       "position": [rng.randrange(rows), rng.randrange(cols)]}
+            if op == "place":
+                message["pipe"] = rng.choice(pipes)
+            start = time.perf_counter()
+            await request(reader, writer, message)
+            latencies.append(time.perf_counter() - start)
+        await request(reader, writer, {"op": "close", "session": session_id})
+    finally:
+        writer.close()
+
+
+async def run_load(level="game_1.csv", clients=100, moves=100, seed=0, host="127.0.0.1",
+                   port=DEFAULT_PORT, path=None):
+    """ Plays many sessions at once against a GameServer and measures its throughput.
+
+            Parameters:
+                level (str): The level every session plays.
+                clients (int): The number of connections, each playing one session.
+                moves (int): Random moves made by each client.
+                seed (int): Seed of the random moves.
+                host, port, path: Where the server is listening, see GameServer.serve.
+
+            Returns:
+                dict: Moves made, seconds taken, moves per second and the median, 99th
+                percentile and slowest request in milliseconds.
+    """
+    latencies = []
+
+    def connect():
+        return open_connection(host, port, path)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_load_client(client, level, moves, seed, connect, latencies)
+                           for client in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {"moves": len(latencies), "seconds": elapsed, "moves_per_sec": len(latencies) / elapsed,
+            "median_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+            "p99_ms": latencies[len(latencies) * 99 // 100] * 1000 if latencies else None,
+            "max_ms": latencies[-1] * 1000 if latencies else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host games over JSON lines, or load test a host.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, description in (("serve", "run the server"), ("load", "measure a running server")):
+        command = commands.add_parser(name, help=description)
+        command.add_argument("--host", default="127.0.0.1", help="address (default: %(default)s)")
+        command.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port (default: %(default)s)")
+        command.add_argument("--unix", default=None, metavar="PATH", help="use a Unix socket instead of TCP")
+
+    serve = commands.choices["serve"]
+    serve.add_argument("--levels", default=".", help="directory of level files (default: %(default)s)")
+    serve.add_argument("--idle-timeout", type=float, default=300.0,
+                       help="seconds before an unused session is closed (default: %(default)s)")
+    serve.add_argument("--max-sessions", type=int, default=None, help="most sessions open at once")
+
+    load = commands.choices["load"]
+    load.add_argument("--level", default="game_1.csv", help="level to play (default: %(default)s)")
+    load.add_argument("--clients", type=int, default=100, help="concurrent sessions (default: %(default)s)")
+    load.add_argument("--moves", type=int, default=100, help="moves per session (default: %(default)s)")
+    load.add_argument("--seed", type=int, default=0, help="seed of the random moves (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = GameServer(args.levels, args.idle_timeout, args.max_sessions)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    results = asyncio.run(run_load(args.level, args.clients, args.moves, args.seed,
+                                   args.host, args.port, args.unix))
+    for name, value in results.items():
+        print(f"{name}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,12 +8,92 @@ For the game to play successfully, everything must be correctly
 implemented in a2.py.
 """
 
+import os
+import sys
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import simpledialog
 
+import instrumentation
 from a2 import *
 
+# Size in pixels of every tile image.
+TILE_SIZE = 75
+# Size in pixels of the space each tile takes up on the board, including padding.
+CELL_SIZE = TILE_SIZE + 8
+# Most rows and columns of tiles shown at once, larger boards scroll.
+VIEWPORT_ROWS = 8
+VIEWPORT_COLUMNS = 12
+# Rows and columns drawn beyond the edges of the view so scrolling doesn't show gaps.
+VIEWPORT_MARGIN = 2
+
+# Every image the game displays, in the order they appear in the sprite sheet.
+SPRITE_NAMES = ([EMPTY_TILE, LOCKED_TILE] +
+                [f"{name}{orientation}" for name in (START_PIPE, END_PIPE) + tuple(PIPES.values())
+                 for orientation in range(4)])
+# Number of sprites in each row of the sprite sheet.
+SPRITE_SHEET_COLUMNS = 8
+SPRITE_SHEET = "images/sprites"
+
+# Loaded images by image name, shared by every widget that displays them.
+_image_cache = {}
+# The image file extensions to try, the one that worked last time first.
+_image_formats = [".png", ".gif"]
+
+# Levels with more tiles than this aren't kept as a tile object per cell, see open_level.
+LARGE_LEVEL_TILES = 200 * 200
+
+
+def open_level(level='game_1.csv'):
+    """Start a game of a level, with the board stored to suit the level's size.
+
+    Large levels that are mostly empty tiles are played on a SparsePipeGame, which only
+    stores the other tiles, and other large levels on a PackedPipeGame, which stores a
+    byte per tile. Smaller levels use PipeGame.
+
+    Parameters:
+        level (str): Name of the game file.
+
+    Returns:
+        PipeGame: The new game.
+    """
+    template = LevelTemplate(level)
+    tiles = template.rows * template.cols
+    if tiles <= LARGE_LEVEL_TILES:
+        return PipeGame(template)
+    empty_spec = TILE_CODES['#']
+    empty_tiles = sum(tile_spec is empty_spec for row in template for tile_spec in row)
+    return SparsePipeGame(template) if empty_tiles * 2 > tiles else PackedPipeGame(template)
+
+
+def visible_range(start, length, count):
+    """(range) The rows or columns with any part between start and start + length pixels,
+    plus VIEWPORT_MARGIN on each side, clipped to the count rows or columns of the board.
+    """
+    first = max(int(start) // CELL_SIZE - VIEWPORT_MARGIN, 0)
+    last = min(int(start + length) // CELL_SIZE + 1 + VIEWPORT_MARGIN, count)
+    return range(first, last)
+
+
+def cell_at(x, y, rows, columns):
+    """Find the board position at a point in canvas coordinates.
+
+    Parameters:
+        x (float): Horizontal canvas coordinate.
+        y (float): Vertical canvas coordinate.
+        rows (int): Number of rows on the board.
+        columns (int): Number of columns on the board.
+
+    Returns:
+        tuple<int, int>: The (row, col) of the tile at the point.
+        None: If the point isn't on the board.
+    """
+    row = int(y) // CELL_SIZE
+    column = int(x) // CELL_SIZE
+    if 0 <= row < rows and 0 <= column < columns:
+        return (row, column)
+    return None
+
 
 class SelectionPanel(tk.Canvas):
     """
@@ -76,6 +156,24 @@ class SelectionPanel(tk.Canvas):
             frame.config(highlightbackground=border)
             number.config(text=f"{self._playable[pipe]}")
 
+    def update_count(self, pipe):
+        """Update the amount shown for a single type of pipe.
+
+        Parameters:
+            pipe (str): The type of pipe whose amount changed.
+        """
+        self._pipes[pipe][1].config(text=f"{self._playable[pipe]}")
+
+    def set_playable(self, playable_pipes, selected=None):
+        """Show the remaining counts of a different set of playable pipes, reusing the existing widgets.
+
+        Parameters:
+            playable_pipes (dict<str, int>): Mapping of types of pipes to amount of pipes remaining.
+            selected (str): Type of pipe that is currently selected.
+        """
+        self._playable = playable_pipes
+        self.redraw(selected)
+
     def _handle_click(self, pipe):
         """Called when a pipe is clicked, handling calling the callback panel_selection method"""
         if self._panel_selection is not None:
@@ -83,85 +181,207 @@ class SelectionPanel(tk.Canvas):
 
 
 class BoardView(tk.Canvas):
-    """View of the Pipe game board"""
+    """View of the Pipe game board.
 
-    def __init__(self, master, board_layout, place_pipe=None, remove_pipe=None, *args, **kwargs):
-        """Construct a board view from a board_layout.
+    Each tile is an image item on the canvas. Only the tiles inside the visible window (plus a
+    small margin) have items, and items that scroll out of view are reused for the tiles that
+    scroll into view, so large boards cost no more to display than small ones. Tiles are read
+    from the game as they come into view. Clicks are handled by the canvas itself and mapped to
+    a board position from the click coordinates.
+    """
+
+    def __init__(self, master, game, place_pipe=None, remove_pipe=None, *args, **kwargs):
+        """Construct a board view of a game.
 
         Parameters:
             master (tk.Widget): Widget within which the board is placed.
-            board_layout (list<list<Tile>>): 2D array of tiles in a board.
+            game (PipeGame): Game whose board is displayed.
             place_pipe (callable): Callable to call when a pipe is being placed.
             remove_pipe (callable): Callable to call when a pipe is being removed.
         """
+        self._game = game
+        self._rows, self._columns = game.get_dimensions()
+        kwargs.setdefault("width", min(self._columns, VIEWPORT_COLUMNS) * CELL_SIZE)
+        kwargs.setdefault("height", min(self._rows, VIEWPORT_ROWS) * CELL_SIZE)
+        kwargs.setdefault("highlightthickness", 0)
         super().__init__(master, *args, **kwargs)
         self._master = master
 
-        self._board_layout = board_layout
         self.place_pipe = place_pipe
         self.remove_pipe = remove_pipe
 
-        self._board = self.load_board()
+        self.config(scrollregion=(0, 0, self._columns * CELL_SIZE, self._rows * CELL_SIZE))
 
-    def load_board(self):
-        """(list<list<Tile>>) Create a 2D array of labels representing the board to display."""
-        labels = []
+        # Image items for the tiles in view by position, and items waiting to be reused.
+        self._items = {}
+        self._spare_items = []
+        # The (name, orientation) currently displayed at each position in view.
+        self._drawn = {}
 
-        for y, row in enumerate(self._board_layout):
-            board_row = []
-            for x, tile in enumerate(row):
-                placement = tk.Label(self, text="T")
-                placement.grid(column=x, row=y, ipady=4, ipadx=4)
+        self.bind_clicks()
+        self.bind("<Configure>", lambda e: self.update_viewport())
 
-                self.bind_clicks(placement, tile, (y, x))
-                board_row.append(placement)
+    def set_game(self, game):
+        """Display a different game, reusing the existing canvas and image items.
 
-            labels.append(board_row)
+        The view is only resized if the new board has different dimensions, and only tiles
+        that look different to what is already shown are redrawn.
 
-        return labels
+        Parameters:
+            game (PipeGame): Game whose board is displayed.
+        """
+        self._game = game
+        dimensions = game.get_dimensions()
+        if dimensions != (self._rows, self._columns):
+            self._rows, self._columns = dimensions
+            self.config(width=min(self._columns, VIEWPORT_COLUMNS) * CELL_SIZE,
+                        height=min(self._rows, VIEWPORT_ROWS) * CELL_SIZE,
+                        scrollregion=(0, 0, self._columns * CELL_SIZE, self._rows * CELL_SIZE))
+        self.redraw()
 
-    def redraw(self):
-        """Redraw the game board by updating the images displayed in each grid"""
-        for y, row in enumerate(self._board_layout):
-            for x, tile in enumerate(row):
+    def xview(self, *args):
+        """Scroll horizontally (as tk.Canvas.xview) and draw the tiles that come into view."""
+        result = super().xview(*args)
+        if args:
+            self.update_viewport()
+        return result
+
+    def yview(self, *args):
+        """Scroll vertically (as tk.Canvas.yview) and draw the tiles that come into view."""
+        result = super().yview(*args)
+        if args:
+            self.update_viewport()
+        return result
+
+    def update_viewport(self):
+        """Make sure exactly the tiles in view (plus the margin) have image items."""
+        width = self.winfo_width() if self.winfo_ismapped() else int(self["width"])
+        height = self.winfo_height() if self.winfo_ismapped() else int(self["height"])
+        rows = visible_range(self.canvasy(0), height, self._rows)
+        columns = visible_range(self.canvasx(0), width, self._columns)
+
+        for position in list(self._items):
+            if position[0] not in rows or position[1] not in columns:
+                item = self._items.pop(position)
+                del self._drawn[position]
+                self.itemconfig(item, state=tk.HIDDEN)
+                self._spare_items.append(item)
+
+        for y in rows:
+            for x in columns:
                 position = (y, x)
-                image = self._load_tile_image(tile)
+                if position in self._items:
+                    continue
+                center = (x * CELL_SIZE + CELL_SIZE // 2, y * CELL_SIZE + CELL_SIZE // 2)
+                if self._spare_items:
+                    item = self._spare_items.pop()
+                    self.coords(item, *center)
+                    self.itemconfig(item, state=tk.NORMAL)
+                else:
+                    item = self.create_image(*center, anchor=tk.CENTER)
+                self._items[position] = item
+                self._draw_tile(position)
+        # New image items are drawn on top, so keep the hint above them.
+        self.tag_raise("hint")
+
+    def redraw(self, positions=None):
+        """Redraw the game board by updating the images displayed in each grid.
 
-                placement = self._board[y][x]
-                placement.config(image=image)
-                placement.image = image
-                self.bind_clicks(placement, tile, position)
+        Parameters:
+            positions (iterable<tuple<int, int>>): The positions that may have changed.
+                Defaults to every position in view.
+        """
+        if positions is None:
+            self.update_viewport()
+            positions = list(self._items)
+
+        for position in positions:
+            # Tiles out of view are drawn when they scroll into view.
+            if position in self._items:
+                self._draw_tile(position)
 
-    def bind_clicks(self, label, tile, position):
-        """Bind clicks on a label to the left and right click handlers.
+    def _draw_tile(self, position):
+        """Show the current image of the tile at position, if it looks different."""
+        tile = self._game.get_pipe(position)
+        appearance = self._tile_appearance(tile)
+        # Only grids whose tile looks different need a new image.
+        if appearance == self._drawn.get(position):
+            return
+        self._drawn[position] = appearance
+        # Images are kept alive by the image cache, so the item doesn't need a reference.
+        self.itemconfig(self._items[position], image=self._load_tile_image(tile))
+
+    def show_hint(self, position):
+        """Highlight the tile at position, replacing any earlier highlight.
 
         Parameters:
-            label (tk.Widget): Label which clicks should bound to.
-            tile (Tile): Tile to pass as a parameter to the handlers.
-            position (tuple<int, int>): Position to pass as a parameter to the handlers.
+            position (tuple<int, int>): The (row, col) to highlight, or None for no highlight.
         """
+        self.delete("hint")
+        if position is None:
+            return
+        row, column = position
+        self.create_rectangle(column * CELL_SIZE + 1, row * CELL_SIZE + 1,
+                              (column + 1) * CELL_SIZE - 1, (row + 1) * CELL_SIZE - 1,
+                              outline="yellow", width=3, tags="hint")
+        # Scroll the hint into view on boards bigger than the view.
+        if self._rows > VIEWPORT_ROWS:
+            self.yview_moveto(max(row - VIEWPORT_ROWS // 2, 0) / self._rows)
+        if self._columns > VIEWPORT_COLUMNS:
+            self.xview_moveto(max(column - VIEWPORT_COLUMNS // 2, 0) / self._columns)
+        self.update_viewport()
+
+    def bind_clicks(self):
+        """Bind clicks on the board to the left and right click handlers."""
         # bind left click
-        label.bind("<Button-1>", lambda e, tile=tile, position=position: self._handle_left_click(tile, position))
+        self.bind("<Button-1>", self._handle_left_click)
         # bind right click
         # right click can be either Button-2 or Button-3 depending on operating system
         for i in range(2, 4):
-            label.bind(f"<Button-{i}>",
-                       lambda e, tile=tile, position=position: self._handle_right_click(tile, position))
+            self.bind(f"<Button-{i}>", self._handle_right_click)
+
+    def position_at(self, x, y):
+        """Find the board position shown at a point on the canvas.
+
+        Parameters:
+            x (int): Horizontal window coordinate, e.g. from a click event.
+            y (int): Vertical window coordinate.
 
-    def _handle_left_click(self, pipe, position):
+        Returns:
+            tuple<int, int>: The (row, col) of the tile at the point.
+            None: If the point isn't on the board.
+        """
+        return cell_at(self.canvasx(x), self.canvasy(y), self._rows, self._columns)
+
+    def _handle_left_click(self, event):
         """Handle left clicking on a tile to place a pipe.
 
         Calls the provided place_pipe method if available and pipe is selectable.
         """
+        position = self.position_at(event.x, event.y)
+        if position is None:
+            return
+        pipe = self._game.get_pipe(position)
         if self.place_pipe is not None and pipe.can_select():
             self.place_pipe(position)
 
-    def _handle_right_click(self, pipe, position):
+    def _handle_right_click(self, event):
         """Handle right clicking on a tile"""
+        position = self.position_at(event.x, event.y)
+        if position is None:
+            return
+        pipe = self._game.get_pipe(position)
         if self.remove_pipe is not None and pipe.get_id() == "pipe" and pipe.can_select():
             if pipe.get_name() in PIPES.values():
                 self.remove_pipe(position)
 
+    @staticmethod
+    def _tile_appearance(tile):
+        """(tuple<str, int>) The name and orientation that decide which image a tile shows."""
+        if tile.get_id() == "tile":
+            return (tile.get_name(), None)
+        return (tile.get_name(), tile.get_orientation())
+
     def _load_tile_image(self, tile):
         """Load the PhotoImage to use for a given tile.
 
@@ -189,14 +409,35 @@ class GameApp:
         """Create a new game app within a master widget"""
         self._master = master
         self._level = ""
-        self._game = PipeGame()
+        self._game = open_level()
+        # The views are updated from the game's change events.
+        self._game.subscribe(self.game_changed)
 
         self._selected = None
 
         # initialise GUI variables that are assigned in the draw method
-        self._selection, self._board_view, self._button_frame = None, None, None
+        self._selection, self._board_view, self._board_frame, self._button_frame = None, None, None, None
         self.draw()
 
+        master.bind("<Control-z>", lambda e: self.undo())
+        master.bind("<Control-y>", lambda e: self.redo())
+
+    def game_changed(self, event, details):
+        """Update the part of the window affected by a change to the game.
+
+        Parameters:
+            event (str): The kind of change, see PipeGame.subscribe.
+            details (dict): What changed.
+        """
+        if event in (TILE_PLACED, TILE_REMOVED, TILE_ROTATED):
+            # Any move makes the last hint out of date.
+            self._board_view.show_hint(None)
+            self._board_view.redraw([details["position"]])
+        elif event == SELECTABLE_CHANGED:
+            self._board_view.redraw([details["position"]])
+        elif event == PLAYABLE_CHANGED:
+            self._selection.update_count(details["pipe"])
+
     def select_pipe(self, pipe):
         """Select a pipe to be placed from the selection panel.
 
@@ -229,13 +470,12 @@ class GameApp:
 
         # rotate already placed pipes
         if tile.get_id() == "pipe":
-            tile.rotate(1)
+            self._game.rotate_pipe(position, 1)
 
         # unselect when placed
         self._selected = None
         self._selection.redraw()
 
-        self._board_view.redraw()
         self.check_game_over()
 
     def remove_pipe(self, position):
@@ -245,8 +485,32 @@ class GameApp:
             position (tuple<int, int>): The position to remove the pipe from.
         """
         self._game.remove_pipe(position)
-        self._board_view.redraw()
-        self._selection.redraw()
+
+    def undo(self):
+        """Take back the last move."""
+        if self._game.undo():
+            self.check_game_over()
+
+    def redo(self):
+        """Make the last undone move again."""
+        if self._game.redo():
+            self.check_game_over()
+
+    def hint(self):
+        """Highlight the tile of the suggested next move, selecting the pipe to place there."""
+        try:
+            move = self._game.hint()
+        except ValueError:
+            messagebox.showinfo("Hint", "Hints need a level with one start and one end pipe.")
+            return
+        if move is None:
+            self._board_view.show_hint(None)
+            messagebox.showinfo("Hint", "There's no move that gets the water any closer.")
+            return
+        self._board_view.show_hint(move[1])
+        if move[0] == "place":
+            self._selected = move[2]
+            self._selection.redraw(selected=self._selected)
 
     def check_game_over(self):
         """Check if the game is over and exit if so"""
@@ -263,19 +527,19 @@ class GameApp:
 
     def reset_game(self):
         """Restart the game on the current level."""
+        old_game = self._game
         if self._level == "":
-            self._game = PipeGame()
+            self._game = open_level()
         else:
-            self._game = PipeGame(self._level)
-        self.redraw()
-
-    def redraw(self):
-        """Redraw the whole game window."""
-        self._selection.destroy()
-        self._board_view.destroy()
-        self._button_frame.destroy()
+            self._game = open_level(self._level)
+        old_game.unsubscribe(self.game_changed)
+        self._game.subscribe(self.game_changed)
 
-        self.draw()
+        # Reuse the existing widgets, only the changed tiles and counts are redrawn.
+        self._selected = None
+        self._selection.set_playable(self._game.get_playable_pipes())
+        self._board_view.show_hint(None)
+        self._board_view.set_game(self._game)
 
     def draw(self):
         """Draw the game to the master widget."""
@@ -285,13 +549,22 @@ class GameApp:
         except AttributeError:
             print("get_playable_pipes() method needs to be implemented correctly.",
                   "\n")
+        self._board_frame = tk.Frame(self._master)
         try:
-            self._board_view = BoardView(self._master, self._game.get_board_layout(), self.place_pipe, self.remove_pipe)
+            self._board_view = BoardView(self._board_frame, self._game, self.place_pipe, self.remove_pipe)
             self._board_view.redraw()
-            self._board_view.pack(side=tk.LEFT)
+            self._board_view.grid(row=0, column=0)
+
+            # Scrollbars for boards bigger than the view.
+            y_scroll = tk.Scrollbar(self._board_frame, orient=tk.VERTICAL, command=self._board_view.yview)
+            x_scroll = tk.Scrollbar(self._board_frame, orient=tk.HORIZONTAL, command=self._board_view.xview)
+            self._board_view.config(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+            y_scroll.grid(row=0, column=1, sticky=tk.NS)
+            x_scroll.grid(row=1, column=0, sticky=tk.EW)
         except AttributeError:
-            print("get_board_layout() method needs to be implemented correctly.",
+            print("get_dimensions() and get_pipe() methods need to be implemented correctly.",
                   "\n")
+        self._board_frame.pack(side=tk.LEFT)
 
         self._button_frame = tk.Frame(self._master)
 
@@ -301,24 +574,91 @@ class GameApp:
         new_button = tk.Button(self._button_frame, text="New Game", command=self.new_game)
         new_button.pack(side=tk.TOP)
 
+        undo_button = tk.Button(self._button_frame, text="Undo", command=self.undo)
+        undo_button.pack(side=tk.TOP)
+
+        redo_button = tk.Button(self._button_frame, text="Redo", command=self.redo)
+        redo_button.pack(side=tk.TOP)
+
+        hint_button = tk.Button(self._button_frame, text="Hint", command=self.hint)
+        hint_button.pack(side=tk.TOP)
+
         self._button_frame.pack(side=tk.LEFT)
 
 
 def get_image(image_name):
     """(tk.PhotoImage) Get a image file based on capability.
 
-    If a .png doesn't work, default to the .gif image.
+    Each image is only loaded once. If a .png doesn't work, default to the .gif image,
+    and try whichever format worked first from then on.
+    """
+    image = _image_cache.get(image_name)
+    if image is None:
+        image = _load_image_file(image_name)
+        _image_cache[image_name] = image
+    return image
+
+
+def _load_image_file(image_name):
+    """(tk.PhotoImage) Load an image from disk, trying the format that worked last time first."""
+    for image_format in list(_image_formats):
+        try:
+            image = tk.PhotoImage(file=image_name + image_format)
+        except tk.TclError:
+            continue
+        if image_format != _image_formats[0]:
+            _image_formats.remove(image_format)
+            _image_formats.insert(0, image_format)
+        return image
+    raise tk.TclError(f"couldn't load {image_name} as any of {_image_formats}")
+
+
+def load_images():
+    """Fill the image cache with every tile image.
+
+    Uses the sprite sheet if there is one, slicing each tile out of it, otherwise loads
+    each image file in images/.
     """
     try:
-        image = tk.PhotoImage(file=image_name + ".png")
+        sheet = _load_image_file(SPRITE_SHEET)
     except tk.TclError:
-        image = tk.PhotoImage(file=image_name + ".gif")
-    return image
+        sheet = None
+
+    for sprite_num, name in enumerate(SPRITE_NAMES):
+        image_name = f"images/{name}"
+        if image_name in _image_cache:
+            continue
+        if sheet is None:
+            get_image(image_name)
+            continue
+        row, column = divmod(sprite_num, SPRITE_SHEET_COLUMNS)
+        image = tk.PhotoImage(width=TILE_SIZE, height=TILE_SIZE)
+        image.tk.call(image, "copy", sheet, "-from", column * TILE_SIZE, row * TILE_SIZE,
+                      (column + 1) * TILE_SIZE, (row + 1) * TILE_SIZE, "-to", 0, 0)
+        _image_cache[image_name] = image
+
+
+def build_sprite_sheet(file_name=SPRITE_SHEET + ".png"):
+    """Combine every tile image into a single sprite sheet for load_images.
+
+    Needs a Tk root window to exist, e.g. python -c "import tkinter, gui; tkinter.Tk(); gui.build_sprite_sheet()"
+
+    Parameters:
+        file_name (str): Where to write the sprite sheet.
+    """
+    rows = -(-len(SPRITE_NAMES) // SPRITE_SHEET_COLUMNS)
+    sheet = tk.PhotoImage(width=SPRITE_SHEET_COLUMNS * TILE_SIZE, height=rows * TILE_SIZE)
+    for sprite_num, name in enumerate(SPRITE_NAMES):
+        row, column = divmod(sprite_num, SPRITE_SHEET_COLUMNS)
+        image = _load_image_file(f"images/{name}")
+        sheet.tk.call(sheet, "copy", image, "-to", column * TILE_SIZE, row * TILE_SIZE)
+    sheet.write(file_name, format=os.path.splitext(file_name)[1][1:])
 
 
 def main():
     root = tk.Tk()
     root.title("Game")
+    load_images()
 
     GameApp(root)
 
@@ -326,5 +666,10 @@ def main():
     root.mainloop()
 
 
+# Profiling is opt-in, see instrumentation.py.
+if instrumentation.is_enabled():
+    instrumentation.instrument(sys.modules[__name__])
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,259 @@
+"""
+Opt-in call counts and latency histograms for the hot paths of the model and GUI.
+
+Nothing is measured unless instrumentation is turned on, either by setting the
+PIPES_INSTRUMENT environment variable before the game is imported or by calling enable().
+Turning it on wraps the methods listed in TARGETS with timing wrappers, and disable()
+puts the original methods back, so while it is off the game runs its own code untouched.
+
+    PIPES_INSTRUMENT=1 python gui.py        # or: instrumentation.enable()
+    ...
+    instrumentation.stats()                 # {"PipeGame.check_win": {"count": ..., ...}, ...}
+    instrumentation.dump("stats.json")
+
+Each method is timed separately, including the time spent in any other measured method
+it calls, so an override that calls super() counts both calls.
+"""
+
+import functools
+import json
+import os
+import sys
+import time
+
+ENVIRONMENT_VARIABLE = "PIPES_INSTRUMENT"
+
+# The functions to measure, by the module they are defined in. Methods are also measured
+# on every subclass that overrides them.
+TARGETS = {
+    "a2": ["PipeGame.check_win", "PipeGame.load_file", "PipeGame.set_pipe",
+           "PipeGame.remove_pipe", "Pipe.get_connected"],
+    "gui": ["BoardView.redraw", "get_image"],
+}
+
+# The target modules sit next to this one, so a module of the same name from anywhere else
+# isn't measured. Keyed by the resolved path of each module's file.
+_TARGET_FILES = {os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                               module_name + ".py")): module_name
+                 for module_name in TARGETS}
+
+# The name check_win's tiles visited are recorded under in stats.
+TILES_VISITED = "check_win.tiles_visited"
+
+_stats = {}
+# (owner, attribute name) -> the original function, for everything currently wrapped.
+_wrapped = {}
+_enabled = False
+
+
+class Histogram:
+    """
+    Counts of values in power of two buckets: 0, 1, 2-3, 4-7, 8-15 and so on.
+    """
+
+    def __init__(self):
+        """ Constructor method for Histogram instances."""
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = []
+
+    def add(self, value):
+        """ Records a value.
+
+                Parameters:
+                    value (int): The value, at least 0.
+        """
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        bucket = value.bit_length()
+        if bucket >= len(self.buckets):
+            self.buckets.extend([0] * (bucket + 1 - len(self.buckets)))
+        self.buckets[bucket] += 1
+
+    def summary(self):
+        """ (dict) The count, total, mean and max, and the histogram keyed by the largest
+            value in each bucket that has any values.
+        """
+        return {"count": self.count, "total": self.total,
+                "mean": self.total / self.count if self.count else None, "max": self.max,
+                "histogram": {str((1 << bucket) - 1): count
+                              for bucket, count in enumerate(self.buckets) if count}}
+
+
+def _histogram(name):
+    """ (Histogram) The histogram recorded under name, made the first time it is needed."""
+    histogram = _stats.get(name)
+    if histogram is None:
+        histogram = _stats[name] = Histogram()
+    return histogram
+
+
+def _timed(function):
+    """ (callable) Wraps function to record each call's latency in nanoseconds."""
+    histogram = _histogram(function.__qualname__)
+    clock = time.perf_counter_ns
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            histogram.add(clock() - start)
+    return timed
+
+
+def _counting_expand_flow(function):
+    """ (callable) Wraps PipeGame._expand_flow to count the states it adds to the flow.
+
+            The flow is what check_win looks up, so these states are the tiles visited
+            to answer the next check_win.
+    """
+    @functools.wraps(function)
+    def expand_flow(self, states):
+        before = len(self._flow)
+        try:
+            return function(self, states)
+        finally:
+            self._tiles_visited = getattr(self, "_tiles_visited", 0) + len(self._flow) - before
+    return expand_flow
+
+
+def _counting_search(function):
+    """ (callable) Wraps a search of a PackedPipeGame board to count the states it visits."""
+    @functools.wraps(function)
+    def search(self, *args):
+        visited = function(self, *args)
+        self._tiles_visited = getattr(self, "_tiles_visited", 0) + len(visited)
+        return visited
+    return search
+
+
+def _counting_check_win(function):
+    """ (callable) Wraps a timed check_win to record the tiles visited since the last one."""
+    histogram = _histogram(TILES_VISITED)
+
+    @functools.wraps(function)
+    def check_win(self):
+        try:
+            return function(self)
+        finally:
+            histogram.add(getattr(self, "_tiles_visited", 0))
+            self._tiles_visited = 0
+    return check_win
+
+
+def _wrap(owner, name, wrapper):
+    """ Replaces owner.name with wrapper(owner.name), unless it is already wrapped."""
+    if (owner, name) in _wrapped:
+        return
+    function = getattr(owner, name)
+    _wrapped[(owner, name)] = function
+    setattr(owner, name, wrapper(function))
+
+
+def _overriding_classes(cls, name):
+    """ (list<type>) Whichever of cls and its subclasses define name themselves."""
+    classes = [cls] if name in vars(cls) else []
+    for subclass in cls.__subclasses__():
+        classes.extend(_overriding_classes(subclass, name))
+    return classes
+
+
+def _module_name(module):
+    """ (str) The TARGETS key of a module, found from the file it was loaded from so gui.py
+        run as __main__ is "gui" (None if it isn't one of the target modules).
+    """
+    file_name = getattr(module, "__file__", None)
+    if file_name is None:
+        return None
+    return _TARGET_FILES.get(os.path.realpath(file_name))
+
+
+def instrument(module):
+    """ Wraps the targets a module defines. Targets the module doesn't define yet (because
+        it is still being imported) are skipped, ready for a later call.
+
+            Parameters:
+                module (module): The module, e.g. a2 or gui.
+    """
+    for target in TARGETS.get(_module_name(module), []):
+        *class_name, name = target.split(".")
+        if not class_name:
+            if hasattr(module, name):
+                _wrap(module, name, _timed)
+            continue
+        cls = getattr(module, class_name[0], None)
+        if cls is None:
+            continue
+        wrapper = _timed
+        if name == "check_win":
+            wrapper = lambda function: _counting_check_win(_timed(function))
+        for owner in _overriding_classes(cls, name):
+            _wrap(owner, name, wrapper)
+        if target == "PipeGame.check_win":
+            _wrap(cls, "_expand_flow", _counting_expand_flow)
+            # Boards that don't keep a flow search the board on every check_win instead.
+            for search in ("_search_flow", "_search_back"):
+                for owner in _overriding_classes(cls, search):
+                    _wrap(owner, search, _counting_search)
+
+
+def enable():
+    """ Turns instrumentation on for every target module imported so far. The target modules
+        call instrument on themselves when they are imported while instrumentation is on.
+    """
+    global _enabled
+    _enabled = True
+    for module in list(sys.modules.values()):
+        if module is not None and _module_name(module) in TARGETS:
+            instrument(module)
+
+
+def disable():
+    """ Turns instrumentation off, putting back every original function. The stats so far are kept."""
+    global _enabled
+    _enabled = False
+    for (owner, name), function in _wrapped.items():
+        setattr(owner, name, function)
+    _wrapped.clear()
+
+
+def is_enabled():
+    """ (bool) Whether instrumentation is on."""
+    return _enabled
+
+
+def reset():
+    """ Forgets every measurement recorded so far."""
+    for histogram in _stats.values():
+        histogram.__init__()
+
+
+def stats():
+    """ Summarises every measurement recorded so far.
+
+            Returns:
+                dict<str, dict>: For each measured function, by qualified name, the number of
+                calls, total, mean and max latency and a latency histogram, all in
+                nanoseconds. TILES_VISITED has the same summary of the tiles each
+                check_win visited.
+    """
+    return {name: histogram.summary() for name, histogram in _stats.items() if histogram.count}
+
+
+def dump(file_name):
+    """ Writes stats() to a JSON file.
+
+            Parameters:
+                file_name (str): Name of the file to write.
+    """
+    with open(file_name, "w") as stats_file:
+        json.dump(stats(), stats_file, indent=2, sort_keys=True)
+
+
+if os.environ.get(ENVIRONMENT_VARIABLE):
+    enable()
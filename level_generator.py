@@ -0,0 +1,257 @@
+"""
+Seeded generator of solvable levels.
+
+Carves a random path from a start pipe to an end pipe, pre-places some of the path's
+pipes, fills the rest of the board with locked tiles and pre-placed distractor pipes and
+writes the playable pipes the player needs (plus some spares) to the last row. The same
+seed always gives the same level.
+
+Usage:
+    python level_generator.py levels/ --count 10000 --size 8 8 --difficulty 0.7 --seed 1
+"""
+
+import argparse
+import os
+import random
+import sys
+
+from a2 import (CONNECTION_TABLE, DIRECTIONS, DIRECTION_DELTAS, OPPOSITE_DIRECTIONS, PIPE_CODES,
+                PIPES)
+
+
+def _build_pipe_choices():
+    """ Precomputes every pipe that carries water from one side of a tile to another.
+
+            Returns:
+                dict<tuple<str, str>, list<tuple<str, int>>>: (pipe name, orientation) pairs
+                keyed by (entry side, exit side), simplest pipe types first.
+    """
+    choices = {}
+    for name in PIPES.values():
+        for orientation in range(4):
+            for entry, exits in CONNECTION_TABLE[name][orientation].items():
+                for exit_side in exits:
+                    pipe_choices = choices.setdefault((entry, exit_side), [])
+                    if not any(choice[0] == name for choice in pipe_choices):
+                        pipe_choices.append((name, orientation))
+    return choices
+
+
+PIPE_CHOICES = _build_pipe_choices()
+
+
+class LevelGenerator:
+    """
+    Makes levels that can always be won.
+
+    Difficulty is a number from 0 to 1. Harder levels leave more of the path for the
+    player to fill in, use more unusual pipes, give fewer spare pipes and have more
+    locked tiles and distractors.
+    """
+
+    def __init__(self, rows=6, cols=6, path_length=None, difficulty=0.5):
+        """ Constructor method for LevelGenerator instances.
+
+                Parameters:
+                    rows (int): The number of rows of each board, at least 2.
+                    cols (int): The number of columns of each board, at least 2.
+                    path_length (int): The number of pipes wanted between the start and end
+                    pipes, from 1 to rows * cols - 2. The path is shorter if no path that
+                    long is found in time. Defaults to a third of the board.
+                    difficulty (float): How hard the levels are, from 0 to 1.
+
+                Raises:
+                    ValueError: If the board is too small, or the path length or difficulty
+                    is out of range.
+        """
+        if rows < 2 or cols < 2:
+            raise ValueError(f"a {rows}x{cols} board is too small for a level")
+        if path_length is None:
+            path_length = max(1, rows * cols // 3)
+        elif not 1 <= path_length <= rows * cols - 2:
+            raise ValueError(f"path length {path_length} isn't between 1 and {rows * cols - 2} "
+                             f"for a {rows}x{cols} board")
+        if not 0 <= difficulty <= 1:
+            raise ValueError(f"difficulty {difficulty} isn't between 0 and 1")
+        self.rows = rows
+        self.cols = cols
+        self.path_length = path_length
+        self.difficulty = difficulty
+
+    def generate(self, seed):
+        """ Makes the level for a seed.
+
+                Parameters:
+                    seed (int): The seed of the level.
+
+                Returns:
+                    tuple<list<list<str>>, list<int>, list<tuple>>: The cells of each board
+                    row and the playable pipe counts, in the format of a game file, and moves
+                    that win the level in the format of PipeGame.apply_moves.
+        """
+        rng = random.Random(seed)
+        path = self._carve_path(rng)
+        difficulty = self.difficulty
+
+        board = [["#"] * self.cols for _ in range(self.rows)]
+        counts = dict.fromkeys(PIPES.values(), 0)
+        solution = []
+
+        # The start faces the first step and the end's connection is the last step.
+        board[path[0][0]][path[0][1]] = f"S{DIRECTIONS.index(self._direction(path[0], path[1]))}"
+        board[path[-1][0]][path[-1][1]] = f"E{'SWNE'.index(self._direction(path[-2], path[-1]))}"
+
+        # At least one pipe is always left for the player.
+        player_pipe = rng.randrange(1, len(path) - 1)
+        for index in range(1, len(path) - 1):
+            position = path[index]
+            entry = OPPOSITE_DIRECTIONS[self._direction(path[index - 1], position)]
+            choices = PIPE_CHOICES[(entry, self._direction(position, path[index + 1]))]
+
+            if index == player_pipe or rng.random() < 0.3 + 0.7 * difficulty:
+                # Left for the player to place.
+                if rng.random() < difficulty:
+                    name, orientation = rng.choice(choices)
+                else:
+                    name, orientation = choices[0]
+                counts[name] += 1
+                solution.append(("place", position, name, orientation))
+            else:
+                # Only straights and corners, which can't leak into other parts of the path.
+                name, orientation = choices[0]
+                board[position[0]][position[1]] = f"{PIPE_CODES[name]}{orientation}"
+
+        on_path = set(path)
+        # Distractors next to the path could carry water around a gap the player must fill.
+        near_path = {(row + delta[0], col + delta[1]) for row, col in path
+                     for delta in DIRECTION_DELTAS.values()}
+        pipe_names = list(PIPES.values())
+        for row in range(self.rows):
+            for col in range(self.cols):
+                if (row, col) in on_path:
+                    continue
+                roll = rng.random()
+                if roll < 0.1 + 0.3 * difficulty:
+                    board[row][col] = "L"
+                elif roll < 0.15 + 0.45 * difficulty and (row, col) not in near_path:
+                    board[row][col] = f"{PIPE_CODES[rng.choice(pipe_names)]}{rng.randrange(4)}"
+
+        for _ in range(round((1 - difficulty) * len(path) / 2)):
+            counts[rng.choice(pipe_names)] += 1
+
+        return board, [counts[name] for name in PIPES.values()], solution
+
+    def _carve_path(self, rng):
+        """ Finds a random path that doesn't cross itself, as long as the board allows.
+
+                Parameters:
+                    rng (random.Random): The source of randomness.
+
+                Returns:
+                    list<tuple<int, int>>: The positions along the path, from the start pipe
+                    to the end pipe. There are at least three.
+        """
+        wanted = self.path_length + 2
+        best = []
+        # Depth first search, giving up after a bounded number of steps.
+        budget = 20 * wanted
+        start = (rng.randrange(self.rows), rng.randrange(self.cols))
+        path = [start]
+        visited = {start}
+        options = [self._shuffled_neighbours(start, visited, rng)]
+        while path and budget > 0:
+            if len(path) > len(best):
+                best = list(path)
+                if len(best) >= wanted:
+                    break
+            if options[-1]:
+                position = options[-1].pop()
+                if position in visited:
+                    continue
+                budget -= 1
+                path.append(position)
+                visited.add(position)
+                options.append(self._shuffled_neighbours(position, visited, rng))
+            else:
+                visited.discard(path.pop())
+                options.pop()
+        return best
+
+    def _shuffled_neighbours(self, position, visited, rng):
+        """ (list<tuple<int, int>>) The unvisited positions next to position, in random order."""
+        neighbours = []
+        for direction in DIRECTIONS:
+            row = position[0] + DIRECTION_DELTAS[direction][0]
+            col = position[1] + DIRECTION_DELTAS[direction][1]
+            if 0 <= row < self.rows and 0 <= col < self.cols and (row, col) not in visited:
+                neighbours.append((row, col))
+        rng.shuffle(neighbours)
+        return neighbours
+
+    @staticmethod
+    def _direction(position, following):
+        """ (str) The direction of the step from position to the next position."""
+        delta = (following[0] - position[0], following[1] - position[1])
+        for direction, direction_delta in DIRECTION_DELTAS.items():
+            if direction_delta == delta:
+                return direction
+
+
+def write_level(game_file, level):
+    """ Writes a level returned by LevelGenerator.generate to a game file.
+
+            Parameters:
+                game_file (str): Name of the file to write.
+                level (tuple): The board rows, playable counts and solution.
+    """
+    board, counts = level[:2]
+    with open(game_file, "w") as level_file:
+        for cells in board:
+            level_file.write(",".join(cells) + "\n")
+        level_file.write(",".join(str(count) for count in counts))
+
+
+def generate_levels(directory, count, generator, seed=0):
+    """ Writes count levels named game_<seed>.csv, using consecutive seeds.
+
+            Parameters:
+                directory (str): Directory to write the levels to. Created if missing.
+                count (int): How many levels to write.
+                generator (LevelGenerator obj): Makes the levels.
+                seed (int): The seed of the first level.
+
+            Returns:
+                list<str>: The names of the files written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    game_files = []
+    for level_seed in range(seed, seed + count):
+        game_file = os.path.join(directory, f"game_{level_seed}.csv")
+        write_level(game_file, generator.generate(level_seed))
+        game_files.append(game_file)
+    return game_files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write randomly generated levels that can be won.")
+    parser.add_argument("directory", help="directory to write game_<seed>.csv files to")
+    parser.add_argument("-n", "--count", type=int, default=100, help="number of levels (default: %(default)s)")
+    parser.add_argument("--size", type=int, nargs=2, default=[6, 6], metavar=("ROWS", "COLS"),
+                        help="board size (default: 6 6)")
+    parser.add_argument("--path-length", type=int, default=None,
+                        help="pipes between the start and end (default: a third of the board)")
+    parser.add_argument("-d", "--difficulty", type=float, default=0.5,
+                        help="from 0 (easy) to 1 (hard) (default: %(default)s)")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the first level (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        generator = LevelGenerator(args.size[0], args.size[1], args.path_length, args.difficulty)
+    except ValueError as error:
+        parser.error(str(error))
+    generate_levels(args.directory, args.count, generator, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,33 @@
 from a2 import *
+import batch_check
+import benchmark
+import level_generator
+import session
+import game_server
+import instrumentation
+import asyncio
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import types
 import unittest
 
+try:
+	import batch_win
+except ImportError:
+	# NumPy isn't installed.
+	batch_win = None
+
+try:
+	import gui
+except ImportError:
+	# Tk isn't installed.
+	gui = None
+
 class Test_Tile_methods(unittest.TestCase):
 
 	def setUp(self):
@@ -78,6 +105,17 @@ class Test_Pipe_methods(unittest.TestCase):
 		self.assertEqual(self.c_pipe.get_connected("N"), [])
 		self.assertEqual(self.c_pipe.get_connected("J"), [])
 
+	def test_get_connected_rotated(self):
+		"""Connections at every orientation match rotating the orientation 0 connections."""
+		for name, connections in Pipe.CONNECTIONS.items():
+			for orientation in range(4):
+				pipe = Pipe(name, orientation)
+				for side in "NESW":
+					standard_side = Pipe.convert_orientation(side, orientation, 0)
+					expected = [Pipe.convert_orientation(other, 0, orientation)
+								for other in connections.get(standard_side, [])]
+					self.assertEqual(pipe.get_connected(side), expected)
+
 
 class Test_Special_Pipe_subclass_methods(unittest.TestCase):
 
@@ -101,5 +139,973 @@ class Test_Special_Pipe_subclass_methods(unittest.TestCase):
 		self.assertEqual(b_end_pipe._orientation, 1)
 		self.assertEqual(b_end_pipe.get_connected(), "W")
 
+class Test_shared_tiles(unittest.TestCase):
+
+	def test_empty_tiles_are_shared(self):
+		game = PipeGame("game_1.csv")
+		shared_tile = game._stored_tile((0, 0))
+		self.assertIs(shared_tile, game._stored_tile((5, 5)))
+		self.assertFalse(hasattr(shared_tile, "__dict__"))
+		self.assertFalse(hasattr(Pipe("corner"), "__dict__"))
+		self.assertFalse(hasattr(StartPipe(1), "__dict__"))
+		with self.assertRaises(TypeError):
+			shared_tile.set_select(False)
+
+	def test_set_select_through_board_layout(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = game_type("game_1.csv")
+			layout = game.get_board_layout()
+			self.assertIsNot(layout[0][0], layout[5][5])
+			layout[0][0].set_select(False)
+			self.assertFalse(game.get_pipe((0, 0)).can_select())
+			self.assertTrue(game.get_board_layout()[5][5].can_select())
+			self.assertEqual(game.state_hash(), game._compute_state_hash())
+
+	def test_set_select_on_shared_tile(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = game_type("game_1.csv")
+			events = []
+			game.subscribe(lambda event, details: events.append((event, details)))
+			game.state_hash()
+			tile = game.get_pipe((0, 0))
+			self.assertIs(game.get_pipe((0, 0)), tile)
+			tile.set_select(False)
+			self.assertFalse(tile.can_select())
+			self.assertFalse(game.get_pipe((0, 0)).can_select())
+			self.assertTrue(game.get_pipe((0, 1)).can_select())
+			self.assertEqual(game.state_hash(), game._compute_state_hash())
+			self.assertEqual(events, [(SELECTABLE_CHANGED, {"position": (0, 0), "selectable": False})])
+			game.set_pipe(Pipe("corner"), (0, 1))
+			game.set_selectable((0, 1), False)
+			self.assertEqual(events[-1], (SELECTABLE_CHANGED, {"position": (0, 1), "selectable": False}))
+			game.get_pipe((0, 0)).set_select(True)
+			self.assertTrue(game.get_pipe((0, 0)).can_select())
+			self.assertEqual(game.state_hash(), game._compute_state_hash())
+
+	def test_set_selectable(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = game_type("game_1.csv")
+			game.set_selectable((0, 0), False)
+			self.assertFalse(game.get_pipe((0, 0)).can_select())
+			self.assertTrue(game.get_pipe((0, 1)).can_select())
+			game.set_pipe(Pipe("corner"), (2, 2))
+			game.set_selectable((2, 2), False)
+			self.assertFalse(game.get_pipe((2, 2)).can_select())
+			game.set_selectable((0, 0), True)
+			self.assertTrue(game.get_pipe((0, 0)).can_select())
+
+	def test_set_selectable_special_pipes(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = game_type("game_1.csv")
+			game.state_hash()
+			start = game.get_starting_position()
+			end = game.get_ending_position()
+			game.set_selectable(start, True)
+			game.set_selectable(end, True)
+			gc.collect()
+			self.assertTrue(game.get_pipe(start).can_select())
+			self.assertTrue(game.get_pipe(end).can_select())
+			self.assertEqual(game.state_hash(), game._compute_state_hash())
+			game.rotate_pipe(start, 1)
+			gc.collect()
+			self.assertTrue(game.get_pipe(start).can_select())
+			self.assertEqual(game.state_hash(), game._compute_state_hash())
+
+
+class Test_PipeGame_check_win(unittest.TestCase):
+
+	# A winning path for game_1.csv as (position, pipe name, orientation).
+	WINNING_PATH = [((1, 1), "corner", 2), ((2, 1), "straight", 0), ((3, 1), "straight", 0),
+					((4, 1), "corner", 0), ((4, 2), "straight", 1), ((4, 3), "straight", 1)]
+
+	def setUp(self):
+		self.game = PipeGame("game_1.csv")
+
+	def place_path(self):
+		for position, name, orientation in self.WINNING_PATH:
+			self.assertFalse(self.game.check_win())
+			self.game.set_pipe(Pipe(name, orientation), position)
+
+	def test_win_after_path_placed(self):
+		self.place_path()
+		self.assertTrue(self.game.check_win())
+
+	def test_rotate_updates_win(self):
+		self.place_path()
+		pipe = self.game.get_pipe((2, 1))
+		pipe.rotate(1)
+		self.assertFalse(self.game.check_win())
+		pipe.rotate(-1)
+		self.assertTrue(self.game.check_win())
+
+	def test_remove_updates_win(self):
+		self.place_path()
+		self.game.remove_pipe((4, 2))
+		self.assertFalse(self.game.check_win())
+		self.game.set_pipe(Pipe("straight", 1), (4, 2))
+		self.assertTrue(self.game.check_win())
+
+	def test_rotate_end_pipe_updates_win(self):
+		with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as game_file:
+			game_file.write("S1,ST1,E0\n#,#,#\n#,#,#\n0,0,0,0,0,0")
+		self.addCleanup(os.remove, game_file.name)
+		game = type(self.game)(game_file.name)
+		end_pipe = game.get_pipe((0, 2))
+		self.assertFalse(game.check_win())
+		for _ in range(3):
+			end_pipe.rotate(1)
+		self.assertTrue(game.check_win())
+		end_pipe.rotate(1)
+		self.assertFalse(game.check_win())
+		game.get_pipe((0, 0)).rotate(1)
+		end_pipe.rotate(-1)
+		self.assertFalse(game.check_win())
+		game.get_pipe((0, 0)).rotate(-1)
+		self.assertTrue(game.check_win())
+
+
+class Test_PipeGame_events(unittest.TestCase):
+
+	def setUp(self):
+		self.game = PipeGame("game_1.csv")
+		self.events = []
+		self.game.subscribe(self.record)
+
+	def record(self, event, details):
+		self.events.append((event, details))
+
+	def test_place_rotate_remove(self):
+		pipe = Pipe("straight")
+		self.game.set_pipe(pipe, (0, 0))
+		self.game.rotate_pipe((0, 0), 1)
+		self.game.remove_pipe((0, 0))
+		self.assertEqual(self.events, [
+			(PLAYABLE_CHANGED, {"pipe": "straight", "count": 4}),
+			(TILE_PLACED, {"position": (0, 0), "tile": pipe}),
+			(TILE_ROTATED, {"position": (0, 0), "orientation": 1}),
+			(PLAYABLE_CHANGED, {"pipe": "straight", "count": 5}),
+			(TILE_REMOVED, {"position": (0, 0), "tile": pipe}),
+		])
+
+	def test_remove_without_pipe(self):
+		start = dict(self.game.get_playable_pipes())
+		for position in ((0, 0), (1, 0), (3, 4)):
+			with self.assertRaises(KeyError):
+				self.game.remove_pipe(position)
+		self.assertEqual(self.game.get_playable_pipes(), start)
+		self.assertEqual(self.events, [])
+		self.assertFalse(self.game.can_undo())
+
+	def test_win_changed(self):
+		for position, name, orientation in Test_PipeGame_check_win.WINNING_PATH:
+			self.game.set_pipe(Pipe(name, orientation), position)
+		self.assertEqual(self.events[-1], (WIN_CHANGED, {"won": True}))
+		self.game.get_pipe((2, 1)).rotate(1)
+		self.assertEqual(self.events[-1], (WIN_CHANGED, {"won": False}))
+
+	def test_unsubscribe(self):
+		self.game.unsubscribe(self.record)
+		self.game.set_pipe(Pipe("straight"), (0, 0))
+		self.assertEqual(self.events, [])
+
+
+class Test_PipeGame_undo(unittest.TestCase):
+
+	def setUp(self):
+		self.game = PipeGame("game_1.csv")
+
+	def state(self):
+		return (str(self.game.get_board_layout()), dict(self.game.get_playable_pipes()), self.game.check_win())
+
+	def test_undo_redo(self):
+		start = self.state()
+		self.assertFalse(self.game.undo())
+		self.game.set_pipe(Pipe("straight"), (0, 0))
+		placed = self.state()
+		self.game.rotate_pipe((0, 0), 1)
+		rotated = self.state()
+		self.game.remove_pipe((0, 0))
+		self.assertTrue(self.game.undo())
+		self.assertEqual(self.state(), rotated)
+		self.assertTrue(self.game.undo())
+		self.assertEqual(self.state(), placed)
+		self.assertTrue(self.game.undo())
+		self.assertEqual(self.state(), start)
+		self.assertFalse(self.game.can_undo())
+		self.assertTrue(self.game.redo())
+		self.assertEqual(self.state(), placed)
+		# A new move forgets the undone moves.
+		self.game.get_pipe((0, 0)).rotate(-1)
+		self.assertFalse(self.game.can_redo())
+
+	def test_undo_win(self):
+		for position, name, orientation in Test_PipeGame_check_win.WINNING_PATH:
+			self.game.set_pipe(Pipe(name, orientation), position)
+		self.assertTrue(self.game.check_win())
+		self.game.undo()
+		self.assertFalse(self.game.check_win())
+		self.game.redo()
+		self.assertTrue(self.game.check_win())
+
+	def test_snapshot_restore(self):
+		self.game.set_pipe(Pipe("corner"), (0, 0))
+		snapshot = self.game.snapshot()
+		expected = self.state()
+		self.game.set_pipe(Pipe("cross"), (0, 1))
+		self.game.rotate_pipe((0, 0), 1)
+		self.game.restore(snapshot)
+		self.assertEqual(self.state(), expected)
+		# The moves made since the snapshot can be redone.
+		self.assertTrue(self.game.redo())
+		self.game.undo()
+		self.game.undo()
+		self.game.set_pipe(Pipe("straight"), (5, 5))
+		with self.assertRaises(ValueError):
+			self.game.restore(snapshot)
+
+	def test_history_limit(self):
+		game = PipeGame("game_1.csv", history_limit=2)
+		snapshot = game.snapshot()
+		for col in range(3):
+			game.set_pipe(Pipe("straight"), (0, col))
+		self.assertTrue(game.undo())
+		self.assertTrue(game.undo())
+		self.assertFalse(game.undo())
+		with self.assertRaises(ValueError):
+			game.restore(snapshot)
+
+
+class Test_multiple_end_pipes(unittest.TestCase):
+
+	# Two start pipes facing east into two rows, each with an end pipe at the far end.
+	LEVEL = "S1,#,E3\nS1,#,E3\n2,0,0,0,0,0"
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.game_file = os.path.join(self.directory.name, "two_pairs.csv")
+		with open(self.game_file, "w") as level_file:
+			level_file.write(self.LEVEL)
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+	def test_positions(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = game_type(self.game_file)
+			self.assertEqual(game.get_starting_positions(), ((0, 0), (1, 0)))
+			self.assertEqual(game.get_ending_positions(), ((0, 2), (1, 2)))
+			self.assertEqual(game.get_starting_position(), (0, 0))
+			game.end_pipe_positions()
+			self.assertEqual(game.get_ending_positions(), ((0, 2), (1, 2)))
+
+	def test_every_pair_must_connect(self):
+		for condition in WIN_CONDITIONS:
+			for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+				game = game_type(self.game_file, None, condition)
+				game.set_pipe(Pipe("straight", 1), (0, 1))
+				self.assertFalse(game.check_win(), (condition, game_type))
+				game.set_pipe(Pipe("straight", 1), (1, 1))
+				self.assertTrue(game.check_win(), (condition, game_type))
+
+	def test_win_conditions_differ(self):
+		# The top start pipe fills both end pipes, the bottom one faces a locked tile.
+		game_file = os.path.join(self.directory.name, "one_source.csv")
+		with open(game_file, "w") as level_file:
+			level_file.write("S1,JT0,E3\n#,CO0,E3\nS1,L,#\n0,0,0,0,0,0")
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			self.assertTrue(game_type(game_file, None, WIN_ALL_ENDS).check_win())
+			self.assertFalse(game_type(game_file, None, WIN_ALL_STARTS).check_win())
+
+	def test_unknown_win_condition(self):
+		with self.assertRaises(ValueError):
+			PipeGame(self.game_file, None, "any_end")
+
+	def test_single_pair_tools_refuse(self):
+		# Only the top pair is connected, so the game isn't won.
+		game_file = os.path.join(self.directory.name, "half_done.csv")
+		with open(game_file, "w") as level_file:
+			level_file.write("S1,ST1,E3\nS1,#,E3\n0,0,0,0,0,0")
+		game = PipeGame(game_file)
+		self.assertFalse(game.check_win())
+		with self.assertRaises(ValueError):
+			Solver(game)
+		with self.assertRaises(ValueError):
+			game.hint()
+		self.assertIn("error", batch_check.check_level(game_file))
+		if batch_win is not None:
+			with self.assertRaises(ValueError):
+				batch_win.check_games([game])
+
+
+class Test_PackedPipeGame_check_win(Test_PipeGame_check_win):
+
+	def setUp(self):
+		self.game = PackedPipeGame("game_1.csv")
+
+	def test_board_layout_matches(self):
+		layout = self.game.get_board_layout()
+		self.assertEqual(str(layout), str(PipeGame("game_1.csv").get_board_layout()))
+		self.assertIs(self.game.get_pipe((2, 3)), self.game.get_pipe((2, 3)))
+
+	def test_only_keeps_held_pipes(self):
+		pipe = self.game.get_pipe((2, 3))
+		self.game.get_board_layout()
+		Solver(self.game)
+		self.assertEqual(list(self.game._pipes.keys()), [(2, 3)])
+		pipe.rotate(1)
+		self.assertEqual(self.game.get_pipe((2, 3)).get_orientation(), 1)
+		del pipe
+		self.assertEqual(len(self.game._pipes), 0)
+		self.assertEqual(self.game.get_pipe((2, 3)).get_orientation(), 1)
+
+	def test_failed_placement_leaves_game_unchanged(self):
+		self.game.set_pipe(Pipe("corner"), (0, 0))
+		playable = dict(self.game.get_playable_pipes())
+		state_hash = self.game.state_hash()
+		with self.assertRaises(ValueError):
+			self.game.set_pipe(Pipe("weird"), (2, 3))
+		self.assertEqual(self.game.get_playable_pipes(), playable)
+		self.assertEqual(self.game.state_hash(), state_hash)
+		self.assertEqual(self.game.get_pipe((2, 3)).get_name(), "junction-t")
+		self.game.undo()
+		self.assertEqual(self.game.get_pipe((0, 0)).get_name(), "tile")
+		self.assertFalse(self.game.can_undo())
+
+
+class Test_SparsePipeGame_check_win(Test_PipeGame_check_win):
+
+	def setUp(self):
+		self.game = SparsePipeGame("game_1.csv")
+
+	def test_board_layout_matches(self):
+		layout = self.game.get_board_layout()
+		self.assertEqual(str(layout), str(PipeGame("game_1.csv").get_board_layout()))
+
+
+class Test_LevelReader(unittest.TestCase):
+
+	def write_level(self, text):
+		game_file = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+		game_file.write(text)
+		game_file.close()
+		self.addCleanup(os.remove, game_file.name)
+		return game_file.name
+
+	def test_non_square_board(self):
+		game = PipeGame(self.write_level("S1,#,#,E3\n#,L,ST1,#\n1,0,0,0,0,0\n"))
+		self.assertEqual(len(game.get_board_layout()), 2)
+		self.assertEqual(len(game.get_board_layout()[0]), 4)
+		self.assertEqual(game.get_starting_position(), (0, 0))
+		self.assertEqual(game.get_ending_position(), (0, 3))
+		self.assertEqual(game.get_playable_pipes()["straight"], 1)
+		self.assertEqual(game.get_dimensions(), (2, 4))
+		self.assertEqual(game.position_in_direction("E", (1, 2)), ("W", (1, 3)))
+		self.assertIsNone(game.position_in_direction("S", (1, 2)))
+
+	def test_unknown_tile(self):
+		with self.assertRaises(LevelFormatError) as context:
+			PipeGame(self.write_level("S1,#\n#,XX\n1,0,0,0,0,0"))
+		self.assertEqual((context.exception.row, context.exception.column), (1, 1))
+
+	def test_ragged_row(self):
+		with self.assertRaises(LevelFormatError) as context:
+			PipeGame(self.write_level("S1,#\n#\n1,0,0,0,0,0"))
+		self.assertEqual(context.exception.row, 1)
+
+	def test_bad_playable_count(self):
+		with self.assertRaises(LevelFormatError) as context:
+			PipeGame(self.write_level("S1,E3\n1,0,x,0,0,0"))
+		self.assertEqual((context.exception.row, context.exception.column), (1, 2))
+
+
+class Test_LevelTemplate(unittest.TestCase):
+
+	def test_games_from_template(self):
+		template = LevelTemplate("game_1.csv")
+		for backend in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = backend(template)
+			expected = PipeGame("game_1.csv")
+			self.assertEqual(str(game.get_board_layout()), str(expected.get_board_layout()))
+			self.assertEqual(game.get_playable_pipes(), expected.get_playable_pipes())
+			self.assertEqual(game.get_starting_position(), (1, 0))
+
+	def test_games_are_independent(self):
+		template = LevelTemplate("game_1.csv")
+		first = PipeGame(template)
+		second = PipeGame(template)
+		first.set_pipe(Pipe("straight"), (0, 0))
+		self.assertEqual(second.get_pipe((0, 0)).get_name(), "tile")
+		self.assertEqual(second.get_playable_pipes()["straight"], 5)
+
+
+class Test_Solver(unittest.TestCase):
+
+	def test_solution_wins(self):
+		for game_file in ("game_1.csv", "game_2.csv"):
+			game = PipeGame(game_file)
+			moves = game.solve()
+			self.assertIsNotNone(moves)
+			game.apply_moves(moves)
+			self.assertTrue(game.check_win())
+
+	def test_respects_inventory(self):
+		game = PipeGame("game_1.csv")
+		for pipe, count in list(game.get_playable_pipes().items()):
+			game.change_playable_amount(pipe, -count)
+		solver = Solver(game)
+		self.assertIsNone(solver.solve())
+		self.assertFalse(solver.timed_out)
+
+	def test_shares_out_pipe_types(self):
+		with tempfile.TemporaryDirectory() as directory:
+			game_file = os.path.join(directory, "bend.csv")
+			# The water needs a straight then a bend.
+			for counts, solvable in (("1,1,0,0,0,0", True), ("0,2,0,0,0,0", False)):
+				with open(game_file, "w") as level_file:
+					level_file.write(f"S1,#,#\nL,L,E0\n{counts}")
+				game = PipeGame(game_file)
+				solver = Solver(game)
+				moves = solver.solve()
+				self.assertFalse(solver.timed_out)
+				self.assertEqual(moves is not None, solvable, counts)
+				if solvable:
+					self.assertEqual([move[2] for move in moves], ["straight", "corner"])
+					game.apply_moves(moves)
+					self.assertTrue(game.check_win())
+
+	def test_open_board_with_tight_inventory(self):
+		with tempfile.TemporaryDirectory() as directory:
+			game_file = os.path.join(directory, "open.csv")
+			# Just enough straights and bends to cross the board, and too few bends for a
+			# route to turn the odd number of times it has to.
+			for size, counts, solvable in ((30, "45,20,0,0,0,0", True), (15, "17,10,0,0,0,0", False)):
+				rows = [["#"] * size for _ in range(size)]
+				rows[0][0], rows[-1][-1] = "S1", "E0"
+				with open(game_file, "w") as level_file:
+					level_file.write("\n".join(",".join(row) for row in rows) + f"\n{counts}")
+				game = PipeGame(game_file)
+				solver = Solver(game, max_nodes=20000)
+				moves = solver.solve()
+				self.assertFalse(solver.timed_out, counts)
+				self.assertEqual(moves is not None, solvable, counts)
+				if solvable:
+					game.apply_moves(moves)
+					self.assertTrue(game.check_win())
+
+	def test_open_board_with_mixed_inventory(self):
+		with tempfile.TemporaryDirectory() as directory:
+			game_file = os.path.join(directory, "open.csv")
+			# Split pipes mean a route could go through a tile twice, so the solver can't
+			# lean on the straight and bend counts alone.
+			for size, counts, solvable in ((10, "3,3,3,3,3,3", True), (30, "10,10,10,10,10,10", True),
+										   (5, "1,1,1,1,1,1", False)):
+				rows = [["#"] * size for _ in range(size)]
+				rows[0][0], rows[-1][-1] = "S1", "E0"
+				with open(game_file, "w") as level_file:
+					level_file.write("\n".join(",".join(row) for row in rows) + f"\n{counts}")
+				game = PipeGame(game_file)
+				solver = Solver(game, time_limit=10)
+				moves = solver.solve()
+				self.assertFalse(solver.timed_out, counts)
+				self.assertEqual(moves is not None, solvable, counts)
+				if solvable:
+					game.apply_moves(moves)
+					self.assertTrue(game.check_win())
+
+	def test_generated_levels(self):
+		generator = level_generator.LevelGenerator(8, 8, difficulty=0.5)
+		with tempfile.TemporaryDirectory() as directory:
+			for game_file in level_generator.generate_levels(directory, 10, generator):
+				game = PipeGame(game_file)
+				moves = game.solve(time_limit=2)
+				self.assertIsNotNone(moves, game_file)
+				game.apply_moves(moves)
+				self.assertTrue(game.check_win(), game_file)
+
+
+class Test_instrumentation(unittest.TestCase):
+
+	def tearDown(self):
+		instrumentation.disable()
+		instrumentation.reset()
+
+	def test_stats(self):
+		instrumentation.enable()
+		game = PipeGame("game_1.csv")
+		moves = game.solve()
+		game.apply_moves(moves)
+		self.assertTrue(game.check_win())
+		PackedPipeGame("game_1.csv").check_win()
+
+		stats = instrumentation.stats()
+		self.assertEqual(stats["PipeGame.check_win"]["count"], 1)
+		self.assertEqual(stats["PackedPipeGame.check_win"]["count"], 1)
+		self.assertEqual(stats[instrumentation.TILES_VISITED]["count"], 2)
+		self.assertGreater(stats[instrumentation.TILES_VISITED]["max"], 0)
+		self.assertGreaterEqual(stats["PipeGame.set_pipe"]["count"], len(moves))
+		self.assertIn("Pipe.get_connected", stats)
+		self.assertEqual(sum(stats["PipeGame.load_file"]["histogram"].values()), 1)
+
+		with tempfile.TemporaryDirectory() as directory:
+			file_name = os.path.join(directory, "stats.json")
+			instrumentation.dump(file_name)
+			with open(file_name) as stats_file:
+				self.assertEqual(json.load(stats_file).keys(), stats.keys())
+
+	def test_only_instruments_target_files(self):
+		self.assertEqual(instrumentation._module_name(sys.modules[PipeGame.__module__]), "a2")
+		with tempfile.TemporaryDirectory() as directory:
+			other = types.ModuleType("gui")
+			other.__file__ = os.path.join(directory, "gui.py")
+			other.get_image = lambda: None
+			get_image = other.get_image
+			sys.modules["other_gui"] = other
+			try:
+				self.assertIsNone(instrumentation._module_name(other))
+				instrumentation.enable()
+				self.assertIs(other.get_image, get_image)
+			finally:
+				del sys.modules["other_gui"]
+
+	def test_disable_restores_methods(self):
+		check_win = PipeGame.check_win
+		instrumentation.enable()
+		self.assertIsNot(PipeGame.check_win, check_win)
+		instrumentation.disable()
+		self.assertIs(PipeGame.check_win, check_win)
+		PipeGame("game_1.csv").check_win()
+		self.assertEqual(instrumentation.stats(), {})
+
+	def test_packed_tiles_visited(self):
+		game = PackedPipeGame("game_1.csv")
+		game.check_win()
+		self.assertFalse(hasattr(game, "_tiles_visited"))
+		instrumentation.enable()
+		for win_condition in WIN_CONDITIONS:
+			PackedPipeGame("game_1.csv", win_condition=win_condition).check_win()
+		histogram = instrumentation.stats()[instrumentation.TILES_VISITED]
+		self.assertEqual(histogram["count"], 2)
+		self.assertGreater(histogram["max"], 0)
+
+
+class Test_PipeGame_state_hash(unittest.TestCase):
+
+	def test_same_state_same_hash(self):
+		hashes = {game_type("game_1.csv").state_hash() for game_type in (PipeGame, PackedPipeGame, SparsePipeGame)}
+		self.assertEqual(len(hashes), 1)
+		self.assertLess(hashes.pop(), 2 ** 64)
+		self.assertNotEqual(PipeGame("game_1.csv").state_hash(), PipeGame("game_2.csv").state_hash())
+
+	def test_moves_update_hash(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = game_type("game_1.csv")
+			start = game.state_hash()
+			game.set_pipe(Pipe("corner"), (0, 0))
+			placed = game.state_hash()
+			self.assertNotEqual(placed, start)
+			game.rotate_pipe((0, 0), 1)
+			self.assertNotEqual(game.state_hash(), placed)
+			game.rotate_pipe((0, 0), -1)
+			self.assertEqual(game.state_hash(), placed)
+			game.remove_pipe((0, 0))
+			self.assertEqual(game.state_hash(), start)
+			game.undo()
+			self.assertEqual(game.state_hash(), placed)
+			self.assertEqual(game.state_hash(), game._compute_state_hash())
+
+	def test_rotate_loaded_pipe(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = game_type("game_1.csv")
+			start = game.state_hash()
+			game.pipe_in_position((2, 3)).rotate(1)
+			self.assertEqual(game.get_pipe((2, 3)).get_orientation(), 1)
+			self.assertNotEqual(game.state_hash(), start)
+			self.assertEqual(game.state_hash(), game._compute_state_hash())
+			game.undo()
+			self.assertEqual(game.state_hash(), start)
+
+	def test_inventory_is_hashed(self):
+		game = PipeGame("game_1.csv")
+		start = game.state_hash()
+		game.change_playable_amount("cross", 1)
+		self.assertNotEqual(game.state_hash(), start)
+		game.change_playable_amount("cross", -1)
+		self.assertEqual(game.state_hash(), start)
+
+
+class Test_PipeGame_analyse_flow(unittest.TestCase):
+
+	def test_new_game(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			analysis = game_type("game_1.csv").analyse_flow()
+			self.assertFalse(analysis.is_won())
+			self.assertEqual(analysis.leaks, {((1, 0), 'E')})
+			self.assertEqual(analysis.flowing_positions(), {(1, 0), (1, 1)})
+
+	def test_won_game(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			game = game_type("game_1.csv")
+			game.apply_moves(game.solve())
+			analysis = game.analyse_flow()
+			self.assertTrue(analysis.is_won())
+			self.assertEqual(analysis.path[0], game.get_starting_position())
+			self.assertEqual(analysis.path[-1], game.get_ending_position())
+			self.assertNotIn((game.get_ending_position(), 'E'), analysis.leaks)
+			if game_type is not PackedPipeGame:
+				self.assertEqual(analysis.reached, game._flow)
+
+
+class Test_PipeGame_hint(unittest.TestCase):
+
+	def test_following_hints_wins(self):
+		for game_type in (PipeGame, PackedPipeGame, SparsePipeGame):
+			for game_file in ("game_1.csv", "game_2.csv"):
+				game = game_type(game_file)
+				for _ in range(20):
+					move = game.hint()
+					if move is None:
+						break
+					game.apply_moves([move])
+				self.assertTrue(game.check_win(), (game_type, game_file))
+				self.assertIsNone(game.hint())
+
+	def test_rotate_hint(self):
+		game = PipeGame("game_1.csv")
+		game.set_pipe(Pipe("straight", 0), (1, 1))
+		self.assertEqual(game.hint(), ("rotate", (1, 1), 1))
+
+	def test_respects_inventory(self):
+		game = PipeGame("game_1.csv")
+		for pipe, count in list(game.get_playable_pipes().items()):
+			game.change_playable_amount(pipe, -count)
+		self.assertIsNone(game.hint())
+
+
+class Test_batch_check(unittest.TestCase):
+
+	def test_check_level(self):
+		result = batch_check.check_level("game_1.csv")
+		self.assertTrue(result["solvable"])
+		self.assertFalse(result["already_won"])
+		self.assertGreater(result["nodes_expanded"], 0)
+
+	def test_missing_level(self):
+		self.assertIn("error", batch_check.check_level("no_such_level.csv"))
+
+	def test_timeout_covers_loading(self):
+		time_limits = []
+
+		class SlowGame(PipeGame):
+			def load_file(self, game_file):
+				time.sleep(0.05)
+				return super().load_file(game_file)
+
+		class RecordingSolver(Solver):
+			def __init__(self, game, max_nodes=None, time_limit=None):
+				time_limits.append(time_limit)
+				super().__init__(game, max_nodes, time_limit)
+
+		self.addCleanup(setattr, batch_check, "PipeGame", batch_check.PipeGame)
+		self.addCleanup(setattr, batch_check, "Solver", batch_check.Solver)
+		batch_check.PipeGame = SlowGame
+		batch_check.Solver = RecordingSolver
+		self.assertTrue(batch_check.check_level("game_1.csv", timeout=10)["solvable"])
+		self.assertLessEqual(time_limits[0], 9.95)
+		batch_check.check_level("game_1.csv", timeout=0.01)
+		self.assertEqual(time_limits[1], 0)
+
+	def test_run_reports_worker_errors(self):
+		report = io.StringIO()
+		# check_level raises TypeError for a level that isn't a file name.
+		summary = batch_check.run(["game_1.csv", None, "game_2.csv"], report, workers=1)
+		results = [json.loads(line) for line in report.getvalue().splitlines()]
+		self.assertEqual(sorted(str(result["level"]) for result in results),
+						 ["None", "game_1.csv", "game_2.csv"])
+		error = next(result for result in results if result["level"] is None)
+		self.assertTrue(error["error"].startswith("TypeError"))
+		self.assertEqual(summary["error"], 1)
+		self.assertEqual(summary["solvable"], 2)
+
+
+class Test_benchmark(unittest.TestCase):
+
+	def test_generated_boards(self):
+		with tempfile.TemporaryDirectory() as directory:
+			files = benchmark.generate_boards(directory, 7)
+			for backend in benchmark.BACKENDS:
+				self.assertTrue(backend(files["winning"]).check_win())
+				self.assertFalse(backend(files["losing"]).check_win())
+				self.assertTrue(backend(files["long_path"]).check_win())
+				game = backend(files["empty"])
+				self.assertFalse(game.check_win())
+				game.apply_moves(benchmark.replay_moves(7))
+				self.assertTrue(game.check_win())
+
+	def test_long_path_limit(self):
+		rows = list(benchmark.serpentine_rows(9, max_tiles=30))
+		self.assertEqual(benchmark.long_path_rows(9, 30), 3)
+		self.assertEqual(rows[3:], [["#"] * 9] * 6)
+		with tempfile.TemporaryDirectory() as directory:
+			game_file = os.path.join(directory, "game_long.csv")
+			benchmark.write_board(game_file, rows)
+			self.assertTrue(PipeGame(game_file).check_win())
+
+	def test_compare(self):
+		baseline = {"a": {"ops_per_sec": 100.0, "peak_memory": 10000},
+					"b": {"ops_per_sec": 100.0, "peak_memory": 10000}}
+		results = {"a": {"ops_per_sec": 90.0, "peak_memory": 11000},
+					"b": {"ops_per_sec": 50.0, "peak_memory": 20000},
+					"c": {"ops_per_sec": 1.0, "peak_memory": 1}}
+		regressions = benchmark.compare(results, baseline)
+		self.assertEqual(len(regressions), 2)
+		self.assertTrue(all(regression.startswith("b:") for regression in regressions))
+
+
+class Test_LevelGenerator(unittest.TestCase):
+
+	def test_deterministic(self):
+		generator = level_generator.LevelGenerator(8, 8, difficulty=0.7)
+		self.assertEqual(generator.generate(3), generator.generate(3))
+		self.assertNotEqual(generator.generate(3), generator.generate(4))
+
+	def test_solution_wins(self):
+		with tempfile.TemporaryDirectory() as directory:
+			for difficulty in (0, 0.5, 1):
+				generator = level_generator.LevelGenerator(5, 7, difficulty=difficulty)
+				game_files = level_generator.generate_levels(directory, 20, generator, seed=100)
+				for seed, game_file in enumerate(game_files, 100):
+					level = generator.generate(seed)
+					game = PipeGame(game_file)
+					self.assertFalse(game.check_win())
+					game.apply_moves(level[2])
+					self.assertTrue(game.check_win())
+					self.assertGreaterEqual(min(game.get_playable_pipes().values()), 0)
+
+	def test_too_small(self):
+		with self.assertRaises(ValueError):
+			level_generator.LevelGenerator(1, 5)
+
+	def test_path_length_out_of_range(self):
+		for path_length in (0, -3, 19):
+			with self.assertRaises(ValueError):
+				level_generator.LevelGenerator(4, 5, path_length=path_length)
+		level = level_generator.LevelGenerator(4, 5, path_length=18).generate(1)
+		self.assertEqual(len(level[0]), 4)
+
+
+class Test_GameSession(unittest.TestCase):
+
+	def setUp(self):
+		self.session = session.GameSession("game_1.csv")
+
+	def play_winning_path(self):
+		for position, name, orientation in Test_PipeGame_check_win.WINNING_PATH:
+			self.assertTrue(self.session.place(position, name))
+			for _ in range(orientation):
+				self.assertTrue(self.session.rotate(position))
+
+	def test_rules(self):
+		# Start pipe, locked tile, no pipe to rotate or remove, none left to place.
+		self.assertFalse(self.session.place((1, 0), "straight"))
+		self.assertFalse(self.session.place((3, 4), "straight"))
+		self.assertFalse(self.session.rotate((0, 0)))
+		self.assertFalse(self.session.remove((2, 3)))
+		self.assertFalse(self.session.place((6, 0), "straight"))
+		self.assertTrue(self.session.place((0, 0), "junction-t"))
+		self.assertFalse(self.session.place((0, 1), "junction-t"))
+		self.assertEqual(self.session.moves, [(session.PLACE, (0, 0), "junction-t")])
+
+	def test_save_and_replay(self):
+		self.play_winning_path()
+		self.assertTrue(self.session.place((0, 0), "cross"))
+		self.assertTrue(self.session.rotate((0, 0), -1))
+		self.assertTrue(self.session.remove((0, 0)))
+		with tempfile.TemporaryDirectory() as directory:
+			log_file = os.path.join(directory, "moves.log")
+			self.session.save(log_file)
+			game_file, moves = session.read_log(log_file)
+			moves = list(moves)
+			self.assertEqual(game_file, "game_1.csv")
+			self.assertEqual(moves, self.session.moves)
+			for backend in session.BACKENDS.values():
+				result = session.replay(game_file, moves, backend)
+				self.assertTrue(result.won)
+				self.assertEqual(result.summary()["moves"], len(moves))
+				self.assertEqual(len(result.move_times), len(moves))
+
+	def test_replay_wrong_level(self):
+		with self.assertRaises(session.MoveLogError):
+			session.replay("game_2.csv", [(session.PLACE, (0, 0), "straight"), (session.PLACE, (4, 4), "straight")])
+
+	def test_invalid_move(self):
+		for line in ("P 1 1 XX", "R 1 one 1", "X 1", "Q 1 1"):
+			with self.assertRaises(session.MoveLogError):
+				session.parse_move(line)
+
+
+class Test_GameServer(unittest.TestCase):
+
+	def setUp(self):
+		self.server = game_server.GameServer(idle_timeout=60)
+
+	def create(self):
+		response = self.server.handle_request({"op": "create", "level": "game_1.csv", "id": 1})
+		self.assertEqual((response["ok"], response["id"], response["rows"]), (True, 1, 6))
+		return response["session"]
+
+	def test_winning_game(self):
+		session_id = self.create()
+		for position, name, orientation in Test_PipeGame_check_win.WINNING_PATH:
+			response = self.server.handle_request(
+				{"op": "place", "session": session_id, "position": list(position), "pipe": name})
+			self.assertTrue(response["made"])
+			for _ in range(orientation):
+				response = self.server.handle_request(
+					{"op": "rotate", "session": session_id, "position": list(position)})
+		self.assertTrue(response["won"])
+		state = self.server.handle_request({"op": "state", "session": session_id})
+		self.assertEqual(state["board"][1][:2], ["S1", "CO2"])
+		self.assertTrue(state["won"])
+
+	def test_errors(self):
+		session_id = self.create()
+		self.server.handle_request({"op": "place", "session": session_id, "position": [0, 0], "pipe": "straight"})
+		for request in ({"op": "state", "session": "nope"}, {"op": "create", "level": "../game_1.csv"},
+						{"op": "create", "level": "no_such_level.csv"}, {"op": "dance", "session": session_id},
+						{"op": "place", "session": session_id, "position": "0,0"}, ["not", "an", "object"],
+						{"op": "place", "session": session_id, "position": [1, 1], "pipe": ["x"]},
+						{"op": "rotate", "session": session_id, "position": [0, 0], "direction": True}):
+			self.assertFalse(self.server.handle_request(request)["ok"])
+
+	def test_shared_template_and_eviction(self):
+		first = self.create()
+		second = self.create()
+		self.assertIs(self.server._sessions[first].game_file, self.server._sessions[second].game_file)
+		self.assertEqual(self.server.evict_idle(), 0)
+		self.assertEqual(self.server.evict_idle(now=time.monotonic() + 61), 2)
+		self.assertEqual(self.server.session_count(), 0)
+
+	def test_load_over_socket(self):
+		async def run():
+			started = asyncio.get_running_loop().create_future()
+			serving = asyncio.ensure_future(self.server.serve(port=0, started=started))
+			listening = await started
+			port = listening.sockets[0].getsockname()[1]
+			results = await game_server.run_load(clients=5, moves=20, port=port)
+			serving.cancel()
+			return results
+
+		self.assertEqual(asyncio.run(run())["moves"], 100)
+		self.assertEqual(self.server.session_count(), 0)
+
+
+@unittest.skipIf(batch_win is None, "needs NumPy")
+class Test_batch_win(unittest.TestCase):
+
+	def test_matches_check_win(self):
+		generator = level_generator.LevelGenerator(5, 7, difficulty=0.8)
+		games = []
+		with tempfile.TemporaryDirectory() as directory:
+			game_file = os.path.join(directory, "game_batch.csv")
+			for seed in range(60):
+				level = generator.generate(seed)
+				level_generator.write_level(game_file, level)
+				game = (PipeGame, PackedPipeGame, SparsePipeGame)[seed % 3](game_file)
+				game.apply_moves(level[2][:len(level[2]) * (seed % 4) // 3])
+				games.append(game)
+		wins = batch_win.check_games(games)
+		self.assertEqual(list(wins), [game.check_win() for game in games])
+		self.assertTrue(wins.any() and not wins.all())
+
+	def test_missing_end(self):
+		cells, starts, ends = batch_win.pack_games([PipeGame("game_1.csv")])
+		ends[0] = (-1, -1)
+		self.assertFalse(batch_win.check_wins(cells, starts, ends)[0])
+
+	def test_different_shapes(self):
+		with self.assertRaises(ValueError):
+			batch_win.pack_games([PipeGame("game_1.csv"), PipeGame("game_2.csv")])
+
+
+class FakeBoardView:
+	""" Stands in for the canvas of a BoardView, so the viewport can be tested without a display."""
+
+	def __init__(self, rows, columns, scroll=(0, 0)):
+		self._rows, self._columns = rows, columns
+		self._items, self._spare_items, self._drawn = {}, [], {}
+		self.scroll = scroll
+		self.created = 0
+		self.hidden = set()
+
+	def __getitem__(self, option):
+		return {"width": 12 * gui.CELL_SIZE, "height": 8 * gui.CELL_SIZE}[option]
+
+	def winfo_ismapped(self):
+		return False
+
+	def canvasx(self, x):
+		return self.scroll[0] + x
+
+	def canvasy(self, y):
+		return self.scroll[1] + y
+
+	def create_image(self, *center, anchor=None):
+		self.created += 1
+		return self.created
+
+	def coords(self, item, *center):
+		pass
+
+	def itemconfig(self, item, state=None):
+		if state == gui.tk.HIDDEN:
+			self.hidden.add(item)
+		else:
+			self.hidden.discard(item)
+
+	def tag_raise(self, tag):
+		pass
+
+	def _draw_tile(self, position):
+		self._drawn[position] = True
+
+
+@unittest.skipIf(gui is None, "needs Tk")
+class Test_gui_viewport(unittest.TestCase):
+
+	def test_visible_range(self):
+		self.assertEqual(gui.visible_range(0, 8 * gui.CELL_SIZE, 100), range(0, 11))
+		# Part of row 21 shows at the bottom of a view scrolled half a tile past row 10.
+		start = 10.5 * gui.CELL_SIZE
+		self.assertEqual(gui.visible_range(start, 8 * gui.CELL_SIZE, 100), range(8, 21))
+		self.assertEqual(gui.visible_range(start, 8 * gui.CELL_SIZE, 15), range(8, 15))
+		self.assertEqual(gui.visible_range(0, 8 * gui.CELL_SIZE, 6), range(0, 6))
+
+	def test_cell_at(self):
+		self.assertEqual(gui.cell_at(0, 0, 6, 6), (0, 0))
+		self.assertEqual(gui.cell_at(gui.CELL_SIZE, 2 * gui.CELL_SIZE - 1, 6, 6), (1, 1))
+		self.assertIsNone(gui.cell_at(6 * gui.CELL_SIZE, 0, 6, 6))
+		self.assertIsNone(gui.cell_at(-1, 0, 6, 6))
+
+	def test_update_viewport_reuses_items(self):
+		view = FakeBoardView(100, 100)
+		gui.BoardView.update_viewport(view)
+		self.assertEqual(set(view._items), {(row, col) for row in range(11) for col in range(15)})
+		created = view.created
+
+		view.scroll = (0, 4 * gui.CELL_SIZE)
+		gui.BoardView.update_viewport(view)
+		self.assertEqual(set(view._items), {(row, col) for row in range(2, 15) for col in range(15)})
+		# The two rows that scrolled out of view gave their items to two of the four new rows.
+		self.assertEqual(view.created, created + 2 * 15)
+		self.assertFalse(view.hidden)
+		self.assertEqual(set(view._drawn), set(view._items))
+
+		view.scroll = (0, 0)
+		gui.BoardView.update_viewport(view)
+		self.assertEqual(view.created, created + 2 * 15)
+		self.assertEqual(len(view._spare_items), 2 * 15)
+		self.assertEqual(set(view._spare_items), view.hidden)
+
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""
+Headless game sessions, move logs and replays.
+
+A GameSession plays a PipeGame by the same rules as the GUI and records every move it
+makes. Move logs are plain text, one move per line after a header naming the level:
+
+    # game_1.csv
+    P 1 1 CO      place a corner pipe at (1, 1)
+    R 1 1 1       rotate the pipe at (1, 1) a quarter turn clockwise (-1 for anticlockwise)
+    X 1 1         remove the pipe at (1, 1)
+
+replay plays a log back with no GUI, checking for a win after every move like the GUI
+does and timing each move.
+
+Usage:
+    python session.py moves.log --backend packed
+"""
+
+import argparse
+import array
+import sys
+import time
+
+from a2 import PIPE_CODES, PIPES, PackedPipeGame, Pipe, PipeGame, SparsePipeGame
+
+PLACE = "P"
+ROTATE = "R"
+REMOVE = "X"
+
+BACKENDS = {"list": PipeGame, "packed": PackedPipeGame, "sparse": SparsePipeGame}
+
+
+class MoveLogError(ValueError):
+    """ Raised when a move log can't be read or doesn't match its level."""
+
+
+class GameSession:
+    """
+    A game played without the GUI, recording every move made.
+
+    Moves follow the rules of the GUI: pipes can only be placed on empty selectable tiles
+    when there are some left to play, and only the player's pipes can be turned or
+    removed. Moves that break the rules, or are off the board, change nothing and aren't
+    recorded.
+    """
+
+    def __init__(self, game_file='game_1.csv', game_type=PipeGame, record=True, history_limit=None):
+        """ Constructor method for GameSession instances.
+
+                Parameters:
+                    game_file (str): Name of the game file.
+                    game_type (type): The PipeGame class (or subclass) to play with.
+                    record (bool): Whether to keep the moves made in moves.
+                    history_limit (int): The most moves the game can undo (None for no limit).
+        """
+        self.game_file = game_file
+        self.game = game_type(game_file, history_limit)
+        self.record = record
+        self.moves = []
+
+    def place(self, position, pipe_name):
+        """ Places a new pipe on an empty tile.
+
+                Parameters:
+                    position (tuple<int, int>): The (row, col) to place the pipe at.
+                    pipe_name (str): The type of pipe, one of the values of PIPES.
+
+                Returns:
+                    bool: Whether the pipe was placed.
+        """
+        tile = self._tile(position)
+        if (tile is None or tile.get_id() != "tile" or not tile.can_select()
+                or self.game.get_playable_pipes().get(pipe_name, 0) <= 0):
+            return False
+        self.game.set_pipe(Pipe(pipe_name), position)
+        if self.record:
+            self.moves.append((PLACE, position, pipe_name))
+        return True
+
+    def rotate(self, position, direction=1):
+        """ Rotates one of the player's pipes by 90 degrees.
+
+                Parameters:
+                    position (tuple<int, int>): The (row, col) of the pipe.
+                    direction (int): -ve, +ve or zero indicating counter-clockwise,
+                    clockwise rotation or no rotation respectively.
+
+                Returns:
+                    bool: Whether the pipe was rotated.
+        """
+        if not self._players_pipe(position) or direction == 0:
+            return False
+        self.game.rotate_pipe(position, direction)
+        if self.record:
+            self.moves.append((ROTATE, position, direction))
+        return True
+
+    def remove(self, position):
+        """ Removes one of the player's pipes, returning it to the playable pipes.
+
+                Parameters:
+                    position (tuple<int, int>): The (row, col) of the pipe.
+
+                Returns:
+                    bool: Whether the pipe was removed.
+        """
+        if not self._players_pipe(position):
+            return False
+        self.game.remove_pipe(position)
+        if self.record:
+            self.moves.append((REMOVE, position))
+        return True
+
+    def apply(self, move):
+        """ Makes a move in the format recorded in moves.
+
+                Parameters:
+                    move (tuple): (PLACE, position, pipe name), (ROTATE, position, direction)
+                    or (REMOVE, position).
+
+                Returns:
+                    bool: Whether the move was made.
+        """
+        if move[0] == PLACE:
+            return self.place(move[1], move[2])
+        elif move[0] == ROTATE:
+            return self.rotate(move[1], move[2])
+        elif move[0] == REMOVE:
+            return self.remove(move[1])
+        raise MoveLogError(f"unknown move {move!r}")
+
+    def _tile(self, position):
+        """ (Tile) The tile at position, or None if position isn't on the board."""
+        rows, cols = self.game.get_dimensions()
+        if 0 <= position[0] < rows and 0 <= position[1] < cols:
+            return self.game.get_pipe(position)
+        return None
+
+    def _players_pipe(self, position):
+        """ (bool) Whether the tile at position is a pipe the player placed."""
+        tile = self._tile(position)
+        return tile is not None and tile.get_id() == "pipe" and tile.can_select()
+
+    def save(self, log_file):
+        """ Writes the moves made so far to a move log.
+
+                Parameters:
+                    log_file (str): Name of the file to write.
+        """
+        with open(log_file, "w") as log:
+            log.write(f"# {self.game_file}\n")
+            for move in self.moves:
+                log.write(format_move(move) + "\n")
+
+
+def format_move(move):
+    """ (str) The line of a move log for a move."""
+    position = f"{move[1][0]} {move[1][1]}"
+    if move[0] == PLACE:
+        return f"{PLACE} {position} {PIPE_CODES[move[2]]}"
+    elif move[0] == ROTATE:
+        return f"{ROTATE} {position} {move[2]}"
+    return f"{REMOVE} {position}"
+
+
+def parse_move(line):
+    """ Converts a line of a move log into a move.
+
+            Parameters:
+                line (str): The line, without its newline.
+
+            Returns:
+                tuple: The move in the format of GameSession.apply.
+
+            Raises:
+                MoveLogError: If the line isn't a valid move.
+    """
+    fields = line.split()
+    try:
+        kind = fields[0]
+        position = (int(fields[1]), int(fields[2]))
+        if kind == PLACE and len(fields) == 4:
+            return (PLACE, position, PIPES[fields[3]])
+        elif kind == ROTATE and len(fields) == 4:
+            return (ROTATE, position, int(fields[3]))
+        elif kind == REMOVE and len(fields) == 3:
+            return (REMOVE, position)
+    except (IndexError, KeyError, ValueError):
+        pass
+    raise MoveLogError(f"invalid move {line!r}")
+
+
+def read_log(log_file):
+    """ Reads a move log. The moves are read as they are iterated over, so logs of
+        millions of moves aren't held in memory.
+
+            Parameters:
+                log_file (str): Name of the file to read.
+
+            Returns:
+                tuple<str, iterator<tuple>>: The name of the level and the moves.
+
+            Raises:
+                MoveLogError: If the log doesn't start with the level, or (while iterating)
+                has an invalid move.
+    """
+    with open(log_file) as log:
+        header = log.readline()
+    if not header.startswith("# "):
+        raise MoveLogError(f"{log_file} doesn't start with the name of its level")
+    return header[2:].rstrip("\n"), _read_moves(log_file)
+
+
+def _read_moves(log_file):
+    """ Yields the moves after the header of a move log."""
+    with open(log_file) as log:
+        log.readline()
+        for line in log:
+            if line.strip():
+                yield parse_move(line)
+
+
+class ReplayResult:
+    """
+    The outcome of replaying a move log.
+    """
+
+    def __init__(self, game, move_times):
+        """ Constructor method for ReplayResult instances.
+
+                Parameters:
+                    game (PipeGame obj): The game after the last move.
+                    move_times (array<int>): Nanoseconds each move took, including the
+                    check for a win after it.
+        """
+        self.game = game
+        self.move_times = move_times
+        self.won = game.check_win()
+
+    def summary(self):
+        """ Summarises the move timings.
+
+                Returns:
+                    dict: The number of moves, whether the game was won, total seconds,
+                    moves per second and the median, 99th percentile and slowest move in
+                    microseconds.
+        """
+        times = sorted(self.move_times)
+        total = sum(times) / 1e9
+        summary = {"moves": len(times), "won": self.won, "total_time": total,
+                   "moves_per_sec": len(times) / total if total else None}
+        if times:
+            summary["median_us"] = times[len(times) // 2] / 1000
+            summary["p99_us"] = times[min(len(times) - 1, len(times) * 99 // 100)] / 1000
+            summary["max_us"] = times[-1] / 1000
+        return summary
+
+
+def replay(game_file, moves, game_type=PipeGame):
+    """ Plays moves on a fresh game of a level, timing each one.
+
+            Parameters:
+                game_file (str): Name of the game file.
+                moves (iterable<tuple>): Moves in the format of GameSession.apply.
+                game_type (type): The PipeGame class (or subclass) to play with.
+
+            Returns:
+                ReplayResult obj: The final game and the time taken by each move.
+
+            Raises:
+                MoveLogError: If a move breaks the rules, so the log isn't from this level.
+    """
+    session = GameSession(game_file, game_type, record=False, history_limit=0)
+    game = session.game
+    move_times = array.array("q")
+    clock = time.perf_counter_ns
+
+    for move_number, move in enumerate(moves, 1):
+        start = clock()
+        made = session.apply(move)
+        game.check_win()
+        move_times.append(clock() - start)
+        if not made:
+            raise MoveLogError(f"move {move_number} ({format_move(move)}) can't be made on {game_file}")
+    return ReplayResult(game, move_times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a move log without the GUI.")
+    parser.add_argument("log", help="move log to replay")
+    parser.add_argument("--level", default=None, help="game file to replay on (default: the log's level)")
+    parser.add_argument("--backend", choices=BACKENDS, default="list",
+                        help="board representation to play with (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        game_file, moves = read_log(args.log)
+        result = replay(args.level or game_file, moves, BACKENDS[args.backend])
+    except (OSError, ValueError) as error:
+        print(f"{error.__class__.__name__}: {error}", file=sys.stderr)
+        return 1
+
+    for name, value in result.summary().items():
+        print(f"{name}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())